@@ -0,0 +1,121 @@
+# availability.py
+#
+# "Now available" tracking for approved friend requests. Each approved title is
+# watched until it shows up on Plex, then everyone who asked for it is told.
+# Detection reads incremental change feeds (Plex's recently-added list and the
+# Radarr/Sonarr import history) from a per-feed cursor, so each poll only looks
+# at what changed since the previous one instead of re-scanning libraries.
+# The feeds themselves live in bot.py; this module keeps the watch list and
+# the cursors in the shared state backend (see state.py), so with a SQLite
+# backend they survive restarts and only one replica notifies a requester.
+
+import logging
+import time
+from datetime import datetime
+
+import metrics
+import state
+
+logger = logging.getLogger(__name__)
+
+MAX_WATCH_DAYS = 30   # Requests that never show up are forgotten after this long
+
+WATCHES = 'availability_watches'   # "{media_type}_{tmdb_id}" -> watch
+CURSORS = 'availability_cursors'   # feed name -> last position seen in that feed
+
+
+def _key(media_type, tmdb_id):
+    return f"{media_type}_{tmdb_id}"
+
+
+def _entry(stored):
+    """A stored watch as handed out: chat_ids as a set, times as datetimes."""
+    return dict(stored, chat_ids=set(stored['chat_ids']), since=datetime.fromtimestamp(stored['since']),
+                imported_at=datetime.fromtimestamp(stored['imported_at']) if stored['imported_at'] else None)
+
+
+def _watches():
+    return state.get_backend().items(WATCHES)
+
+
+def watch(media_type, tmdb_id, title, year, chat_id):
+    """Starts (or joins) the watch for a title; chat_id is notified when it becomes available."""
+    def add(current):
+        entry = current or {'media_type': media_type, 'tmdb_id': tmdb_id, 'title': title, 'year': year,
+                            'chat_ids': [], 'since': time.time(), 'imported_at': None}
+        if chat_id not in entry['chat_ids']:
+            entry['chat_ids'].append(chat_id)
+        return entry
+    state.get_backend().update(WATCHES, _key(media_type, tmdb_id), add)
+    metrics.set_gauge("availability.watched", len(_watches()))
+    logger.info(f"Watching '{title}' ({media_type} {tmdb_id}) for chat {chat_id}.")
+
+
+def watched():
+    """Returns a snapshot of the current watches."""
+    return [_entry(stored) for stored in _watches().values()]
+
+
+def has_watches():
+    return bool(_watches())
+
+
+def get_cursor(feed):
+    return state.get_backend().get(CURSORS, feed)[0]
+
+
+def set_cursor(feed, value):
+    state.get_backend().update(CURSORS, feed, lambda current: value)
+
+
+def mark_imported(media_type, tmdb_id):
+    """Records that the Arr finished importing a watched title. Returns True if it was watched."""
+    def imported(current):
+        if current is not None:
+            current['imported_at'] = current['imported_at'] or time.time()
+        return current
+    if state.get_backend().update(WATCHES, _key(media_type, tmdb_id), imported) is None:
+        return False
+    metrics.increment("availability.imported")
+    return True
+
+
+def find(media_type, tmdb_id=None, normalized_title=None, year=None, normalize=None):
+    """Returns the key of the watch matching a feed item by TMDB id, or by normalized title (and year if known)."""
+    watches = _watches()
+    if tmdb_id is not None and _key(media_type, tmdb_id) in watches:
+        return (media_type, tmdb_id)
+    if normalized_title is None or normalize is None:
+        return None
+    for entry in watches.values():
+        if entry['media_type'] == media_type and normalize(entry['title']) == normalized_title \
+                and (not year or not entry['year'] or entry['year'] == year):
+            return (entry['media_type'], entry['tmdb_id'])
+    return None
+
+
+def resolve(key):
+    """Removes a watch once its title is available and returns it (None if already resolved, here or by another replica)."""
+    taken = [None]
+    def take(current):
+        taken[0] = current
+        return None
+    state.get_backend().update(WATCHES, _key(*key), take)
+    metrics.set_gauge("availability.watched", len(_watches()))
+    if taken[0] is None:
+        return None
+    metrics.increment("availability.notified")
+    return _entry(taken[0])
+
+
+def expire(max_age_days=MAX_WATCH_DAYS):
+    """Drops watches older than max_age_days. Returns how many were dropped."""
+    cutoff = time.time() - max_age_days * 86400
+    expired = [(entry['media_type'], entry['tmdb_id']) for entry in _watches().values() if entry['since'] < cutoff]
+    for media_type, tmdb_id in expired:
+        state.get_backend().update(WATCHES, _key(media_type, tmdb_id),
+                                   lambda current: current if current and current['since'] >= cutoff else None)
+        logger.info(f"Stopped watching {media_type} {tmdb_id}: not available after {max_age_days} days.")
+    if expired:
+        metrics.set_gauge("availability.watched", len(_watches()))
+    return len(expired)
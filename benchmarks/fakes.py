@@ -0,0 +1,117 @@
+# benchmarks/fakes.py
+#
+# Stand-ins for the Telegram side of the bot. FakeBot records every outbound
+# call instead of talking to Telegram, so handlers can be driven offline.
+
+import itertools
+import threading
+import time
+from types import SimpleNamespace
+
+
+class FakeMessage:
+    """The subset of telegram.Message the bot's code uses on returned messages."""
+
+    def __init__(self, bot, chat_id, message_id, text=None, caption=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text
+        self.caption = caption
+        self.chat = SimpleNamespace(id=chat_id)
+
+    def reply_text(self, text, **kwargs):
+        return self.bot.send_message(self.chat_id, text, **kwargs)
+
+    def edit_text(self, text, **kwargs):
+        return self.bot.edit_message_text(text, chat_id=self.chat_id, message_id=self.message_id, **kwargs)
+
+    def edit_caption(self, caption=None, **kwargs):
+        return self.bot.edit_message_caption(chat_id=self.chat_id, message_id=self.message_id, caption=caption, **kwargs)
+
+    def delete(self, **kwargs):
+        return self.bot.delete_message(self.chat_id, self.message_id)
+
+
+class FakeBot:
+    """Records outbound Bot API calls with timestamps instead of hitting Telegram."""
+
+    def __init__(self, bot_id=999999, username='searcharr_bench_bot', call_latency_ms=0.0):
+        self.id = bot_id
+        self.username = username
+        self.first_name = 'Bench'
+        self.defaults = None
+        self.call_latency_ms = call_latency_ms
+        self.calls = []
+        self._lock = threading.Lock()
+        self._message_ids = itertools.count(1)
+
+    @property
+    def bot(self):
+        return SimpleNamespace(id=self.id, username=self.username, first_name=self.first_name)
+
+    def _record(self, method, chat_id=None, **kwargs):
+        if self.call_latency_ms:
+            time.sleep(self.call_latency_ms / 1000.0)
+        with self._lock:
+            self.calls.append((time.perf_counter(), method, chat_id))
+            message_id = next(self._message_ids)
+        return FakeMessage(self, chat_id, message_id, text=kwargs.get('text'), caption=kwargs.get('caption'))
+
+    def reset(self):
+        with self._lock:
+            self.calls = []
+
+    def call_count(self):
+        with self._lock:
+            return len(self.calls)
+
+    def send_message(self, chat_id, text, **kwargs):
+        return self._record('send_message', chat_id, text=text)
+
+    def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        return self._record('send_photo', chat_id, caption=caption)
+
+    def send_document(self, chat_id, document, caption=None, **kwargs):
+        return self._record('send_document', chat_id, caption=caption)
+
+    def edit_message_text(self, text, chat_id=None, message_id=None, **kwargs):
+        return self._record('edit_message_text', chat_id, text=text)
+
+    def edit_message_caption(self, chat_id=None, message_id=None, caption=None, **kwargs):
+        return self._record('edit_message_caption', chat_id, caption=caption)
+
+    def edit_message_media(self, chat_id=None, message_id=None, media=None, **kwargs):
+        return self._record('edit_message_media', chat_id)
+
+    def delete_message(self, chat_id, message_id, **kwargs):
+        self._record('delete_message', chat_id)
+        return True
+
+    def answer_callback_query(self, callback_query_id, **kwargs):
+        self._record('answer_callback_query')
+        return True
+
+    def answer_inline_query(self, inline_query_id, results, **kwargs):
+        self._record('answer_inline_query')
+        return True
+
+    def get_me(self, **kwargs):
+        return self.bot
+
+
+def fake_context(bot, config, args=None, user_data=None):
+    """Builds the attributes of a CallbackContext the bot's functions read."""
+    return SimpleNamespace(bot=bot, bot_data={'config': config}, user_data=user_data if user_data is not None else {},
+                           chat_data={}, args=args or [])
+
+
+def fake_update(bot, user_id, chat_id=None, first_name='Bench'):
+    """Builds a minimal Update carrying a user, a chat and an incoming message."""
+    chat_id = chat_id or user_id
+    return SimpleNamespace(
+        effective_user=SimpleNamespace(id=user_id, first_name=first_name),
+        effective_chat=SimpleNamespace(id=chat_id),
+        message=FakeMessage(bot, chat_id, 0),
+        callback_query=None,
+    )
@@ -0,0 +1,79 @@
+# benchmarks/harness.py
+#
+# Shared plumbing for the benchmark tools: argument parsing for the stub
+# cluster, importing the bot against the stubs, and latency statistics.
+
+import importlib
+import logging
+import math
+import os
+import sys
+import tempfile
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+from stub_servers import StubCluster
+
+
+def add_cluster_arguments(parser):
+    """Adds the stub-cluster options shared by every benchmark tool."""
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Injected latency for every backend (ms).")
+    parser.add_argument('--backend-latency', action='append', default=[], metavar='NAME=MS',
+                        help="Per-backend latency override, e.g. tmdb=80. Repeatable.")
+    parser.add_argument('--backend-error', action='append', default=[], metavar='NAME=RATE',
+                        help="Make a backend answer HTTP 503 for this share of requests, e.g. radarr=1.0. Repeatable.")
+    parser.add_argument('--jitter-ms', type=float, default=0.0, help="Uniform random jitter added to each response (ms).")
+    parser.add_argument('--plex-size', type=int, default=500, help="Number of titles in the stub Plex library.")
+    parser.add_argument('--radarr-size', type=int, default=2000, help="Number of movies in the stub Radarr library.")
+    parser.add_argument('--sonarr-size', type=int, default=500, help="Number of series in the stub Sonarr library.")
+    parser.add_argument('--overseerr-size', type=int, default=200, help="Number of requests in the stub Overseerr.")
+
+
+def start_cluster(args):
+    latency = {name: args.latency_ms for name in ('tmdb', 'plex', 'radarr', 'sonarr', 'overseerr')}
+    for override in args.backend_latency:
+        name, _, value = override.partition('=')
+        latency[name.strip().lower()] = float(value)
+    error_rates = {}
+    for override in args.backend_error:
+        name, _, value = override.partition('=')
+        error_rates[name.strip().lower()] = float(value)
+    return StubCluster(latency_ms=latency, jitter_ms=args.jitter_ms, plex_size=args.plex_size,
+                       radarr_size=args.radarr_size, sonarr_size=args.sonarr_size,
+                       overseerr_size=args.overseerr_size, error_rates=error_rates).start()
+
+
+def load_bot(cluster, admin_user_id=1):
+    """Imports bot.py pointed at the stub cluster, inside a throwaway working directory."""
+    os.environ['TMDB_API_URL'] = cluster.tmdb_api_url
+    os.chdir(tempfile.mkdtemp(prefix='searcharr-bench-'))
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    bot = importlib.import_module('bot')
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot.CONFIG.clear()
+    bot.CONFIG.update(cluster.bot_config(admin_user_id=admin_user_id))
+    bot.friend_requests.initialize_request_module(bot._search_tmdb, bot.check_plex_library, bot.get_text)
+    return bot
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, wall_seconds):
+    """Returns p50/p95/p99/mean latency in milliseconds and throughput in ops/s."""
+    values = sorted(latencies)
+    count = len(values)
+    return {
+        'count': count,
+        'p50_ms': percentile(values, 50) * 1000,
+        'p95_ms': percentile(values, 95) * 1000,
+        'p99_ms': percentile(values, 99) * 1000,
+        'mean_ms': (sum(values) / count * 1000) if count else 0.0,
+        'throughput_ops': (count / wall_seconds) if wall_seconds > 0 else 0.0,
+    }
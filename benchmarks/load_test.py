@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Concurrent-user load generator. Builds the real dispatcher through
+# bot.register_handlers() (the same wiring main() uses), swaps Telegram for a
+# FakeBot that records outbound calls, and pushes synthetic Updates for
+# commands and nav_/add_/check_/approve_ callbacks from N simulated users.
+# Backends are served by the local stub servers.
+#
+# Usage:
+#   python benchmarks/load_test.py --users 1,2,4,8,16 --duration 15 --think-ms 300 --latency-ms 20
+
+import argparse
+import itertools
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from queue import Queue
+
+from telegram import Update, Message, Chat, User, MessageEntity, CallbackQuery
+
+from fakes import FakeBot
+from harness import REPO_ROOT, add_cluster_arguments, start_cluster, load_bot, summarize
+from stub_servers import _stable_id
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+from update_scheduler import SchedulingDispatcher, UpdateScheduler
+
+ADMIN_ID = 1
+TITLES = ['dune', 'alien', 'heat', 'arrival', 'the thing', 'parasite', 'blade runner', 'memento', 'jaws', 'up']
+
+
+class InstrumentedDispatcher(SchedulingDispatcher):
+    """Dispatcher that reports when each update was picked up and finished."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tracker = None
+
+    def handle_update(self, update):
+        picked = time.perf_counter()
+        try:
+            super().handle_update(update)
+        finally:
+            if self.tracker and isinstance(update, Update):
+                self.tracker.finish(update.update_id, picked, time.perf_counter())
+
+
+class UpdateTracker:
+    """Tracks enqueue/pickup/finish times of synthetic updates and wakes waiting users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self.samples = defaultdict(list)
+        self.queue_waits = []
+        self.errors = 0
+
+    def start(self, update_id, kind):
+        event = threading.Event()
+        with self._lock:
+            self._pending[update_id] = (kind, time.perf_counter(), event)
+        return event
+
+    def finish(self, update_id, picked, finished):
+        with self._lock:
+            entry = self._pending.pop(update_id, None)
+            if not entry:
+                return
+            kind, enqueued, event = entry
+            self.samples[kind].append(finished - enqueued)
+            self.queue_waits.append(picked - enqueued)
+        event.set()
+
+    def error(self, update, context):
+        with self._lock:
+            self.errors += 1
+
+    def reset(self):
+        with self._lock:
+            self.samples = defaultdict(list)
+            self.queue_waits = []
+            self.errors = 0
+
+
+class LoadGenerator:
+    """Owns the dispatcher and turns simulated user actions into Updates."""
+
+    def __init__(self, bot_module, fake_bot, workers, handler_threads):
+        self.bot_module = bot_module
+        self.fake_bot = fake_bot
+        self.tracker = UpdateTracker()
+        scheduler = UpdateScheduler({'handler_threads': handler_threads}, priority_for_update=bot_module._update_priority)
+        self.dispatcher = InstrumentedDispatcher(fake_bot, Queue(), workers=workers, use_context=True, scheduler=scheduler.start())
+        self.dispatcher.tracker = self.tracker
+        bot_module.register_handlers(self.dispatcher)
+        self.dispatcher.add_error_handler(self.tracker.error)
+        self._update_ids = itertools.count(1)
+        self._thread = None
+        self.approvals = Queue()
+
+    def start(self):
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self.dispatcher.start, kwargs={'ready': ready}, name='dispatcher', daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def stop(self):
+        self.dispatcher.stop()
+        self._thread.join(timeout=5)
+
+    def login(self, user_id, role):
+        self.dispatcher.user_data[user_id]['role'] = role
+
+    def _submit(self, kind, update, timeout):
+        event = self.tracker.start(update.update_id, kind)
+        self.dispatcher.update_queue.put(update)
+        return event.wait(timeout)
+
+    def command(self, user, text, timeout=30):
+        update_id = next(self._update_ids)
+        command = text.split()[0]
+        message = Message(update_id, datetime.now(), Chat(user.id, Chat.PRIVATE), from_user=user, text=text,
+                          entities=[MessageEntity(MessageEntity.BOT_COMMAND, 0, len(command))], bot=self.fake_bot)
+        return self._submit(command, Update(update_id, message=message), timeout)
+
+    def callback(self, user, data, caption="*Synthetic Title (2020)*", timeout=30):
+        update_id = next(self._update_ids)
+        bot_user = User(self.fake_bot.id, self.fake_bot.first_name, True)
+        card = Message(update_id, datetime.now(), Chat(user.id, Chat.PRIVATE), from_user=bot_user,
+                       caption=caption, bot=self.fake_bot)
+        query = CallbackQuery(str(update_id), user, str(user.id), message=card, data=data, bot=self.fake_bot)
+        kind = data.split('_')[0] + '_'
+        return self._submit(kind, Update(update_id, callback_query=query), timeout)
+
+    def search_results(self, user_id):
+        return self.dispatcher.user_data[user_id].get('search_results', [])
+
+
+def admin_session(gen, user, think):
+    """Admin: search, page through cards, add one; then work the approval queue."""
+    title = random.choice(TITLES)
+    gen.command(user, f"/movie {title} {random.randint(1, 10 ** 6)}")
+    think()
+    for data in random.sample(['nav_next', 'nav_next', 'nav_prev'], k=random.randint(1, 3)):
+        gen.callback(user, data)
+        think()
+    results = gen.search_results(user.id)
+    if results:
+        index = gen.dispatcher.user_data[user.id].get('search_index', 0)
+        gen.callback(user, f"add_movie_std_{results[index]['id']}")
+        think()
+    while not gen.approvals.empty():
+        gen.callback(user, gen.approvals.get(), caption="📩 New Media Request")
+        think()
+
+
+def friend_session(gen, user, think):
+    """Friend: /check with paging and a status check, then a /friendrequest."""
+    title = random.choice(TITLES)
+    query = f"{title} {random.randint(1, 10 ** 6)}"
+    gen.command(user, f"/check movie {query}")
+    think()
+    gen.callback(user, 'nav_next')
+    think()
+    results = gen.search_results(user.id)
+    if results:
+        index = gen.dispatcher.user_data[user.id].get('search_index', 0)
+        gen.callback(user, f"check_movie_{results[index]['id']}")
+        think()
+    gen.command(user, f"/friendrequest movie {query}")
+    # The stub TMDB search is deterministic, so the request's tmdb id is known up front
+    gen.approvals.put(f"approve_std_movie_{_stable_id(f'movie:{query}:0')}_{user.id}")
+    think()
+
+
+def run_step(gen, user_count, duration, think_ms, admin_ratio):
+    gen.tracker.reset()
+    gen.fake_bot.reset()
+    stop = threading.Event()
+
+    def think():
+        if think_ms > 0:
+            stop.wait(random.expovariate(1000.0 / think_ms))
+
+    def user_loop(index):
+        is_admin = index < max(1, round(user_count * admin_ratio))
+        user_id = ADMIN_ID if index == 0 else 10000 + index
+        user = User(user_id, f"user{index}", False)
+        gen.login(user_id, 'admin' if is_admin else 'friend')
+        session = admin_session if is_admin else friend_session
+        while not stop.is_set():
+            session(gen, user, think)
+
+    threads = [threading.Thread(target=user_loop, args=(i,), daemon=True) for i in range(user_count)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    stop.wait(duration)
+    stop.set()
+    for t in threads:
+        t.join(timeout=60)
+    wall = time.perf_counter() - start
+
+    all_samples = [s for samples in gen.tracker.samples.values() for s in samples]
+    overall = summarize(all_samples, wall)
+    waits = sorted(gen.tracker.queue_waits)
+    overall['queue_wait_p95_ms'] = (waits[int(len(waits) * 0.95) - 1] * 1000) if waits else 0.0
+    overall['outbound_calls_per_s'] = gen.fake_bot.call_count() / wall
+    overall['errors'] = gen.tracker.errors
+    overall['by_kind'] = {kind: summarize(samples, wall) for kind, samples in gen.tracker.samples.items()}
+    return overall
+
+
+def find_saturation(steps, min_gain=0.10, latency_growth=2.0):
+    """Returns the first user count where throughput stops scaling while p95 latency balloons."""
+    for previous, current in zip(steps, steps[1:]):
+        prev_stats, cur_stats = previous[1], current[1]
+        if not prev_stats['throughput_ops']:
+            continue
+        gain = cur_stats['throughput_ops'] / prev_stats['throughput_ops'] - 1
+        growth = cur_stats['p95_ms'] / prev_stats['p95_ms'] if prev_stats['p95_ms'] else 0
+        if gain < min_gain and growth >= latency_growth:
+            return previous
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent-user load test against the bot's dispatcher.")
+    add_cluster_arguments(parser)
+    parser.add_argument('--users', default='1,2,4,8,16', help="Comma-separated simulated user counts to ramp through.")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds to run each ramp step.")
+    parser.add_argument('--think-ms', type=float, default=300.0, help="Mean user think time between actions (ms).")
+    parser.add_argument('--admin-ratio', type=float, default=0.2, help="Share of simulated users logged in as admin.")
+    parser.add_argument('--workers', type=int, default=4, help="Dispatcher worker threads (run_async pool).")
+    parser.add_argument('--handler-threads', type=int, default=4, help="Update handler threads of the inbound scheduler.")
+    parser.add_argument('--telegram-latency-ms', type=float, default=0.0, help="Simulated latency of each outbound Bot API call.")
+    parser.add_argument('--verbose', action='store_true', help="Print per-update-kind latencies for each step.")
+    args = parser.parse_args()
+
+    cluster = start_cluster(args)
+    try:
+        bot_module = load_bot(cluster, admin_user_id=ADMIN_ID)
+        bot_module.friend_requests.MAX_REQUESTS_PER_DAY = 10 ** 9
+        gen = LoadGenerator(bot_module, FakeBot(call_latency_ms=args.telegram_latency_ms), args.workers, args.handler_threads)
+        gen.start()
+
+        steps = []
+        print(f"{'users':>6}{'updates':>9}{'upd/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'wait p95':>10}{'tg calls/s':>12}{'errors':>8}")
+        for user_count in [int(u) for u in args.users.split(',') if u.strip()]:
+            stats = run_step(gen, user_count, args.duration, args.think_ms, args.admin_ratio)
+            steps.append((user_count, stats))
+            print(f"{user_count:>6}{stats['count']:>9}{stats['throughput_ops']:>9.1f}{stats['p50_ms']:>9.1f}"
+                  f"{stats['p95_ms']:>9.1f}{stats['p99_ms']:>9.1f}{stats['queue_wait_p95_ms']:>10.1f}"
+                  f"{stats['outbound_calls_per_s']:>12.1f}{stats['errors']:>8}")
+            if args.verbose:
+                for kind, kind_stats in sorted(stats['by_kind'].items()):
+                    print(f"{'':>6}  {kind:<16}n={kind_stats['count']:<6}p50={kind_stats['p50_ms']:.1f}ms  p95={kind_stats['p95_ms']:.1f}ms")
+        gen.stop()
+    finally:
+        cluster.stop()
+
+    saturation = find_saturation(steps)
+    if saturation:
+        users, stats = saturation
+        print(f"\nSaturation point: ~{users} concurrent users ({stats['throughput_ops']:.1f} updates/s, p95 {stats['p95_ms']:.1f}ms).")
+    else:
+        print("\nNo saturation point found in the tested range; try more users or a shorter think time.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
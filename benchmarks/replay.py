@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Offline reproduction of a slow flow. Loads the bot with a given config.json,
+# answers every backend request from a cassette recorded in production (see
+# cassette.py, "cassette": {"mode": "record"}) with the recorded or scaled
+# latencies, and runs one command as the admin through a FakeBot. Prints the
+# time each run took and, with --profile, the top functions of a cProfile.
+# Requests are matched by URL, so use the config.json the recording was made
+# with (and the same TMDB_API_URL, if it was overridden).
+#
+# Usage:
+#   python benchmarks/replay.py --cassette cassette.json.gz --config config/config.json --command "/movie dune"
+#   python benchmarks/replay.py ... --latency-scale 0 --runs 5 --profile 25
+
+import argparse
+import cProfile
+import importlib
+import json
+import logging
+import os
+import pstats
+import sys
+import tempfile
+import time
+
+from fakes import FakeBot, fake_context, fake_update
+from harness import REPO_ROOT
+
+ADMIN_ID = 1
+
+
+def load_bot(config_path):
+    """Imports bot.py with the given configuration, inside a throwaway working directory."""
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    os.chdir(tempfile.mkdtemp(prefix='searcharr-replay-'))
+    if REPO_ROOT not in sys.path:
+        sys.path.insert(0, REPO_ROOT)
+    bot = importlib.import_module('bot')
+    logging.getLogger().setLevel(logging.CRITICAL)
+    bot.CONFIG.clear()
+    bot.CONFIG.update(config, admin_user_id=ADMIN_ID)
+    bot.friend_requests.initialize_request_module(bot._search_tmdb, bot.check_plex_library, bot.get_text)
+    return bot
+
+
+def command_handler(bot, name):
+    handlers = {
+        'movie': lambda u, c: bot.search_cmd(u, c, 'movie'),
+        'show': lambda u, c: bot.search_cmd(u, c, 'show'),
+        'movie4k': lambda u, c: bot.search_cmd(u, c, 'movie', is_4k=True),
+        'show4k': lambda u, c: bot.search_cmd(u, c, 'show', is_4k=True),
+        'check': bot.check_cmd,
+        'debug': bot.debug_cmd,
+    }
+    if name not in handlers:
+        raise SystemExit(f"Unsupported command /{name}; use one of {', '.join('/' + n for n in handlers)}.")
+    return handlers[name]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replays a command against recorded backend traffic.")
+    parser.add_argument('--cassette', required=True, help="Cassette file recorded by the bot.")
+    parser.add_argument('--config', required=True, help="config.json the recording was made with (its URLs identify the backends).")
+    parser.add_argument('--command', required=True, help='Command to run as the admin, e.g. "/movie dune".')
+    parser.add_argument('--latency-scale', type=float, default=1.0, help="Multiplier for the recorded latencies (0 = none).")
+    parser.add_argument('--runs', type=int, default=1, help="How many times to run the command (later runs hit the caches).")
+    parser.add_argument('--profile', type=int, default=0, metavar='N', help="Profile the first run and print its top N functions.")
+    args = parser.parse_args()
+
+    cassette_path, config_path = os.path.abspath(args.cassette), os.path.abspath(args.config)
+    bot = load_bot(config_path)
+    bot.cassette.configure(bot._http, {'mode': 'replay', 'path': cassette_path, 'latency_scale': args.latency_scale},
+                           secrets=bot._config_secrets(bot.CONFIG))
+    name, *command_args = args.command.lstrip('/').split()
+    handler = command_handler(bot, name)
+    fake_bot = FakeBot()
+
+    for run in range(args.runs):
+        update = fake_update(fake_bot, ADMIN_ID)
+        context = fake_context(fake_bot, bot.CONFIG, args=command_args, user_data={'role': 'admin'})
+        profiler = cProfile.Profile() if args.profile and run == 0 else None
+        fake_bot.reset()
+        started = time.perf_counter()
+        if profiler:
+            profiler.runcall(handler, update, context)
+        else:
+            handler(update, context)
+        elapsed = time.perf_counter() - started
+        print(f"run {run + 1}: {elapsed * 1000:.1f} ms, {fake_bot.call_count()} Telegram calls, "
+              f"{bot.metrics.get_counter('cassette.hit')} replayed / {bot.metrics.get_counter('cassette.miss')} missing responses so far")
+        if profiler:
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(args.profile)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Offline benchmark suite. Starts local stub servers for TMDB, Plex, Radarr,
+# Sonarr and Overseerr, points the bot at them and drives the hot paths,
+# reporting p50/p95/p99 latency and throughput per scenario.
+#
+# Usage:
+#   python benchmarks/run_benchmarks.py --iterations 100 --latency-ms 20
+#   python benchmarks/run_benchmarks.py --output current.json --baseline baseline.json
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fakes import FakeBot, fake_context, fake_update
+from harness import add_cluster_arguments, start_cluster, load_bot, summarize
+from stub_servers import PLEX_TITLE_PREFIX, FRESH_TMDB_BASE
+
+ADMIN_ID = 1
+_fresh_ids = itertools.count(FRESH_TMDB_BASE + 950000)
+_friend_ids = itertools.count(5000000)
+
+
+def _fresh_media(media_type):
+    tmdb_id = next(_fresh_ids)
+    return {'title': f"Fresh Title {tmdb_id}", 'year': 2024, 'tmdb_id': tmdb_id, 'media_type': media_type}
+
+
+def build_scenarios(bot, fake_bot):
+    """Returns {name: callable(i)} for every benchmarked entry point."""
+
+    def full_check_add_movie(i):
+        context = fake_context(fake_bot, bot.CONFIG)
+        bot.perform_full_check_and_act(context, _fresh_media('movie'), ADMIN_ID, ADMIN_ID)
+
+    def full_check_plex_hit(i):
+        n = i % 50
+        media_info = {'title': f"{PLEX_TITLE_PREFIX} {n}", 'year': 2000 + n % 25, 'tmdb_id': n, 'media_type': 'movie'}
+        bot.perform_full_check_and_act(fake_context(fake_bot, bot.CONFIG), media_info, ADMIN_ID, ADMIN_ID)
+
+    def full_check_friend_show(i):
+        context = fake_context(fake_bot, bot.CONFIG)
+        bot.perform_full_check_and_act(context, _fresh_media('show'), 42, 42)
+
+    def simplified_check_movie(i):
+        bot.perform_simplified_check(fake_context(fake_bot, bot.CONFIG), _fresh_media('movie'), ADMIN_ID)
+
+    def simplified_check_show(i):
+        bot.perform_simplified_check(fake_context(fake_bot, bot.CONFIG), _fresh_media('show'), ADMIN_ID)
+
+    def add_to_radarr(i):
+        bot.add_to_arr_service(_fresh_media('movie'), 'radarr')
+
+    def add_to_sonarr(i):
+        bot.add_to_arr_service(_fresh_media('show'), 'sonarr')
+
+    def friend_request(i):
+        friend_id = next(_friend_ids)
+        update = fake_update(fake_bot, friend_id)
+        context = fake_context(fake_bot, bot.CONFIG, args=['movie', f"bench query {i}"])
+        bot.friend_requests.handle_friend_request(update, context)
+
+    return {
+        'full_check_add_movie': full_check_add_movie,
+        'full_check_plex_hit': full_check_plex_hit,
+        'full_check_friend_show': full_check_friend_show,
+        'simplified_check_movie': simplified_check_movie,
+        'simplified_check_show': simplified_check_show,
+        'add_to_radarr': add_to_radarr,
+        'add_to_sonarr': add_to_sonarr,
+        'friend_request': friend_request,
+    }
+
+
+def run_scenario(func, iterations, concurrency, warmup):
+    for i in range(warmup):
+        func(i)
+
+    def timed(i):
+        start = time.perf_counter()
+        func(i)
+        return time.perf_counter() - start
+
+    wall_start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed, range(iterations)))
+    else:
+        latencies = [timed(i) for i in range(iterations)]
+    return summarize(latencies, time.perf_counter() - wall_start)
+
+
+def compare_to_baseline(results, baseline, max_regression):
+    """Returns a list of human-readable regressions on p95 latency."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base or not base.get('p95_ms'):
+            continue
+        ratio = stats['p95_ms'] / base['p95_ms']
+        if ratio > 1 + max_regression:
+            regressions.append(f"{name}: p95 {base['p95_ms']:.1f}ms -> {stats['p95_ms']:.1f}ms (+{(ratio - 1) * 100:.0f}%)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for Searcharr Plus.")
+    add_cluster_arguments(parser)
+    parser.add_argument('--iterations', type=int, default=50, help="Measured operations per scenario.")
+    parser.add_argument('--warmup', type=int, default=3, help="Unmeasured operations run before each scenario.")
+    parser.add_argument('--concurrency', type=int, default=1, help="Worker threads driving each scenario.")
+    parser.add_argument('--scenario', action='append', default=[], help="Only run the named scenario. Repeatable.")
+    parser.add_argument('--output', help="Write results as JSON to this file.")
+    parser.add_argument('--baseline', help="JSON results to compare against; exits non-zero on regression.")
+    parser.add_argument('--max-regression', type=float, default=0.20, help="Allowed p95 slowdown vs. baseline (0.20 = 20%%).")
+    args = parser.parse_args()
+    # load_bot() switches to a scratch working directory, so pin file paths first
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    cluster = start_cluster(args)
+    try:
+        bot = load_bot(cluster, admin_user_id=ADMIN_ID)
+        fake_bot = FakeBot()
+        scenarios = build_scenarios(bot, fake_bot)
+        selected = args.scenario or list(scenarios)
+
+        results = {}
+        print(f"{'scenario':<26}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'ops/s':>10}{'backend calls':>16}")
+        for name in selected:
+            bot.state.configure()  # fresh in-memory state: no request limits carried over
+            before = sum(cluster.request_counts().values())
+            stats = run_scenario(scenarios[name], args.iterations, args.concurrency, args.warmup)
+            stats['backend_calls'] = sum(cluster.request_counts().values()) - before
+            results[name] = stats
+            print(f"{name:<26}{stats['count']:>6}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}"
+                  f"{stats['p99_ms']:>10.1f}{stats['throughput_ops']:>10.1f}{stats['backend_calls']:>16}")
+    finally:
+        cluster.stop()
+
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=4)
+
+    if baseline:
+        with open(baseline, 'r', encoding='utf-8') as f:
+            regressions = compare_to_baseline(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\nPerformance regressions detected:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
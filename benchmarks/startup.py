@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# Startup cost of the bot: time to import bot.py, time until the dispatcher
+# has every handler registered (what main() does before polling), and the
+# resident memory at that point. Each run uses a fresh interpreter.
+#
+# Usage:
+#   python benchmarks/startup.py --runs 10
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from harness import REPO_ROOT
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+
+CHILD = r'''
+import json, time
+started = time.perf_counter()
+import bot
+imported = time.perf_counter()
+
+from queue import Queue
+from telegram.ext import Dispatcher
+from fakes import FakeBot
+bot.CONFIG = bot.load_config()
+dispatcher = Dispatcher(FakeBot(), Queue(), use_context=True)
+bot.register_handlers(dispatcher)
+bot.get_text('start_message', bot.CONFIG.get('language'))
+ready = time.perf_counter()
+
+rss_kb = 0
+with open('/proc/self/status') as f:
+    for line in f:
+        if line.startswith('VmRSS:'):
+            rss_kb = int(line.split()[1])
+heavy = [name for name in ('plexapi', 'plexapi.server') if name in __import__('sys').modules]
+print(json.dumps({'import_ms': (imported - started) * 1000, 'ready_ms': (ready - started) * 1000,
+                  'rss_mb': rss_kb / 1024, 'eager_heavy_modules': heavy}))
+'''
+
+
+def measure_once():
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([REPO_ROOT, BENCH_DIR]), PYTHONWARNINGS='ignore')
+    result = subprocess.run([sys.executable, '-c', CHILD], cwd=tempfile.mkdtemp(prefix='searcharr-startup-'),
+                            env=env, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bot startup time and resident memory.")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to average over.")
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    for key, label in (('import_ms', 'import bot.py'), ('ready_ms', 'handlers ready'), ('rss_mb', 'resident memory')):
+        values = [s[key] for s in samples]
+        unit = 'MB' if key == 'rss_mb' else 'ms'
+        print(f"{label:<18} median {statistics.median(values):8.1f} {unit}   min {min(values):8.1f} {unit}   max {max(values):8.1f} {unit}")
+    print(f"heavy modules loaded at startup: {', '.join(samples[-1]['eager_heavy_modules']) or 'none'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,378 @@
+# benchmarks/stub_servers.py
+#
+# Local stand-in HTTP servers for every backend the bot talks to (TMDB, Plex,
+# Radarr, Sonarr and Overseerr). They speak just enough of each API for the
+# bot's code paths to run end to end, with configurable library sizes and
+# latency injection, so benchmarks never touch the network.
+
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+from xml.sax.saxutils import quoteattr
+
+PLEX_TITLE_PREFIX = "Library Movie"
+RADARR_TMDB_BASE = 100000
+SONARR_TMDB_BASE = 200000
+OVERSEERR_TMDB_BASE = 300000
+PLEX_TMDB_BASE = 400000
+# TMDB ids at or above this value are never present in any stub library
+FRESH_TMDB_BASE = 1000000
+
+
+def _stable_id(text):
+    return zlib.crc32(text.encode('utf-8')) % 900000 + FRESH_TMDB_BASE
+
+
+class StubServer:
+    """A tiny threaded HTTP server answering a list of (method, regex, handler) routes."""
+
+    def __init__(self, name, routes, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0):
+        self.name = name
+        self.routes = [(method, re.compile(pattern), func) for method, pattern, func in routes]
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _delay(self):
+        delay = self.latency_ms + (random.uniform(0, self.jitter_ms) if self.jitter_ms else 0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+    def _dispatch(self, method, raw_path, body):
+        with self._count_lock:
+            self.request_count += 1
+        self._delay()
+        if self.error_rate and random.random() < self.error_rate:
+            return 503, 'application/json', b'{"message": "stub injected failure"}'
+        parsed = urlparse(raw_path)
+        query = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        for route_method, pattern, func in self.routes:
+            if route_method != method:
+                continue
+            match = pattern.fullmatch(parsed.path)
+            if match:
+                return func(match, query, body)
+        return 404, 'application/json', b'{"status_message": "not found"}'
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def _respond(self, method):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                body = json.loads(raw) if raw else None
+                status, content_type, payload = stub._dispatch(method, self.path, body)
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self._respond('GET')
+
+            def do_POST(self):
+                self._respond('POST')
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f"stub-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _json(data, status=200):
+    return status, 'application/json', json.dumps(data).encode('utf-8')
+
+
+# --- TMDB ---
+
+def _tmdb_routes():
+    def results_for(media_type, text, count=20):
+        results = []
+        for i in range(count):
+            title = text.title() if i == 0 else f"{text.title()} {i + 1}"
+            item = {
+                'id': _stable_id(f"{media_type}:{text}:{i}"),
+                'overview': f"Synthetic overview for {title}.",
+                'poster_path': f"/stub{i}.jpg",
+                'popularity': 100.0 - i,
+            }
+            if media_type == 'movie':
+                item.update({'title': title, 'release_date': f"{2000 + i}-01-01"})
+            else:
+                item.update({'name': title, 'first_air_date': f"{2000 + i}-01-01"})
+            results.append(item)
+        return results
+
+    def search(match, query, body):
+        results = results_for(match.group(1), query.get('query', ''))
+        return _json({'page': 1, 'results': results, 'total_results': len(results), 'total_pages': 1})
+
+    def search_multi(match, query, body):
+        text = query.get('query', '')
+        results = [dict(item, media_type=media_type) for media_type in ('movie', 'tv') for item in results_for(media_type, text, 10)]
+        results.sort(key=lambda item: -item['popularity'])
+        return _json({'page': 1, 'results': results, 'total_results': len(results), 'total_pages': 1})
+
+    def title_list(match, query, body):
+        media_type, name = (match.group(1), match.group(2)) if match.lastindex == 2 else (match.group(1), 'trending')
+        results = results_for(media_type, name.replace('_', ' '))
+        return _json({'page': 1, 'results': results, 'total_results': len(results), 'total_pages': 1})
+
+    def providers_of(tmdb_id):
+        providers = [{'provider_name': 'Stub Stream'}, {'provider_name': 'Other Stream'}]
+        return {'id': tmdb_id, 'results': {'BR': {'flatrate': providers}, 'US': {'flatrate': providers}}}
+
+    def external_ids_of(tmdb_id):
+        return {'id': tmdb_id, 'tvdb_id': tmdb_id + 7, 'imdb_id': f"tt{tmdb_id}"}
+
+    def details(match, query, body):
+        media_type, tmdb_id = match.group(1), int(match.group(2))
+        title_key = 'title' if media_type == 'movie' else 'name'
+        date_key = 'release_date' if media_type == 'movie' else 'first_air_date'
+        item = {'id': tmdb_id, title_key: f"Title {tmdb_id}", date_key: "2020-01-01", 'overview': "Stub."}
+        appended = query.get('append_to_response', '').split(',')
+        if 'watch/providers' in appended:
+            item['watch/providers'] = {'results': providers_of(tmdb_id)['results']}
+        if 'external_ids' in appended:
+            item['external_ids'] = external_ids_of(tmdb_id)
+        return _json(item)
+
+    def watch_providers(match, query, body):
+        return _json(providers_of(int(match.group(2))))
+
+    def external_ids(match, query, body):
+        return _json(external_ids_of(int(match.group(1))))
+
+    return [
+        ('GET', r'/3/configuration', lambda match, query, body: _json({'images': {'secure_base_url': 'https://image.tmdb.org/t/p/'}})),
+        ('GET', r'/3/search/multi', search_multi),
+        ('GET', r'/3/search/(movie|tv)', search),
+        ('GET', r'/3/trending/(movie|tv)/day', title_list),
+        ('GET', r'/3/(movie|tv)/(popular|upcoming|on_the_air)', title_list),
+        ('GET', r'/3/(movie|tv)/(\d+)', details),
+        ('GET', r'/3/(movie|tv)/(\d+)/watch/providers', watch_providers),
+        ('GET', r'/3/tv/(\d+)/external_ids', external_ids),
+    ]
+
+
+# --- Plex ---
+
+def _plex_routes(library_size):
+    """Returns (routes, add_title); add_title(title, year, tmdb_id) puts a new movie at the top of recently added."""
+    lock = threading.Lock()
+    base_added_at = int(time.time()) - library_size * 60
+    library = [(f"{PLEX_TITLE_PREFIX} {n}", 2000 + n % 25, n + 1, PLEX_TMDB_BASE + n, base_added_at + n * 60)
+               for n in range(library_size)]
+    root = b'<MediaContainer size="0" friendlyName="Stub Plex" machineIdentifier="stub-plex" version="1.40.0.0" />'
+
+    def video_xml(title, year, rating_key, tmdb_id, added_at):
+        return (
+            f'<Video ratingKey="{rating_key}" key="/library/metadata/{rating_key}" type="movie" '
+            f'title={quoteattr(title)} year="{year}" addedAt="{added_at}"><Media id="{rating_key}"><Part id="{rating_key}" /></Media>'
+            f'<Guid id="tmdb://{tmdb_id}" /></Video>'
+        )
+
+    sections = (b'<MediaContainer size="1"><Directory key="1" type="movie" title="Movies" /></MediaContainer>')
+    cache = {}
+
+    def rebuild():
+        cache['section_all'] = (
+            f'<MediaContainer size="{len(library)}" totalSize="{len(library)}">'
+            f'{"".join(video_xml(*entry) for entry in library)}</MediaContainer>'
+        ).encode('utf-8')
+
+    rebuild()
+
+    def add_title(title, year, tmdb_id):
+        with lock:
+            library.append((title, year, len(library) + 1, tmdb_id, int(time.time())))
+            rebuild()
+
+    def server_root(match, query, body):
+        return 200, 'text/xml', root
+
+    def hub_search(match, query, body):
+        text = query.get('query', '').lower()
+        with lock:
+            hits = [video_xml(*entry) for entry in library if text and text in entry[0].lower()][:10]
+        xml = (
+            f'<MediaContainer size="1"><Hub type="movie" hubIdentifier="movie" size="{len(hits)}" title="Movies">'
+            f'{"".join(hits)}</Hub></MediaContainer>'
+        )
+        return 200, 'text/xml', xml.encode('utf-8')
+
+    def section_all(match, query, body):
+        with lock:
+            return 200, 'text/xml', cache['section_all']
+
+    def recently_added(match, query, body):
+        start = int(query.get('X-Plex-Container-Start', 0))
+        size = int(query.get('X-Plex-Container-Size', 50))
+        with lock:
+            newest = sorted(library, key=lambda entry: entry[4], reverse=True)[start:start + size]
+        xml = f'<MediaContainer size="{len(newest)}">{"".join(video_xml(*entry) for entry in newest)}</MediaContainer>'
+        return 200, 'text/xml', xml.encode('utf-8')
+
+    routes = [
+        ('GET', r'/', server_root),
+        ('GET', r'/hubs/search/?', hub_search),
+        ('GET', r'/library/sections/?', lambda match, query, body: (200, 'text/xml', sections)),
+        ('GET', r'/library/sections/1/all', section_all),
+        ('GET', r'/library/recentlyAdded', recently_added),
+    ]
+    return routes, add_title
+
+
+# --- Radarr / Sonarr ---
+
+def _arr_routes(api_path, library_size, tmdb_base):
+    is_series = api_path == 'series'
+    lock = threading.Lock()
+    items = []
+    for n in range(library_size):
+        item = {'id': n + 1, 'title': f"{api_path.title()} {n}", 'year': 2000 + n % 25,
+                'tmdbId': tmdb_base + n, 'monitored': True, 'path': f"/media/{api_path}/{n}"}
+        if is_series:
+            item['tvdbId'] = tmdb_base + n + 7
+        items.append(item)
+    cache = {'body': json.dumps(items).encode('utf-8')}
+    history = []
+
+    def list_items(match, query, body):
+        with lock:
+            for field in ('tmdbId', 'tvdbId'):
+                if field in query:
+                    return _json([i for i in items if str(i.get(field)) == query[field]])
+            return 200, 'application/json', cache['body']
+
+    def add_item(match, query, body):
+        with lock:
+            if any(i['tmdbId'] == body.get('tmdbId') for i in items):
+                return _json([{'propertyName': 'TmdbId', 'errorMessage': 'This item has already been added'}], 400)
+            added = dict(body, id=len(items) + 1)
+            items.append(added)
+            cache['body'] = json.dumps(items).encode('utf-8')
+            # Pretend the download finishes immediately
+            history.append({'id': len(history) + 1, 'eventType': 'downloadFolderImported',
+                            'date': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                            f"{'series' if is_series else 'movie'}Id": added['id']})
+        return _json(added, 201)
+
+    def history_since(match, query, body):
+        since = query.get('date', '')
+        with lock:
+            return _json([record for record in history if record['date'] >= since])
+
+    root_folder = '/media/tv' if is_series else '/media/movies'
+    status = {'appName': 'Sonarr' if is_series else 'Radarr', 'version': '4.0.0.0'}
+    return [
+        ('GET', r'/api/v3/system/status', lambda match, query, body: _json(status)),
+        ('GET', r'/api/v3/qualityprofile', lambda match, query, body: _json([{'id': 1, 'name': 'HD'}, {'id': 2, 'name': 'UHD'}])),
+        ('GET', r'/api/v3/rootfolder', lambda match, query, body: _json([{'id': 1, 'path': root_folder}, {'id': 2, 'path': f"{root_folder}4k"}])),
+        ('GET', rf'/api/v3/{api_path}', list_items),
+        ('POST', rf'/api/v3/{api_path}', add_item),
+        ('GET', r'/api/v3/history/since', history_since),
+    ]
+
+
+# --- Overseerr ---
+
+def _overseerr_routes(request_count):
+    requests_list = [
+        {'id': n + 1, 'status': 1, 'media': {'tmdbId': OVERSEERR_TMDB_BASE + n, 'mediaType': 'movie', 'title': f"Requested {n}"}}
+        for n in range(request_count)
+    ]
+    def list_requests(match, query, body):
+        take, skip = int(query.get('take', 20)), int(query.get('skip', 0))
+        page = requests_list[skip:skip + take]
+        pages = (request_count + take - 1) // take
+        return _json({'pageInfo': {'pages': pages, 'pageSize': take, 'results': request_count, 'page': skip // take + 1},
+                      'results': page})
+
+    return [
+        ('GET', r'/api/v1/request', list_requests),
+        ('GET', r'/api/v1/status', lambda match, query, body: _json({'version': '1.33.2'})),
+    ]
+
+
+class StubCluster:
+    """Starts one stub server per backend and builds a matching bot CONFIG."""
+
+    def __init__(self, latency_ms=None, jitter_ms=0.0, plex_size=500, radarr_size=2000,
+                 sonarr_size=500, overseerr_size=200, error_rates=None):
+        latency_ms = latency_ms or {}
+        plex_routes, self.add_to_plex = _plex_routes(plex_size)
+        self.servers = {
+            'tmdb': StubServer('tmdb', _tmdb_routes(), latency_ms.get('tmdb', 0), jitter_ms),
+            'plex': StubServer('plex', plex_routes, latency_ms.get('plex', 0), jitter_ms),
+            'radarr': StubServer('radarr', _arr_routes('movie', radarr_size, RADARR_TMDB_BASE), latency_ms.get('radarr', 0), jitter_ms),
+            'sonarr': StubServer('sonarr', _arr_routes('series', sonarr_size, SONARR_TMDB_BASE), latency_ms.get('sonarr', 0), jitter_ms),
+            'overseerr': StubServer('overseerr', _overseerr_routes(overseerr_size), latency_ms.get('overseerr', 0), jitter_ms),
+        }
+        for name, rate in (error_rates or {}).items():
+            self.servers[name].error_rate = rate
+
+    def start(self):
+        for server in self.servers.values():
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.stop()
+
+    @property
+    def tmdb_api_url(self):
+        return f"{self.servers['tmdb'].url}/3"
+
+    def request_counts(self):
+        return {name: server.request_count for name, server in self.servers.items()}
+
+    def bot_config(self, admin_user_id=1):
+        """Returns a CONFIG dictionary pointing every integration at the stubs."""
+        return {
+            "admin_user_id": admin_user_id,
+            "friend_user_ids": {},
+            "friend_codes": {},
+            "language": "en",
+            "plex": {"url": self.servers['plex'].url, "token": "stub-token"},
+            "tmdb": {"api_key": "stub-key", "region": "BR"},
+            "radarr": {
+                "url": self.servers['radarr'].url, "api_key": "stub-key", "quality_profile_id": "1",
+                "root_folder_path": "/media/movies", "quality_profile_id_4k": "2", "root_folder_path_4k": "/media/movies4k"
+            },
+            "sonarr": {
+                "url": self.servers['sonarr'].url, "api_key": "stub-key", "quality_profile_id": "1",
+                "language_profile_id": "1", "root_folder_path": "/media/tv",
+                "quality_profile_id_4k": "2", "root_folder_path_4k": "/media/tv4k"
+            },
+            "overseerr": {"url": self.servers['overseerr'].url, "api_key": "stub-key"},
+            "subscribed_services": []
+        }
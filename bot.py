@@ -1,12 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 
+import io
 import logging
 import os
 import json
+import random
 import secrets
-from functools import wraps
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeoutError
+from functools import wraps, lru_cache
+from itertools import chain, zip_longest
 from datetime import datetime, timedelta
+from queue import Queue
+
+_LAUNCHED_AT = time.perf_counter()
 
 # --- Dependencies ---
 # Make sure to install with:
@@ -14,15 +23,17 @@ from datetime import datetime, timedelta
 
 from dotenv import load_dotenv
 import requests
-from plexapi.server import PlexServer
-from plexapi.exceptions import NotFound as PlexNotFound
+from requests.adapters import HTTPAdapter
+# plexapi is imported on first use in _connect_plex() to keep startup fast
 
 from telegram import (
     Update,
     InlineKeyboardButton,
     InlineKeyboardMarkup,
     ParseMode,
-    InputMediaPhoto
+    InputMediaPhoto,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
 )
 from telegram.ext import (
     Updater,
@@ -32,29 +43,44 @@ from telegram.ext import (
     ConversationHandler,
     CallbackContext,
     CallbackQueryHandler,
+    InlineQueryHandler,
+    TypeHandler,
+    JobQueue,
 )
+from telegram.utils.request import Request
 
 # Import the new friend request module
 import friend_requests
+import metrics
+import profiler
+import circuit_breaker
+import callback_dedup
+import singleflight
+import send_scheduler
+import library_sync
+import availability
+import cache
+import cassette
+import snapshot
+import state
+import structured_log
+import title_index
+import update_scheduler
 
 # --- Initial Setup ---
 
 load_dotenv()
-os.makedirs('logs', exist_ok=True)
-os.makedirs('config', exist_ok=True)
-
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler("logs/searchrr_plus.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+def setup_logging(settings=None):
+    """Configures logging (queued, rotating, JSON by default; see structured_log.py). Called from main(), not at import."""
+    structured_log.configure(settings)
+
 # --- Constants ---
 CONFIG_FILE = "config/config.json"
+API_RESPONSE_LOG_LIMIT = 500    # Characters of a failed API response body that are logged
+# Overridable so the benchmark stubs (benchmarks/stub_servers.py) can stand in for TMDB
+TMDB_API_URL = os.getenv("TMDB_API_URL", "https://api.themoviedb.org/3").rstrip('/')
 KEYWORD_MAP = {
     'nfx': ('netflix',), 'amp': ('amazon prime video', 'prime video'), 'max': ('max', 'hbo max'),
     'dnp': ('disney plus', 'disney+'), 'hlu': ('hulu',), 'apt': ('apple tv plus', 'apple tv+', 'appletv'),
@@ -82,294 +108,33 @@ KEYWORD_MAP = {
 
 
 # --- Translations ---
-translations = {
-    'en': {
-        "start_message": "👋 Welcome! Please use /login (admin) or /auth (friend) to get started.",
-        "login_prompt_user": "🔑 Please enter the admin username:",
-        "login_prompt_pass": "🔑 Please enter the password:",
-        "login_success": "✅ Login successful! Welcome back.",
-        "login_fail": "❌ Incorrect credentials or you are not the designated admin.",
-        "login_already_done": "✅ You are already logged in.",
-        "logout_success": "✅ You have been successfully logged out.",
-        "auth_required": "🚫 You need to be authenticated. Please use /login or /auth.",
-        "unauthenticated_message": "You are not logged in. Please use /login or /auth.",
-        "admin_required": "⛔ This command is for administrators only.",
-        "auth_prompt": "👋 Welcome! Please enter your friend code:",
-        "auth_friend_code_invalid": "❌ Invalid or expired friend code. Try again or type /cancel.",
-        "auth_friend_code_accepted": "✅ Friend code accepted! Welcome.",
-        "auth_cancelled": "Authentication canceled.",
-        "search_cancelled": "Ok, search cancelled.",
-        "cancel_button": "❌ Cancel",
-        "new_friend_code": "🔑 New single-use friend code for '{name}' generated. It is valid for 24 hours:\n\n`{code}`",
-        "help_admin": "👑 *Admin Commands*\n\n/movie <title> - Search and add a movie.\n/movie4k <title> - Add a movie in 4K.\n/show <title> - Search and add a series.\n/show4k <title> - Add a series in 4K.\n/check <movie|show> <title> - Check if media is on Plex/Radarr/Sonarr.\n/friends - Manage friend access.\n/setup - (Re)configure the bot.\n/language - Change the bot's language.\n/streaming - List available streaming codes.\n/debug <movie|show> <title> - Diagnose the check for a media.\n/logout - End your session.\n/help - Show this message.",
-        "help_friend": "👥 *Friend Commands*\n\n/movie <title> - Check availability of a movie.\n/show <title> - Check availability of a series.\n/friendrequest <movie|show> <title> - Request new media.\n/check <movie|show> <title> - Check if media is on Plex/Radarr/Sonarr.\n/language - Change the bot's language.\n/help - Show this message.",
-        "no_results": "🤷 No results found for '{query}'. Try being more specific.",
-        "provide_title": "Please provide a title. Usage: /{command} <title>",
-        "check_usage": "Usage: /check <movie|show> <title>",
-        "friendrequest_usage": "Usage: /friendrequest <movie|show> <title>",
-        "add_button": "➕ Add",
-        "add_button_4k": "➕ Add 4K",
-        "check_button": "🔎 Check Status",
-        "nav_prev": "⬅️ Previous",
-        "nav_next": "Next ➡️",
-        "error_media_details": "❌ Error: Could not find the details of the selected media.",
-        "checking_status": "🔎 Checking '{title}'...",
-        "media_unavailable": "'{title}' does not seem to be available.",
-        "media_unavailable_friend": "ℹ️ '{title}' is not available. Ask an administrator to add it.",
-        "request_sent": "✅ Your request for '{title}' has been sent to the admin for approval.",
-        "request_limit_reached": "🚫 You have reached your daily request limit of 3 requests.",
-        "request_already_in_library": "✅ Great news! '{title}' is already in the library.",
-        "request_approved_notification": "🎉 Good news! Your request for '{title}' has been approved and is being added.",
-        "request_declined_notification": "😞 Sorry, your request for '{title}' was declined by the admin.",
-        "setup_menu_prompt": "⚙️ *Setup Menu*\n\nChoose a section to configure, or reconfigure everything.",
-        "setup_section_plex": "Plex",
-        "setup_section_tmdb": "TMDB",
-        "setup_section_radarr": "Radarr",
-        "setup_section_sonarr": "Sonarr",
-        "setup_section_overseerr": "Overseerr",
-        "setup_section_streaming": "Streaming Services",
-        "setup_all_button": "(Re)configure everything",
-        "setup_save_exit_button": "💾 Save & Exit",
-        "setup_cancelled": "⚙️ Setup canceled.",
-        "setup_saved": "💾 All settings have been successfully saved! The bot is ready.",
-        "setup_error_saving": "❌ Error saving the configuration file. Check the logs.",
-        "setup_ask_4k": "Do you want to configure a separate 4K profile for {service}? (yes/no)",
-        "setup_4k_quality_prompt": "What is the 4K Quality Profile ID for {service}?",
-        "setup_4k_folder_prompt": "What is the 4K Root Folder Path for {service}?",
-        "setup_4k_profile_not_configured": "⚠️ {service} 4K profile is not configured. Please use /setup.",
-        "language_prompt": "Please choose your language:",
-        "language_set": "✅ Language set to {lang_name}.",
-        "plex_found": "✅ '{title}' is already available on your Plex: {server_name}.",
-        "streaming_found": "📺 '{title}' is available for streaming on: {services_str}.",
-        "streaming_list_header": "📜 *Available Streaming Service Codes*\n\n",
-        "overseerr_found": "⏳ '{title}' has already been requested on Overseerr and is pending.",
-        "service_add_success": "✅ '{title}' has been added to {service_name} and the search has started.",
-        "service_add_exists": "ℹ️ '{title}' already exists in {service_name}.",
-        "service_add_fail": "❌ Failed to add '{title}' to {service_name}.",
-        "check_sonarr_radarr_found": "✅ '{title}' is already in {service_name}.",
-        "check_not_found": "❌ '{title}' was not found in your Plex, Radarr, or Sonarr.",
-        "friends_menu_prompt": "👥 *Friends Management*\n\nWhat would you like to do?",
-        "friends_button_add": "➕ Add Friend",
-        "friends_button_remove": "➖ Remove Friend",
-        "friends_button_list": "📋 List Friends",
-        "friends_button_back": "⬅️ Back",
-        "friends_add_prompt": "Please send the name for the new friend.",
-        "friends_remove_prompt": "Select a friend to remove:",
-        "friends_no_friends_to_remove": "There are no friends to remove.",
-        "friends_list_title": "📋 Friend List",
-        "friends_friend_removed": "✅ Friend '{name}' has been successfully removed.",
-        "friends_no_friends": "You haven't added any friends yet.",
-        "friends_list_format": "- {name}",
-        "debug_start": "🐛 Starting debug for '{query}' ({media_type}).",
-        "debug_tmdb_search": "Searching on TMDB...",
-        "debug_tmdb_found": "TMDB found: '{title}' ({year}) [ID: {tmdb_id}]",
-        "debug_tmdb_not_found": "No results found on TMDB for '{query}'. Debug finished.",
-        "debug_plex_check": "Verifying Plex library...",
-        "debug_plex_success": "SUCCESS: {plex_result}",
-        "debug_plex_fail": "Not found in Plex library.",
-        "debug_streaming_check": "Verifying streaming services...",
-        "debug_streaming_success": "SUCCESS: {streaming_result}",
-        "debug_streaming_fail": "Not found on any subscribed streaming service.",
-        "debug_overseerr_check": "Verifying requests on Overseerr...",
-        "debug_overseerr_success": "SUCCESS: {overseerr_result}",
-        "debug_overseerr_fail": "No request found on Overseerr.",
-        "debug_end": "Debug finished.",
-    },
-    'pt': {
-        "start_message": "👋 Bem-vindo! Por favor, use /login (admin) ou /auth (amigo) para começar.",
-        "login_prompt_user": "🔑 Por favor, digite o nome de usuário do admin:",
-        "login_prompt_pass": "🔑 Por favor, digite a senha:",
-        "login_success": "✅ Login realizado com sucesso! Bem-vindo(a) de volta.",
-        "login_fail": "❌ Credenciais incorretas ou você não é o admin designado.",
-        "login_already_done": "✅ Você já está logado.",
-        "logout_success": "✅ Você foi desconectado com sucesso.",
-        "auth_required": "🚫 Você precisa estar autenticado. Por favor, use /login ou /auth.",
-        "unauthenticated_message": "Você não está logado. Por favor, use /login ou envie seu código de amigo com /auth.",
-        "admin_required": "⛔ Este comando é apenas para administradores.",
-        "auth_prompt": "👋 Bem-vindo! Por favor, insira o seu código de amigo:",
-        "auth_friend_code_invalid": "❌ Código de amigo inválido ou expirado. Tente novamente ou digite /cancelar.",
-        "auth_friend_code_accepted": "✅ Código de amigo aceito! Bem-vindo(a).",
-        "auth_cancelled": "Autenticação cancelada.",
-        "search_cancelled": "Ok, busca cancelada.",
-        "cancel_button": "❌ Cancelar",
-        "new_friend_code": "🔑 Novo código de amigo de uso único para '{name}' gerado. É válido por 24 horas:\n\n`{code}`",
-        "help_admin": "👑 *Comandos de Admin*\n\n/movie <título> - Procurar e adicionar um filme.\n/movie4k <título> - Adicionar um filme em 4K.\n/show <título> - Procurar e adicionar uma série.\n/show4k <título> - Adicionar uma série em 4K.\n/check <movie|show> <título> - Checar se a mídia está no Plex/Radarr/Sonarr.\n/friends - Gerenciar amigos.\n/setup - (Re)configurar o bot.\n/language - Alterar o idioma do bot.\n/streaming - Listar códigos de streaming disponíveis.\n/debug <movie|show> <título> - Diagnosticar a verificação de uma mídia.\n/logout - Encerrar sua sessão.\n/help - Mostrar esta mensagem.",
-        "help_friend": "👥 *Comandos de Amigo*\n\n/movie <título> - Verificar disponibilidade de um filme.\n/show <título> - Verificar disponibilidade de uma série.\n/friendrequest <movie|show> <título> - Pedir nova mídia.\n/check <movie|show> <título> - Checar se a mídia está no Plex/Radarr/Sonarr.\n/language - Alterar o idioma do bot.\n/help - Mostrar esta mensagem.",
-        "no_results": "🤷 Nenhum resultado encontrado para '{query}'. Tente ser mais específico.",
-        "provide_title": "Por favor, forneça um título. Uso: /{command} <título>",
-        "check_usage": "Uso: /check <movie|show> <título>",
-        "friendrequest_usage": "Uso: /friendrequest <movie|show> <título>",
-        "add_button": "➕ Adicionar",
-        "add_button_4k": "➕ Adicionar 4K",
-        "check_button": "🔎 Checar Status",
-        "nav_prev": "⬅️ Anterior",
-        "nav_next": "Próximo ➡️",
-        "error_media_details": "❌ Erro: Não foi possível encontrar os detalhes da mídia selecionada.",
-        "checking_status": "🔎 Verificando '{title}'...",
-        "media_unavailable": "'{title}' não parece estar disponível.",
-        "media_unavailable_friend": "ℹ️ '{title}' não está disponível. Peça para um administrador adicioná-lo.",
-        "request_sent": "✅ Seu pedido para '{title}' foi enviado para aprovação do admin.",
-        "request_limit_reached": "🚫 Você atingiu seu limite diário de 3 pedidos.",
-        "request_already_in_library": "✅ Ótima notícia! '{title}' já está na biblioteca.",
-        "request_approved_notification": "🎉 Boas notícias! Seu pedido para '{title}' foi aprovado e está sendo adicionado.",
-        "request_declined_notification": "😞 Desculpe, seu pedido para '{title}' foi recusado pelo admin.",
-        "setup_menu_prompt": "⚙️ *Menu de Configuração*\n\nEscolha uma seção para configurar, ou reconfigure tudo.",
-        "setup_section_plex": "Plex",
-        "setup_section_tmdb": "TMDB",
-        "setup_section_radarr": "Radarr",
-        "setup_section_sonarr": "Sonarr",
-        "setup_section_overseerr": "Overseerr",
-        "setup_section_streaming": "Serviços de Streaming",
-        "setup_all_button": "(Re)configurar tudo",
-        "setup_save_exit_button": "💾 Salvar e Sair",
-        "setup_cancelled": "⚙️ Configuração cancelada.",
-        "setup_saved": "💾 Todas as configurações foram salvas com sucesso! O bot está pronto.",
-        "setup_error_saving": "❌ Erro ao salvar o arquivo de configuração. Verifique os logs.",
-        "setup_ask_4k": "Você deseja configurar um perfil 4K separado para o {service}? (sim/não)",
-        "setup_4k_quality_prompt": "Qual o ID do Perfil de Qualidade 4K do {service}?",
-        "setup_4k_folder_prompt": "Qual o Caminho da Pasta Raiz 4K do {service}?",
-        "setup_4k_profile_not_configured": "⚠️ O perfil 4K do {service} não está configurado. Por favor, use o /setup.",
-        "language_prompt": "Por favor, escolha o seu idioma:",
-        "language_set": "✅ Idioma alterado para {lang_name}.",
-        "plex_found": "✅ '{title}' já está disponível no seu Plex: {server_name}.",
-        "streaming_found": "📺 '{title}' está disponível para streaming em: {services_str}.",
-        "streaming_list_header": "📜 *Códigos de Serviços de Streaming Disponíveis*\n\n",
-        "overseerr_found": "⏳ '{title}' já foi pedido no Overseerr e está pendente.",
-        "service_add_success": "✅ '{title}' foi adicionado ao {service_name} e a busca foi iniciada.",
-        "service_add_exists": "ℹ️ '{title}' já existe no {service_name}.",
-        "service_add_fail": "❌ Falha ao adicionar '{title}' ao {service_name}.",
-        "check_sonarr_radarr_found": "✅ '{title}' já está no {service_name}.",
-        "check_not_found": "❌ '{title}' não foi encontrado no seu Plex, Radarr ou Sonarr.",
-        "friends_menu_prompt": "👥 *Gerenciamento de Amigos*\n\nO que você gostaria de fazer?",
-        "friends_button_add": "➕ Adicionar Amigo",
-        "friends_button_remove": "➖ Remover Amigo",
-        "friends_button_list": "📋 Listar Amigos",
-        "friends_button_back": "⬅️ Voltar",
-        "friends_add_prompt": "Por favor, envie o nome para o novo amigo.",
-        "friends_remove_prompt": "Selecione um amigo para remover:",
-        "friends_no_friends_to_remove": "Não há amigos para remover.",
-        "friends_list_title": "📋 Lista de Amigos",
-        "friends_friend_removed": "✅ Amigo '{name}' foi removido com sucesso.",
-        "friends_no_friends": "Você ainda não adicionou nenhum amigo.",
-        "friends_list_format": "- {name}",
-        "debug_start": "🐛 Iniciando debug para '{query}' ({media_type}).",
-        "debug_tmdb_search": "Buscando no TMDB...",
-        "debug_tmdb_found": "TMDB encontrou: '{title}' ({year}) [ID: {tmdb_id}]",
-        "debug_tmdb_not_found": "Nenhum resultado encontrado no TMDB para '{query}'. Debug encerrado.",
-        "debug_plex_check": "Verificando biblioteca do Plex...",
-        "debug_plex_success": "SUCESSO: {plex_result}",
-        "debug_plex_fail": "Não encontrado na biblioteca do Plex.",
-        "debug_streaming_check": "Verificando serviços de streaming...",
-        "debug_streaming_success": "SUCESSO: {streaming_result}",
-        "debug_streaming_fail": "Não encontrado em nenhum serviço de streaming assinado.",
-        "debug_overseerr_check": "Verificando pedidos no Overseerr...",
-        "debug_overseerr_success": "SUCESSO: {overseerr_result}",
-        "debug_overseerr_fail": "Nenhum pedido encontrado no Overseerr.",
-        "debug_end": "Debug finalizado.",
-    },
-    'es': {
-        "start_message": "👋 ¡Bienvenido! Por favor, usa /login (admin) o /auth (amigo) para empezar.",
-        "login_prompt_user": "🔑 Por favor, introduce el nombre de usuario del admin:",
-        "login_prompt_pass": "🔑 Por favor, introduce la contraseña:",
-        "login_success": "✅ ¡Inicio de sesión exitoso! Bienvenido de nuevo.",
-        "login_fail": "❌ Credenciales incorrectas o no eres el admin designado.",
-        "login_already_done": "✅ Ya has iniciado sesión.",
-        "logout_success": "✅ Has cerrado la sesión correctamente.",
-        "auth_required": "🚫 Necesitas estar autenticado. Por favor, usa /login o /auth.",
-        "unauthenticated_message": "No estás conectado. Por favor, usa /login o envía tu código de amigo con /auth.",
-        "admin_required": "⛔ Este comando es solo para administradores.",
-        "auth_prompt": "👋 ¡Bienvenido! Por favor, introduce tu código de amigo:",
-        "auth_friend_code_invalid": "❌ Código de amigo inválido o caducado. Inténtalo de nuevo o escribe /cancelar.",
-        "auth_friend_code_accepted": "✅ ¡Código de amigo aceptado! Bienvenido.",
-        "auth_cancelled": "Autenticación cancelada.",
-        "search_cancelled": "Ok, búsqueda cancelada.",
-        "cancel_button": "❌ Cancelar",
-        "new_friend_code": "🔑 Nuevo código de amigo de un solo uso para '{name}' generado. Es válido por 24 horas:\n\n`{code}`",
-        "help_admin": "👑 *Comandos de Admin*\n\n/movie <título> - Buscar y añadir una película.\n/movie4k <título> - Añadir una película en 4K.\n/show <título> - Buscar y añadir una serie.\n/show4k <título> - Añadir una serie en 4K.\n/check <movie|show> <título> - Comprobar si el medio está en Plex/Radarr/Sonarr.\n/friends - Gestionar amigos.\n/setup - (Re)configurar el bot.\n/language - Cambiar el idioma del bot.\n/streaming - Listar códigos de streaming disponibles.\n/debug <movie|show> <título> - Diagnosticar la verificación de un medio.\n/logout - Cerrar tu sesión.\n/help - Mostrar este mensaje.",
-        "help_friend": "👥 *Comandos de Amigo*\n\n/movie <título> - Comprobar la disponibilidad de una película.\n/show <título> - Comprobar la disponibilidad de una serie.\n/friendrequest <movie|show> <título> - Solicitar nuevo medio.\n/check <movie|show> <título> - Comprobar si el medio está en Plex/Radarr/Sonarr.\n/language - Cambiar el idioma del bot.\n/help - Mostrar este mensaje.",
-        "no_results": "🤷 No se encontraron resultados para '{query}'. Intenta ser más específico.",
-        "provide_title": "Por favor, proporciona un título. Uso: /{command} <título>",
-        "check_usage": "Uso: /check <movie|show> <título>",
-        "friendrequest_usage": "Uso: /friendrequest <movie|show> <título>",
-        "add_button": "➕ Añadir",
-        "add_button_4k": "➕ Añadir 4K",
-        "check_button": "🔎 Comprobar Estado",
-        "nav_prev": "⬅️ Anterior",
-        "nav_next": "Siguiente ➡️",
-        "error_media_details": "❌ Error: No se pudieron encontrar los detalles del medio seleccionado.",
-        "checking_status": "🔎 Comprobando '{title}'...",
-        "media_unavailable": "'{title}' no parece estar disponible.",
-        "media_unavailable_friend": "ℹ️ '{title}' no está disponible. Pide a un administrador que lo añada.",
-        "request_sent": "✅ Tu solicitud para '{title}' ha sido enviada al admin para su aprobación.",
-        "request_limit_reached": "🚫 Has alcanzado tu límite diario de 3 solicitudes.",
-        "request_already_in_library": "✅ ¡Buenas noticias! '{title}' ya está en la biblioteca.",
-        "request_approved_notification": "🎉 ¡Buenas noticias! Tu solicitud para '{title}' ha sido aprobada y se está añadiendo.",
-        "request_declined_notification": "😞 Lo siento, tu solicitud para '{title}' fue rechazada por el admin.",
-        "setup_menu_prompt": "⚙️ *Menú de Configuración*\n\nElige una sección para configurar, o reconfigura todo.",
-        "setup_section_plex": "Plex",
-        "setup_section_tmdb": "TMDB",
-        "setup_section_radarr": "Radarr",
-        "setup_section_sonarr": "Sonarr",
-        "setup_section_overseerr": "Overseerr",
-        "setup_section_streaming": "Servicios de Streaming",
-        "setup_all_button": "(Re)configurar todo",
-        "setup_save_exit_button": "💾 Guardar y Salir",
-        "setup_cancelled": "⚙️ Configuración cancelada.",
-        "setup_saved": "💾 ¡Todos los ajustes se han guardado con éxito! El bot está listo.",
-        "setup_error_saving": "❌ Error al guardar el archivo de configuración. Comprueba los logs.",
-        "setup_ask_4k": "¿Deseas configurar un perfil 4K separado para {service}? (si/no)",
-        "setup_4k_quality_prompt": "¿Cuál es el ID del Perfil de Calidad 4K de {service}?",
-        "setup_4k_folder_prompt": "¿Cuál es la Ruta de la Carpeta Raíz 4K de {service}?",
-        "setup_4k_profile_not_configured": "⚠️ El perfil 4K de {service} no está configurado. Por favor, usa /setup.",
-        "language_prompt": "Por favor, elige tu idioma:",
-        "language_set": "✅ Idioma cambiado a {lang_name}.",
-        "plex_found": "✅ '{title}' ya está disponible en tu Plex: {server_name}.",
-        "streaming_found": "📺 '{title}' está disponible para streaming en: {services_str}.",
-        "streaming_list_header": "📜 *Códigos de Servicios de Streaming Disponibles*\n\n",
-        "overseerr_found": "⏳ '{title}' ya ha sido solicitado en Overseerr y está pendiente.",
-        "service_add_success": "✅ '{title}' ha sido añadido a {service_name} y la búsqueda ha comenzado.",
-        "service_add_exists": "ℹ️ '{title}' ya existe en {service_name}.",
-        "service_add_fail": "❌ Fallo al añadir '{title}' a {service_name}.",
-        "check_sonarr_radarr_found": "✅ '{title}' ya está en {service_name}.",
-        "check_not_found": "❌ '{title}' no se encontró en tu Plex, Radarr, o Sonarr.",
-        "friends_menu_prompt": "👥 *Gestión de Amigos*\n\n¿Qué te gustaría hacer?",
-        "friends_button_add": "➕ Añadir Amigo",
-        "friends_button_remove": "➖ Eliminar Amigo",
-        "friends_button_list": "📋 Listar Amigos",
-        "friends_button_back": "⬅️ Volver",
-        "friends_add_prompt": "Por favor, envía el nombre para el nuevo amigo.",
-        "friends_remove_prompt": "Selecciona un amigo para eliminar:",
-        "friends_no_friends_to_remove": "No hay amigos para eliminar.",
-        "friends_list_title": "📋 Lista de Amigos",
-        "friends_friend_removed": "✅ Amigo '{name}' ha sido eliminado con éxito.",
-        "friends_no_friends": "Aún no has añadido ningún amigo.",
-        "friends_list_format": "- {name}",
-        "debug_start": "🐛 Iniciando debug para '{query}' ({media_type}).",
-        "debug_tmdb_search": "Buscando en TMDB...",
-        "debug_tmdb_found": "TMDB encontró: '{title}' ({year}) [ID: {tmdb_id}]",
-        "debug_tmdb_not_found": "No se encontraron resultados en TMDB para '{query}'. Debug finalizado.",
-        "debug_plex_check": "Verificando la biblioteca de Plex...",
-        "debug_plex_success": "ÉXITO: {plex_result}",
-        "debug_plex_fail": "No encontrado en la biblioteca de Plex.",
-        "debug_streaming_check": "Verificando servicios de streaming...",
-        "debug_streaming_success": "ÉXITO: {streaming_result}",
-        "debug_streaming_fail": "No encontrado en ningún servicio de streaming suscrito.",
-        "debug_overseerr_check": "Verificando solicitudes en Overseerr...",
-        "debug_overseerr_success": "ÉXITO: {overseerr_result}",
-        "debug_overseerr_fail": "No se encontró ninguna solicitud en Overseerr.",
-        "debug_end": "Debug finalizado.",
-    }
-}
+# Catalogs live in locales/<lang>.json and are loaded the first time a language is used
+LOCALES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'locales')
+DEFAULT_LANGUAGE = 'en'
+
+@lru_cache(maxsize=None)
+def _load_catalog(lang):
+    """Loads one language catalog, merged over English so lookups never need a second pass."""
+    catalog = dict(_load_catalog(DEFAULT_LANGUAGE)) if lang != DEFAULT_LANGUAGE else {}
+    path = os.path.join(LOCALES_DIR, f"{lang}.json")
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            catalog.update(json.load(f))
+    except (IOError, json.JSONDecodeError) as e:
+        logger.error(f"Error loading translation catalog '{path}': {e}")
+    return catalog
 
 def get_text(key, lang='en'):
     """Fetches a translation string, falling back to English."""
-    return translations.get(lang, translations.get('en', {})).get(key, f"_{key.upper()}_")
-
+    if not lang or not lang.isalpha():
+        lang = DEFAULT_LANGUAGE
+    return _load_catalog(lang).get(key, f"_{key.upper()}_")
 
 # --- Configuration Management ---
 
 def load_config():
     """Loads the configuration from config.json, creating it if it doesn't exist."""
+    os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
     if not os.path.exists(CONFIG_FILE):
         logger.warning(f"File '{CONFIG_FILE}' not found. Creating a new one with default values.")
         default_config = {
@@ -420,7 +185,8 @@ def save_config(config_dict):
         logger.error(f"Error saving configuration file '{CONFIG_FILE}': {e}")
         return False
 
-CONFIG = load_config()
+# Loaded by main(); kept empty at import so importing the module stays cheap
+CONFIG = {}
 
 
 # --- Authentication & Decorators ---
@@ -428,6 +194,29 @@ CONFIG = load_config()
 def is_admin(user_id):
     return user_id == CONFIG.get("admin_user_id")
 
+def _outbound_priority(chat_id):
+    """Outbound Telegram traffic to the admin's chat jumps the send queue."""
+    return send_scheduler.ADMIN_PRIORITY if is_admin(chat_id) else send_scheduler.DEFAULT_PRIORITY
+
+BULK_CALLBACKS = ('pq_as', 'pq_aa', 'pq_da')
+
+def _update_priority(update):
+    """Inbound handling order (see update_scheduler.py): approvals, the admin, interactive use, then bulk work."""
+    if not isinstance(update, Update):
+        return update_scheduler.BULK
+    # Bulk work is classified by what it is before who sent it, so the admin's batches wait too
+    data = update.callback_query.data if update.callback_query else None
+    if data in BULK_CALLBACKS:
+        return update_scheduler.BULK
+    # Inline queries arrive with every keystroke
+    if update.inline_query or update.chosen_inline_result:
+        return update_scheduler.BULK
+    if data and data.startswith(('approve_', 'decline_', 'pq_t_')):
+        return update_scheduler.APPROVAL
+    if update.effective_user and is_admin(update.effective_user.id):
+        return update_scheduler.ADMIN
+    return update_scheduler.INTERACTIVE
+
 def admin_required(func):
     @wraps(func)
     def wrapped(update: Update, context: CallbackContext, *args, **kwargs):
@@ -470,48 +259,551 @@ def config_required(section):
 
 # --- API & Verification Logic Functions ---
 
-def _api_get_request(url, params=None, headers=None):
+# Every backend call goes through one pooled session, so connections (and TLS handshakes)
+# are reused between requests; the startup health check opens them before the first user does.
+# Hosts kept, and connections kept per host: the fan-out pool plus the handler and dispatcher workers
+HTTP_POOL = {'pool_connections': 8, 'pool_maxsize': 16}
+_http = requests.Session()
+for _scheme in ('http://', 'https://'):
+    _http.mount(_scheme, HTTPAdapter(**HTTP_POOL))
+
+def _config_secrets(value):
+    """API keys and tokens anywhere in a configuration, to keep them out of recorded traffic."""
+    found = []
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key in ('api_key', 'token') and isinstance(item, str):
+                found.append(item)
+            else:
+                found += _config_secrets(item)
+    elif isinstance(value, list):
+        for item in value:
+            found += _config_secrets(item)
+    return found
+
+def _record_breaker_result(breaker, error=None):
+    """Feeds a call outcome to a backend's circuit breaker. HTTP 4xx answers mean the backend is up."""
+    if breaker is None:
+        return
+    response = getattr(error, 'response', None)
+    if error is None or (response is not None and response.status_code < 500):
+        breaker.record_success()
+    else:
+        breaker.record_failure()
+
+def _record_backend_call(service, started, error=None):
+    """Feeds a backend call's latency and outcome to the /stats metrics."""
+    name = f"backend.{service or 'other'}"
+    metrics.observe(name, time.perf_counter() - started)
+    metrics.increment(f"{name}.calls")
+    if isinstance(error, requests.exceptions.Timeout):
+        metrics.increment(f"{name}.timeouts")
+    elif error is not None:
+        metrics.increment(f"{name}.errors")
+
+def _api_get_request(url, params=None, headers=None, service=None):
+    breaker = circuit_breaker.get_breaker(service) if service else None
+    if breaker and not breaker.allow_request():
+        logger.warning(f"Circuit for '{service}' is open. Skipping GET {url}")
+        return None
+    started = time.perf_counter()
     try:
-        res = requests.get(url, params=params, headers=headers, timeout=20)
+        res = _http.get(url, params=params, headers=headers, timeout=20)
         res.raise_for_status()
+        _record_breaker_result(breaker)
+        _record_backend_call(service, started)
         return res.json()
     except requests.exceptions.RequestException as e:
+        _record_breaker_result(breaker, e)
+        _record_backend_call(service, started, e)
         logger.error(f"GET request failed for {url}: {e}")
         return None
 
-def _api_post_request(url, json_payload=None, headers=None):
+# --- Arr Instances ---
+# Radarr/Sonarr can be configured as a list of named instances in CONFIG['arr_instances'], e.g.
+#   {"name": "radarr4k", "service": "radarr", "url": ..., "api_key": ..., "quality_profile_id": ...,
+#    "root_folder_path": ..., "4k": true}
+# Instances with "4k": true receive 4K adds and instances with "anime": true receive anime.
+# Without that list, CONFIG['radarr'] and CONFIG['sonarr'] are one instance each, named after
+# the service, which handles 4K through its *_4k quality profile and root folder.
+
+ANIMATION_GENRE_ID = 16
+_fanout_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix='fanout')
+
+def _fan_out(func, items):
+    """Calls func(item) for every item concurrently and returns the results in the same order."""
+    items = list(items)
+    if len(items) <= 1:
+        return [func(item) for item in items]
+    return [future.result() for future in [_fanout_pool.submit(func, item) for item in items]]
+
+def _arr_instances(service_name=None):
+    """Returns the Radarr/Sonarr instances that have a URL and API key, optionally for one service only."""
+    instances = CONFIG.get('arr_instances') or [dict(CONFIG.get(name) or {}, name=name, service=name) for name in ('radarr', 'sonarr')]
+    return [instance for instance in instances
+            if (service_name is None or instance.get('service') == service_name) and instance.get('url') and instance.get('api_key')]
+
+def _arr_instance(name):
+    return next((instance for instance in _arr_instances() if instance['name'] == name), None)
+
+def _arr_label(instance):
+    """'Radarr' for the single-instance setup, 'Radarr (radarr4k)' for named instances."""
+    label = instance['service'].capitalize()
+    return label if instance['name'] == instance['service'] else f"{label} ({instance['name']})"
+
+def _is_anime(tmdb_id, media_type):
+    details = _get_tmdb_details(tmdb_id, 'tv' if media_type == 'show' else 'movie') or {}
+    return details.get('original_language') == 'ja' and any(g.get('id') == ANIMATION_GENRE_ID for g in details.get('genres', []))
+
+def _route_arr_instance(media_info, service_name, is_4k):
+    """Picks the instance a new title is added to, or None if no instance fits."""
+    instances = _arr_instances(service_name)
+    # A 4K add goes to a 4K instance, or to a regular one using its *_4k profile
+    candidates = [i for i in instances if bool(i.get('4k')) == is_4k] or [i for i in instances if not i.get('4k')]
+    if any(i.get('anime') for i in candidates):
+        wants_anime = _is_anime(media_info['tmdb_id'], media_info['media_type'])
+        candidates = [i for i in candidates if bool(i.get('anime')) == wants_anime] or candidates
+    return candidates[0] if candidates else None
+
+@singleflight.coalesce('arr_items')
+def _fetch_arr_items(instance_name):
+    """Fetches the full movie/series list of a Radarr or Sonarr instance. Concurrent identical fetches share one call."""
+    instance = _arr_instance(instance_name)
+    api_path = 'movie' if instance['service'] == 'radarr' else 'series'
+    url = f"{instance['url'].rstrip('/')}/api/v3/{api_path}"
+    headers = {'X-Api-Key': instance['api_key']}
+    return _api_get_request(url, headers=headers, service=instance_name)
+
+@singleflight.coalesce('overseerr_requests')
+def _fetch_overseerr_requests():
+    """Fetches the Overseerr request list. Concurrent identical fetches share one call."""
+    ov_config = CONFIG.get('overseerr', {})
+    url = f"{ov_config['url'].rstrip('/')}/api/v1/request"
+    headers = {'X-Api-Key': ov_config['api_key']}
+    return _api_get_request(url, headers=headers, service='overseerr')
+
+# --- Library Sync ---
+# Whole-library state is refreshed in the background (see library_sync.py) so user-facing
+# checks can answer from memory. Every reader falls back to a live fetch when no fresh
+# snapshot is available.
+
+DEFAULT_SYNC_INTERVALS = {'plex': 900, 'radarr': 300, 'sonarr': 300, 'overseerr': 120}
+
+def _normalize_title(title):
+    """Lowercases, strips accents and punctuation so titles can be compared loosely."""
+    return title_index.normalize(title)
+
+# --- Plex Servers ---
+# Several Plex servers can be listed in CONFIG['plex_servers'] as {"name", "url", "token"}.
+# Without that list, CONFIG['plex'] is a single server named 'plex'. Each server keeps one
+# PlexServer connection (and its HTTP session) for the life of the bot, and has its own
+# sync index and circuit breaker under its name.
+
+PLEX_TIMEOUT = 10
+PLEX_CHECK_TIMEOUT = 15
+_plex_connections = {}
+_plex_connections_lock = threading.Lock()
+
+def _plex_servers():
+    servers = CONFIG.get('plex_servers') or [dict(CONFIG.get('plex') or {}, name='plex')]
+    return [server for server in servers if server.get('url') and server.get('token')]
+
+def _plex_server(name):
+    return next((server for server in _plex_servers() if server['name'] == name), None)
+
+def _connect_plex(server):
+    """Returns the PlexServer for this server, connecting on first use and reusing it afterwards."""
+    key = (server['name'], server['url'], server['token'])
+    with _plex_connections_lock:
+        plex = _plex_connections.get(key)
+    if plex is None:
+        from plexapi.server import PlexServer
+        plex = PlexServer(server['url'], server['token'], session=_http, timeout=PLEX_TIMEOUT)
+        with _plex_connections_lock:
+            _plex_connections[key] = plex
+    return plex
+
+def _drop_plex_connection(server):
+    with _plex_connections_lock:
+        _plex_connections.pop((server['name'], server['url'], server['token']), None)
+
+def _sync_plex(server_name):
+    """Builds an index of every movie and show on a Plex server, by (type, TMDB id) and by (type, title, year).
+
+    TMDB numbers movies and shows separately, so an id alone does not identify a title.
+    """
+    server = _plex_server(server_name)
+    if server is None: return None
     try:
-        res = requests.post(url, json=json_payload, headers=headers, timeout=20)
+        plex = _connect_plex(server)
+    except Exception:
+        _drop_plex_connection(server)
+        raise
+    index = {'server_name': plex.friendlyName, 'by_tmdb': {}, 'by_title': {}}
+    for section in plex.query('/library/sections'):
+        media_type = section.attrib.get('type')
+        if media_type not in ('movie', 'show'):
+            continue
+        for element in plex.query(f"/library/sections/{section.attrib['key']}/all?includeGuids=1"):
+            title = element.attrib.get('title')
+            year = int(element.attrib.get('year') or 0)
+            aliases = [element.attrib.get('originalTitle'), element.attrib.get('titleSort')]
+            for guid in element.findall('Guid'):
+                if guid.attrib.get('id', '').startswith('tmdb://'):
+                    tmdb_id = int(guid.attrib['id'][len('tmdb://'):])
+                    index['by_tmdb'][(media_type, tmdb_id)] = title
+                    title_index.add(media_type, tmdb_id, title, year=year, source='plex', aliases=aliases)
+            for name in {title, element.attrib.get('originalTitle')}:
+                if name:
+                    index['by_title'][(media_type, _normalize_title(name), year)] = title
+    return index
+
+def _build_arr_index(items):
+    return {'by_tmdb': {item['tmdbId']: item for item in items if item.get('tmdbId')}}
+
+def _sync_arr(instance_name):
+    instance = _arr_instance(instance_name)
+    if instance is None: return None
+    items = _fetch_arr_items(instance_name)
+    if items is None:
+        raise RuntimeError(f"{_arr_label(instance)} did not return its library.")
+    media_type = 'movie' if instance['service'] == 'radarr' else 'show'
+    for item in items:
+        aliases = [item.get('originalTitle')] + [alt.get('title') for alt in item.get('alternateTitles') or []]
+        title_index.add(media_type, item.get('tmdbId'), item.get('title'), year=item.get('year'), source='arr', aliases=aliases)
+    return _build_arr_index(items)
+
+def _overseerr_media_type(req):
+    """'movie' or 'show' for an Overseerr request (Overseerr says 'tv' for shows)."""
+    return 'show' if (req.get('media', {}).get('mediaType') or req.get('type')) == 'tv' else 'movie'
+
+def _sync_overseerr(page_size=100):
+    ov_config = CONFIG.get('overseerr', {})
+    if not all(ov_config.get(k) for k in ['url', 'api_key']): return None
+    url = f"{ov_config['url'].rstrip('/')}/api/v1/request"
+    headers = {'X-Api-Key': ov_config['api_key']}
+    index = {'by_tmdb': {}}   # (media type, TMDB id) -> request
+    skip = 0
+    while True:
+        page = _api_get_request(url, params={'take': page_size, 'skip': skip}, headers=headers, service='overseerr')
+        if page is None:
+            raise RuntimeError("Overseerr did not return its request list.")
+        results = page.get('results', [])
+        for req in results:
+            if req.get('media', {}).get('tmdbId'):
+                index['by_tmdb'][(_overseerr_media_type(req), req['media']['tmdbId'])] = req
+        total = page.get('pageInfo', {}).get('results')
+        if len(results) < page_size or (total is not None and skip + page_size >= total):
+            return index
+        skip += page_size
+
+def _arr_index(instance_name):
+    """Radarr/Sonarr instance library index from the background sync, or fetched live if there is no fresh one."""
+    index = library_sync.get_data(instance_name)
+    if index is not None:
+        return index
+    items = _fetch_arr_items(instance_name)
+    return _build_arr_index(items) if items is not None else None
+
+def register_sync_sources():
+    """Registers the background sync sources using the intervals from CONFIG['sync']."""
+    intervals = dict(DEFAULT_SYNC_INTERVALS, **CONFIG.get('sync', {}).get('intervals', {}))
+    for server in _plex_servers():
+        library_sync.register_source(server['name'], lambda name=server['name']: _sync_plex(name),
+                                     interval=intervals.get(server['name'], intervals['plex']))
+    for instance in _arr_instances():
+        library_sync.register_source(instance['name'], lambda name=instance['name']: _sync_arr(name),
+                                     interval=intervals.get(instance['name'], intervals[instance['service']]))
+    library_sync.register_source('overseerr', _sync_overseerr, interval=intervals['overseerr'])
+
+# --- Health Checks ---
+# Every configured backend is probed concurrently once at startup, before the bot takes
+# updates, so the pooled connections are open and bad URLs, keys, quality profiles or root
+# folders are logged before a user runs into them. After that the probes run on a schedule
+# as the 'health' sync source; /health shows the latest results next to the first ones.
+
+DEFAULT_HEALTH_INTERVAL = 300
+HEALTH_PROBE_TIMEOUT = 10
+_health_baseline = {}   # backend name -> latency (seconds) of its first successful probe
+
+def _probe_get(service, url, params=None, headers=None):
+    """GET for the health probes: raises on any failure and bypasses the circuit breaker, which must not hide an outage here."""
+    started = time.perf_counter()
+    try:
+        res = _http.get(url, params=params, headers=headers, timeout=HEALTH_PROBE_TIMEOUT)
         res.raise_for_status()
-        if res.status_code in [200, 201] and res.content:
-            return res.json()
-        return {"status": "success", "code": res.status_code}
-    except requests.exceptions.RequestException as e:
-        logger.error(f"POST request failed for {url}: {e}")
-        if e.response is not None:
-            logger.error(f"API Response: {e.response.text}")
-            try:
-                return e.response.json()
-            except json.JSONDecodeError:
-                return {"error": e.response.text}
-        return {"error": str(e)}
+        data = res.json()
+    except (requests.exceptions.RequestException, ValueError) as e:
+        _record_backend_call(service, started, e)
+        raise
+    _record_backend_call(service, started)
+    return data
+
+def _probe_plex(server):
+    started = time.perf_counter()
+    try:
+        root = _connect_plex(server).query('/')
+    except Exception as e:
+        _drop_plex_connection(server)
+        _record_backend_call(server['name'], started, e)
+        raise
+    _record_backend_call(server['name'], started)
+    return f"{root.attrib.get('friendlyName')} {root.attrib.get('version', '')}".strip()
+
+def _probe_tmdb():
+    _probe_get('tmdb', f"{TMDB_API_URL}/configuration", params={'api_key': CONFIG['tmdb']['api_key']})
+    return "OK"
+
+def _probe_arr(instance):
+    """Checks that the instance answers and that the configured quality profiles and root folders exist on it."""
+    base_url = f"{instance['url'].rstrip('/')}/api/v3"
+    headers = {'X-Api-Key': instance['api_key']}
+    status = _probe_get(instance['name'], f"{base_url}/system/status", headers=headers)
+    profiles = {str(profile.get('id')) for profile in _probe_get(instance['name'], f"{base_url}/qualityprofile", headers=headers)}
+    folders = {folder.get('path', '').rstrip('/') for folder in _probe_get(instance['name'], f"{base_url}/rootfolder", headers=headers)}
+    problems = [f"{key} {instance[key]} not found" for key in ('quality_profile_id', 'quality_profile_id_4k')
+                if instance.get(key) and str(instance[key]) not in profiles]
+    problems += [f"{key} {instance[key]} not found" for key in ('root_folder_path', 'root_folder_path_4k')
+                 if instance.get(key) and str(instance[key]).rstrip('/') not in folders]
+    if problems:
+        raise RuntimeError('; '.join(problems))
+    return f"v{status.get('version', '?')}"
+
+def _probe_overseerr():
+    ov_config = CONFIG['overseerr']
+    status = _probe_get('overseerr', f"{ov_config['url'].rstrip('/')}/api/v1/status", headers={'X-Api-Key': ov_config['api_key']})
+    return f"v{status.get('version', '?')}"
+
+def _health_probes():
+    """(backend name, probe) for every configured backend."""
+    probes = [(server['name'], lambda server=server: _probe_plex(server)) for server in _plex_servers()]
+    if CONFIG.get('tmdb', {}).get('api_key'):
+        probes.append(('tmdb', _probe_tmdb))
+    probes += [(instance['name'], lambda instance=instance: _probe_arr(instance)) for instance in _arr_instances()]
+    if all(CONFIG.get('overseerr', {}).get(k) for k in ['url', 'api_key']):
+        probes.append(('overseerr', _probe_overseerr))
+    return probes
+
+def _run_probe(probe):
+    name, check = probe
+    started = time.perf_counter()
+    try:
+        ok, detail = True, check()
+    except Exception as e:
+        ok, detail = False, structured_log.truncate(e, API_RESPONSE_LOG_LIMIT)
+    latency = time.perf_counter() - started
+    if ok:
+        _health_baseline.setdefault(name, latency)
+    else:
+        logger.warning(f"Health check of '{name}' failed: {detail}")
+    metrics.set_gauge(f"health.{name}.ok", int(ok))
+    return name, {'ok': ok, 'detail': detail, 'latency': latency, 'checked_at': datetime.now()}
+
+def run_health_checks():
+    """Probes every configured backend concurrently. Returns {name: {'ok', 'detail', 'latency', 'checked_at'}}."""
+    started = time.perf_counter()
+    results = dict(_fan_out(_run_probe, _health_probes()))
+    healthy = sum(result['ok'] for result in results.values())
+    logger.info(f"Health check: {healthy}/{len(results)} backends healthy in {time.perf_counter() - started:.2f}s.")
+    return results
+
+# --- Availability Notifications ---
+# Approved friend requests are watched (see availability.py) until the title reaches Plex.
+# Each poll reads only what changed since the last one: Radarr/Sonarr import history since
+# a date cursor, and Plex's recently-added list since an addedAt cursor. Plex is only asked
+# when something watched has been imported, or every few polls for titles added by hand.
+
+DEFAULT_AVAILABILITY_INTERVAL = 60
+PLEX_FEED_PAGE_SIZE = 50
+PLEX_FEED_MAX_PAGES = 20
+PLEX_POLL_EVERY = 10
+CLOCK_SKEW_SECONDS = 300
+
+_availability_polls = 0
+
+def _plex_recently_added(plex, since):
+    """Yields Plex items added after the `since` addedAt timestamp, newest first."""
+    for page_number in range(PLEX_FEED_MAX_PAGES):
+        page = plex.query(f"/library/recentlyAdded?includeGuids=1"
+                          f"&X-Plex-Container-Start={page_number * PLEX_FEED_PAGE_SIZE}&X-Plex-Container-Size={PLEX_FEED_PAGE_SIZE}")
+        for element in page:
+            if int(element.attrib.get('addedAt', 0)) <= since:
+                return
+            yield element
+        if len(page) < PLEX_FEED_PAGE_SIZE:
+            return
+
+def _plex_feed_item(element):
+    """Returns (media_type, tmdb_id, title, year) for a recently-added element, or None for other kinds."""
+    attrib = element.attrib
+    kind = attrib.get('type')
+    if kind in ('movie', 'show'):
+        tmdb_ids = [int(g.attrib['id'][len('tmdb://'):]) for g in element.findall('Guid') if g.attrib.get('id', '').startswith('tmdb://')]
+        return kind, (tmdb_ids[0] if tmdb_ids else None), attrib.get('title'), int(attrib.get('year') or 0)
+    if kind == 'season':
+        return 'show', None, attrib.get('parentTitle'), 0
+    if kind == 'episode':
+        return 'show', None, attrib.get('grandparentTitle'), 0
+    return None
+
+def _arr_imports(instance, since):
+    """Returns the import events a Radarr/Sonarr instance recorded since the given ISO date."""
+    url = f"{instance['url'].rstrip('/')}/api/v3/history/since"
+    params = {'date': since, 'eventType': 'downloadFolderImported',
+              'includeMovie' if instance['service'] == 'radarr' else 'includeSeries': 'true'}
+    records = _api_get_request(url, params=params, headers={'X-Api-Key': instance['api_key']}, service=instance['name'])
+    if records is None:
+        raise RuntimeError(f"{_arr_label(instance)} did not return its history.")
+    return records
+
+def _reset_availability_cursors():
+    for server in _plex_servers():
+        availability.set_cursor(server['name'], int(time.time()) - CLOCK_SKEW_SECONDS)
+    since = (datetime.utcnow() - timedelta(seconds=CLOCK_SKEW_SECONDS)).strftime('%Y-%m-%dT%H:%M:%SZ')
+    for instance in _arr_instances():
+        availability.set_cursor(instance['name'], since)
+
+def _notify_available(bot, entry, server_name):
+    lang = CONFIG.get('language')
+    text = get_text('now_available_notification', lang).format(title=entry['title'], server_name=server_name)
+    for chat_id in entry['chat_ids']:
+        try:
+            bot.send_message(chat_id=chat_id, text=text)
+        except Exception as e:
+            logger.error(f"Could not notify chat {chat_id} that '{entry['title']}' is available: {e}")
+
+def _poll_availability(bot):
+    """Reads the change feeds and tells requesters when a watched title is on Plex."""
+    global _availability_polls
+    if any(availability.get_cursor(server['name']) is None for server in _plex_servers()):
+        _reset_availability_cursors()
+    availability.expire(CONFIG.get('availability', {}).get('max_watch_days', availability.MAX_WATCH_DAYS))
+    if not availability.has_watches():
+        # Nothing to look for; start the feeds from "now" when the next watch is added
+        _reset_availability_cursors()
+        return {'watched': 0}
+    _availability_polls += 1
+
+    instances = [instance for instance in _arr_instances() if availability.get_cursor(instance['name'])]
+    feeds = _fan_out(lambda instance: _arr_imports(instance, availability.get_cursor(instance['name'])), instances)
+    for instance, records in zip(instances, feeds):
+        media_type = 'movie' if instance['service'] == 'radarr' else 'show'
+        by_arr_id = None
+        for record in records:
+            tmdb_id = (record.get('movie') or record.get('series') or {}).get('tmdbId')
+            if tmdb_id is None:
+                if by_arr_id is None:
+                    by_arr_id = {item['id']: tmdb for tmdb, item in (_arr_index(instance['name']) or {'by_tmdb': {}})['by_tmdb'].items()
+                                 if 'id' in item}
+                tmdb_id = by_arr_id.get(record.get('movieId') or record.get('seriesId'))
+            availability.mark_imported(media_type, tmdb_id)
+        if records:
+            availability.set_cursor(instance['name'], max(record['date'] for record in records))
+
+    servers = _plex_servers()
+    if not servers:
+        return {'watched': len(availability.watched())}
+
+    notified = 0
+    for server in servers:
+        index = library_sync.get_data(server['name'])
+        if index is None:
+            continue
+        for entry in availability.watched():
+            key = (entry['media_type'], entry['tmdb_id'])
+            if key in index['by_tmdb'] and (found := availability.resolve(key)):
+                _notify_available(bot, found, index['server_name'])
+                notified += 1
+
+    if any(entry['imported_at'] for entry in availability.watched()) or _availability_polls % PLEX_POLL_EVERY == 1:
+        notified += sum(_fan_out(lambda server: _poll_plex_feed(bot, server), servers))
+    return {'watched': len(availability.watched()), 'notified': notified}
+
+def _poll_plex_feed(bot, server):
+    """Matches one Plex server's recently-added items against the watches. Returns how many were notified."""
+    try:
+        plex = _connect_plex(server)
+    except Exception:
+        _drop_plex_connection(server)
+        raise
+    since = availability.get_cursor(server['name'])
+    newest, notified = since, 0
+    for element in _plex_recently_added(plex, since):
+        newest = max(newest, int(element.attrib.get('addedAt', 0)))
+        item = _plex_feed_item(element)
+        if item is None:
+            continue
+        media_type, tmdb_id, title, year = item
+        key = availability.find(media_type, tmdb_id, _normalize_title(title), year, normalize=_normalize_title)
+        if key and (found := availability.resolve(key)):
+            _notify_available(bot, found, plex.friendlyName)
+            notified += 1
+    availability.set_cursor(server['name'], newest)
+    return notified
 
 # --- Media Verification Cascade ---
 
-def check_plex_library(title, year):
-    plex_config = CONFIG.get('plex', {})
-    if not all(plex_config.get(k) for k in ['url', 'token']): return None
+def _nearby_years(year):
+    """The year first, then the years around it: release years often differ by one between Plex, Arr and TMDB."""
+    if not year:
+        return [year]
+    return [year] + [y for delta in range(1, title_index.YEAR_TOLERANCE + 1) for y in (year - delta, year + delta)]
+
+def _check_plex_server(server, title, year, tmdb_id, media_type):
+    """Looks a movie or show up on one Plex server. Returns (title on Plex, server name) or None."""
+    index = library_sync.get_data(server['name'])
+    if index is not None:
+        normalized = _normalize_title(title)
+        found_title = index['by_tmdb'].get((media_type, tmdb_id)) or next(
+            (index['by_title'][(media_type, normalized, y)] for y in _nearby_years(year)
+             if (media_type, normalized, y) in index['by_title']), None)
+        return (found_title, index['server_name']) if found_title else None
+
+    breaker = circuit_breaker.get_breaker(server['name'])
+    if not breaker.allow_request():
+        logger.warning(f"Circuit for '{server['name']}' is open. Skipping Plex library check.")
+        return None
+    started = time.perf_counter()
     try:
-        plex = PlexServer(plex_config['url'], plex_config['token'])
-        results = plex.search(title)
+        plex = _connect_plex(server)
+        results = plex.search(title, mediatype=media_type)
+        breaker.record_success()
+        _record_backend_call(server['name'], started)
         for item in results:
-            if hasattr(item, 'year') and item.year == year and hasattr(item, 'media') and item.media:
-                logger.info(f"Media '{title}' found on Plex.")
-                return get_text('plex_found', CONFIG.get('language')).format(title=item.title, server_name=plex.friendlyName)
+            if getattr(item, 'year', None) in _nearby_years(year) and getattr(item, 'media', None):
+                return item.title, plex.friendlyName
     except Exception as e:
-        logger.error(f"Error checking Plex library: {e}")
+        breaker.record_failure()
+        _record_backend_call(server['name'], started, e)
+        _drop_plex_connection(server)
+        logger.error(f"Error checking Plex library on '{server['name']}': {e}")
     return None
 
+@singleflight.coalesce('plex_check')
+def check_plex_library(title, year, tmdb_id, media_type):
+    """Whether a movie or show ('movie'/'show') is on any Plex server: the 'found' message, or None."""
+    servers = _plex_servers()
+    if not servers: return None
+
+    hit = None
+    if len(servers) == 1:
+        hit = _check_plex_server(servers[0], title, year, tmdb_id, media_type)
+    else:
+        # Ask every server at once and answer with the first one that has it
+        futures = [_fanout_pool.submit(_check_plex_server, server, title, year, tmdb_id, media_type) for server in servers]
+        try:
+            for future in as_completed(futures, timeout=PLEX_CHECK_TIMEOUT):
+                if (hit := future.result()):
+                    break
+        except FutureTimeoutError:
+            logger.warning(f"Plex servers did not all answer within {PLEX_CHECK_TIMEOUT}s while checking '{title}'.")
+
+    if hit:
+        logger.info(f"Media '{title}' found on Plex server '{hit[1]}'.")
+        return get_text('plex_found', CONFIG.get('language')).format(title=hit[0], server_name=hit[1])
+    return None
+
+@singleflight.coalesce('tmdb_search')
 def _search_tmdb(query, media_type):
     """Helper function to search TMDB."""
     lang = CONFIG.get('language')
@@ -520,22 +812,134 @@ def _search_tmdb(query, media_type):
         return [], "TMDB API key not configured."
     
     internal_media_type = 'tv' if media_type == 'show' else 'movie'
-    url = f"https://api.themoviedb.org/3/search/{internal_media_type}"
+    url = f"{TMDB_API_URL}/search/{internal_media_type}"
     params = {'api_key': tmdb_key, 'query': query, 'language': lang, 'include_adult': 'false'}
-    data = _api_get_request(url, params)
+    data = _api_get_request(url, params, service='tmdb')
     
     if data and 'results' in data:
+        _index_tmdb_results(data['results'], media_type)
         return data['results'], None
     return [], f"No results found for '{query}'."
 
+def _index_tmdb_results(results, media_type=None):
+    """Remembers TMDB search results in the title index for autocomplete."""
+    for item in results:
+        item_type = media_type or ('show' if item.get('media_type') == 'tv' else 'movie')
+        release_date = item.get('release_date') or item.get('first_air_date') or ''
+        title_index.add(item_type, item.get('id'), item.get('title') or item.get('name'),
+                        year=int(release_date[:4]) if release_date[:4].isdigit() else 0,
+                        popularity=item.get('popularity'), poster_path=item.get('poster_path'), overview=item.get('overview'))
+
+@singleflight.coalesce('tmdb_search_multi')
+def _search_tmdb_multi(query):
+    """Searches movies and shows in one TMDB call. Returns the results, or None on error."""
+    tmdb_key = CONFIG.get('tmdb', {}).get('api_key')
+    if not tmdb_key: return None
+    url = f"{TMDB_API_URL}/search/multi"
+    params = {'api_key': tmdb_key, 'query': query, 'language': CONFIG.get('language'), 'include_adult': 'false'}
+    data = _api_get_request(url, params, service='tmdb')
+    if not data or 'results' not in data: return None
+    results = [item for item in data['results'] if item.get('media_type') in ('movie', 'tv')]
+    _index_tmdb_results(results)
+    return results
+
+# --- TMDB Media Loader ---
+# Details, watch providers and external ids of a title come from a single TMDB call
+# (append_to_response) and are cached separately, so the streaming check, the Sonarr
+# add and the approval flow reuse one response instead of each making their own call.
+# media_type here is TMDB's own: 'movie' or 'tv'.
+
+TMDB_APPENDED_PARTS = 'watch/providers,external_ids'
+_tmdb_details_cache = cache.get_cache('tmdb_details', ttl=6 * 3600)
+_tmdb_providers_cache = cache.get_cache('tmdb_providers', ttl=6 * 3600)
+_tmdb_external_ids_cache = cache.get_cache('tmdb_external_ids', ttl=7 * 24 * 3600)
+
+@singleflight.coalesce('tmdb_media')
+def _load_tmdb_media(tmdb_id, media_type):
+    """Fetches details, watch providers and external ids in one request and fills the three caches."""
+    tmdb_key = CONFIG.get('tmdb', {}).get('api_key')
+    if not tmdb_key: return None
+    lang = CONFIG.get('language')
+    url = f"{TMDB_API_URL}/{media_type}/{tmdb_id}"
+    params = {'api_key': tmdb_key, 'language': lang, 'append_to_response': TMDB_APPENDED_PARTS}
+    data = _api_get_request(url, params, service='tmdb')
+    if not data: return None
+
+    _tmdb_providers_cache.set((media_type, tmdb_id), data.pop('watch/providers', None) or {'results': {}})
+    _tmdb_external_ids_cache.set((media_type, tmdb_id), data.pop('external_ids', None) or {})
+    _tmdb_details_cache.set((media_type, tmdb_id, lang), data)
+    return data
+
+def _get_tmdb_details(tmdb_id, media_type):
+    details = _tmdb_details_cache.get((media_type, tmdb_id, CONFIG.get('language')))
+    return details if details is not None else _load_tmdb_media(tmdb_id, media_type)
+
+def _get_tmdb_providers(tmdb_id, media_type):
+    providers = _tmdb_providers_cache.get((media_type, tmdb_id))
+    if providers is None and _load_tmdb_media(tmdb_id, media_type):
+        providers = _tmdb_providers_cache.get((media_type, tmdb_id))
+    return providers
+
+def _get_tmdb_external_ids(tmdb_id, media_type):
+    external_ids = _tmdb_external_ids_cache.get((media_type, tmdb_id))
+    if external_ids is None and _load_tmdb_media(tmdb_id, media_type):
+        external_ids = _tmdb_external_ids_cache.get((media_type, tmdb_id))
+    return external_ids
+
+# --- TMDB Prefetch ---
+# Trending, popular and upcoming titles are loaded ahead of time, so the first person to
+# look one up finds its details and watch providers already cached and the title in the
+# autocomplete index. Library status needs no prefetch: it comes from the sync snapshots.
+# Each run makes at most `budget` TMDB requests and skips titles that are still cached.
+
+PREFETCH_LISTS = [
+    ('movie', 'trending/movie/day'), ('tv', 'trending/tv/day'),
+    ('movie', 'movie/popular'), ('tv', 'tv/popular'),
+    ('movie', 'movie/upcoming'), ('tv', 'tv/on_the_air'),
+]
+DEFAULT_PREFETCH_INTERVAL = 3 * 3600   # Shorter than the TMDB cache TTL, so popular titles never expire
+DEFAULT_PREFETCH_BUDGET = 100          # TMDB requests per run
+
+def _prefetch_tmdb(budget=DEFAULT_PREFETCH_BUDGET):
+    """Fills the TMDB caches with the titles on TMDB's lists. Returns a summary, or None without a TMDB key."""
+    tmdb_config = CONFIG.get('tmdb', {})
+    if not tmdb_config.get('api_key'): return None
+    lang = CONFIG.get('language')
+    params = {'api_key': tmdb_config['api_key'], 'language': lang, 'region': tmdb_config.get('region', 'BR')}
+
+    requests_made = 0
+    lists = []
+    for media_type, path in PREFETCH_LISTS:
+        if requests_made >= budget: break
+        data = _api_get_request(f"{TMDB_API_URL}/{path}", params, service='tmdb')
+        requests_made += 1
+        if not data: continue
+        results = [item for item in data.get('results', []) if item.get('id')]
+        _index_tmdb_results(results, 'movie' if media_type == 'movie' else 'show')
+        lists.append([(media_type, item['id']) for item in results])
+
+    # Take the top of every list first, so a small budget still covers each of them
+    titles = list(dict.fromkeys(title for title in chain.from_iterable(zip_longest(*lists)) if title))
+    loaded = 0
+    for media_type, tmdb_id in titles:
+        if requests_made >= budget: break
+        if _tmdb_details_cache.get((media_type, tmdb_id, lang)) is not None \
+                and _tmdb_providers_cache.get((media_type, tmdb_id)) is not None:
+            continue
+        requests_made += 1
+        if _load_tmdb_media(tmdb_id, media_type):
+            loaded += 1
+
+    metrics.increment("prefetch.tmdb_requests", requests_made)
+    logger.info(f"Prefetched {loaded} of {len(titles)} listed TMDB titles with {requests_made} requests.")
+    return {'titles': len(titles), 'loaded': loaded, 'requests': requests_made}
+
 @config_required('TMDB')
 def check_streaming_services(tmdb_id, media_type, title):
     tmdb_config = CONFIG.get('tmdb')
     region = tmdb_config.get('region', 'BR')
     lang = CONFIG.get('language')
-    url = f"https://api.themoviedb.org/3/{media_type}/{tmdb_id}/watch/providers"
-    params = {'api_key': tmdb_config['api_key']}
-    data = _api_get_request(url, params)
+    data = _get_tmdb_providers(tmdb_id, media_type)
     if not data or region not in data.get('results', {}): return None
     
     region_data = data['results'][region]
@@ -565,36 +969,152 @@ def check_overseerr(tmdb_id, media_type):
     ov_config = CONFIG.get('overseerr', {})
     if not all(ov_config.get(k) for k in ['url', 'api_key']): return None
     lang = CONFIG.get('language')
-    internal_media_type = 'tv' if media_type == 'show' else 'movie'
-    url = f"{ov_config['url'].rstrip('/')}/api/v1/request"
-    headers = {'X-Api-Key': ov_config['api_key']}
     
-    all_requests = _api_get_request(url, headers=headers)
+    library_type = 'show' if media_type == 'tv' else 'movie'
+    index = library_sync.get_data('overseerr')
+    if index is not None:
+        req = index['by_tmdb'].get((library_type, tmdb_id))
+        if req:
+            logger.info(f"Media with TMDB ID {tmdb_id} has already been requested on Overseerr.")
+            return get_text('overseerr_found', lang).format(title=req['media'].get('title') or req['media'].get('name'))
+        return None
+
+    all_requests = _fetch_overseerr_requests()
     if all_requests and 'results' in all_requests:
         for req in all_requests['results']:
-            if req['media'].get('tmdbId') == tmdb_id:
+            if req['media'].get('tmdbId') == tmdb_id and _overseerr_media_type(req) == library_type:
                 logger.info(f"Media with TMDB ID {tmdb_id} has already been requested on Overseerr.")
                 title = req['media'].get('title') or req['media'].get('name')
                 return get_text('overseerr_found', lang).format(title=title)
     return None
 
-def add_to_arr_service(media_info, service_name, is_4k=False):
-    config = CONFIG.get(service_name.lower())
+# --- Add Pipeline ---
+# Adding a title to an Arr instance is safe to repeat: one add per (instance, tmdbId) at a
+# time, claimed in the shared state so other replicas see it too, with a lock per title
+# (from a fixed set of striped locks) against double-taps in this process. Transient failures (timeouts, 5xx, 429) are retried
+# with exponential backoff, and before each retry the instance is asked whether the
+# previous attempt went through after all, so a title is never POSTed twice.
+
+ADD_MAX_ATTEMPTS = 4
+ADD_RETRY_BASE_SECONDS = 1.0
+ADD_RETRY_MAX_SECONDS = 8.0
+ADD_CLAIM_SECONDS = 120          # An add still "in progress" after this long is taken to have died
+ADD_RECORD_SECONDS = 600        # Completed adds are remembered this long (until the next Arr sync has them)
+TRANSIENT_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+ADD_LOCK_STRIPES = 64
+
+_add_locks = [threading.Lock() for _ in range(ADD_LOCK_STRIPES)]
+
+def _add_lock(api_path, tmdb_id):
+    """The lock serializing adds of this title in this process, from a fixed set; titles sharing one just wait for each other."""
+    return _add_locks[hash((api_path, tmdb_id)) % ADD_LOCK_STRIPES]
+
+def _claim_add(idempotency_key):
+    """Marks an add as in progress. Returns None if claimed, else the status that blocks it ('adding' or 'added')."""
+    blocked = []
+
+    def claim(current):
+        now = time.time()
+        if current and current['status'] == 'adding' and now - current['at'] < ADD_CLAIM_SECONDS \
+                or current and current['status'] == 'added' and now - current['at'] < ADD_RECORD_SECONDS:
+            blocked[:] = [current['status']]
+            return current
+        blocked[:] = [None]
+        return {'status': 'adding', 'at': now}
+
+    state.get_backend().update('arr_adds', idempotency_key, claim)
+    return blocked[0]
+
+def _finish_add(idempotency_key, added):
+    state.get_backend().update('arr_adds', idempotency_key, lambda current: {'status': 'added', 'at': time.time()} if added else None)
+
+def _find_added_item(instance, api_path, payload):
+    """Asks the instance whether it already has the title (e.g. an attempt that timed out went through)."""
+    id_field = 'tmdbId' if api_path == 'movie' else 'tvdbId'
+    url = f"{instance['url'].rstrip('/')}/api/v3/{api_path}"
+    items = _api_get_request(url, params={id_field: payload[id_field]}, headers={'X-Api-Key': instance['api_key']}, service=instance['name'])
+    # Older versions ignore the filter and return the whole library
+    return next((item for item in items or [] if item.get(id_field) == payload[id_field]), None)
+
+def _post_arr_item(instance, api_path, payload):
+    """POSTs a new item, retrying transient failures. Returns (created or existing item, None) or (None, error text)."""
+    url = f"{instance['url'].rstrip('/')}/api/v3/{api_path}"
+    headers = {'X-Api-Key': instance['api_key']}
+    breaker = circuit_breaker.get_breaker(instance['name'])
+    error = None
+    for attempt in range(ADD_MAX_ATTEMPTS):
+        if attempt:
+            delay = min(ADD_RETRY_BASE_SECONDS * 2 ** (attempt - 1), ADD_RETRY_MAX_SECONDS) * random.uniform(0.8, 1.2)
+            logger.warning(f"Adding '{payload['title']}' to {_arr_label(instance)} failed ({error}); retry {attempt} in {delay:.1f}s.")
+            metrics.increment(f"add.{instance['name']}.retries")
+            time.sleep(delay)
+            if (existing := _find_added_item(instance, api_path, payload)):
+                return existing, None
+        if not breaker.allow_request():
+            return None, f"{instance['name']} is unavailable (circuit open)"
+        started = time.perf_counter()
+        try:
+            res = _http.post(url, json=payload, headers=headers, timeout=20)
+        except requests.exceptions.RequestException as e:
+            _record_breaker_result(breaker, e)
+            _record_backend_call(instance['name'], started, e)
+            error = str(e)
+            continue
+        if res.status_code in TRANSIENT_STATUS_CODES:
+            breaker.record_failure()
+            _record_backend_call(instance['name'], started, requests.exceptions.HTTPError(res.status_code))
+            error = f"HTTP {res.status_code}"
+            continue
+        breaker.record_success()
+        _record_backend_call(instance['name'], started)
+        if res.ok:
+            try:
+                return res.json(), None
+            except ValueError:
+                # Added, but the body is not the new item; the lookup (or our own payload) stands in for it
+                logger.warning(f"{_arr_label(instance)} added '{payload['title']}' but did not return it as JSON.")
+                return _find_added_item(instance, api_path, payload) or dict(payload), None
+        # Rejected, e.g. because an earlier attempt of ours was added after all
+        if (existing := _find_added_item(instance, api_path, payload)):
+            return existing, None
+        return None, structured_log.truncate(res.text, API_RESPONSE_LOG_LIMIT)
+    return None, error
+
+def _record_added_item(instance, media_info, item):
+    """Puts a newly added title into the local sync snapshot and title index, so checks see it right away."""
+    # A stand-in without the Arr's id (see _post_arr_item) waits for the next sync instead
+    if 'id' in item:
+        library_sync.update_data(instance['name'], lambda idx: idx['by_tmdb'].__setitem__(media_info['tmdb_id'], item))
+    title_index.add(media_info['media_type'], media_info['tmdb_id'], media_info['title'], year=media_info.get('year'), source='arr')
+
+def add_to_arr_service(media_info, service_name, is_4k=False, arr_indexes=None):
+    """Adds a title to the right Radarr/Sonarr instance. Returns the result text for the user."""
+    return _add_to_arr(media_info, service_name, is_4k, arr_indexes)[1]
+
+def _add_to_arr(media_info, service_name, is_4k=False, arr_indexes=None):
+    """Returns (whether the title is or will be in the Arr, result text). arr_indexes ({instance name: index}) lets a batch share one library snapshot."""
     lang = CONFIG.get('language')
-
-    quality_key = 'quality_profile_id_4k' if is_4k else 'quality_profile_id'
-    folder_key = 'root_folder_path_4k' if is_4k else 'root_folder_path'
+    instance = _route_arr_instance(media_info, service_name, is_4k)
+    if instance is None:
+        return False, get_text('setup_4k_profile_not_configured' if is_4k else 'service_not_configured', lang).format(service=service_name.capitalize())
+    label = _arr_label(instance)
+
+    # A dedicated 4K instance uses its regular profile; a shared one switches to its 4K profile
+    use_4k_fields = is_4k and not instance.get('4k')
+    quality_key = 'quality_profile_id_4k' if use_4k_fields else 'quality_profile_id'
+    folder_key = 'root_folder_path_4k' if use_4k_fields else 'root_folder_path'
     
-    quality_profile_id = config.get(quality_key)
-    root_folder_path = config.get(folder_key)
+    quality_profile_id = instance.get(quality_key)
+    root_folder_path = instance.get(folder_key)
 
     if not quality_profile_id or not root_folder_path:
-        return get_text('setup_4k_profile_not_configured', lang).format(service=service_name.capitalize())
+        return False, get_text('setup_4k_profile_not_configured', lang).format(service=label)
+
+    # Fail fast instead of waiting on timeouts when the service is known to be down
+    if circuit_breaker.get_breaker(instance['name']).is_open():
+        return False, get_text('service_unavailable', lang).format(service_name=label)
 
     api_path = 'movie' if service_name == 'radarr' else 'series'
-    url = f"{config['url'].rstrip('/')}/api/v3/{api_path}"
-    headers = {'X-Api-Key': config['api_key']}
-    
     payload = {
         "title": media_info['title'],
         "qualityProfileId": int(quality_profile_id),
@@ -605,26 +1125,46 @@ def add_to_arr_service(media_info, service_name, is_4k=False):
     if service_name == 'radarr':
         payload['addOptions'] = {"searchForMovie": True}
     else: # Sonarr
-        payload['languageProfileId'] = int(config.get('language_profile_id', 1))
+        payload['languageProfileId'] = int(instance.get('language_profile_id', 1))
         payload['addOptions'] = {"searchForMissingEpisodes": True}
         tmdb_key = CONFIG.get('tmdb', {}).get('api_key')
-        if not tmdb_key: return "⚠️ TMDB API key not configured to fetch TVDB ID."
-        ids_url = f"https://api.themoviedb.org/3/tv/{media_info['tmdb_id']}/external_ids?api_key={tmdb_key}"
-        external_ids = _api_get_request(ids_url)
+        if not tmdb_key: return False, "⚠️ TMDB API key not configured to fetch TVDB ID."
+        external_ids = _get_tmdb_external_ids(media_info['tmdb_id'], 'tv')
         if not external_ids or not external_ids.get('tvdb_id'):
-            return f"❌ Could not find TVDB ID for '{media_info['title']}'. Cannot add to Sonarr."
+            return False, f"❌ Could not find TVDB ID for '{media_info['title']}'. Cannot add to Sonarr."
         payload['tvdbId'] = external_ids['tvdb_id']
 
-    all_items = _api_get_request(url, headers=headers)
-    if all_items and any(item.get('tmdbId') == media_info['tmdb_id'] for item in all_items):
-        return get_text('service_add_exists', lang).format(title=media_info['title'], service_name=service_name.capitalize())
+    idempotency_key = f"{instance['name']}:{media_info['tmdb_id']}"
+    with _add_lock(api_path, media_info['tmdb_id']):
+        blocked_by = _claim_add(idempotency_key)
+        if blocked_by == 'added':
+            return True, get_text('service_add_exists', lang).format(title=media_info['title'], service_name=label)
+        if blocked_by == 'adding':
+            return True, get_text('service_add_in_progress', lang).format(title=media_info['title'], service_name=label)
 
-    response = _api_post_request(url, json_payload=payload, headers=headers)
-    if response and response.get('title') == media_info['title']:
-        return get_text('service_add_success', lang).format(title=media_info['title'], service_name=service_name.capitalize())
-    
-    logger.error(f"Failed to add to {service_name.capitalize()}. Response: {response}")
-    return get_text('service_add_fail', lang).format(title=media_info['title'], service_name=service_name.capitalize())
+        added = False
+        try:
+            # Duplicates are looked up in every instance of the same quality tier at once,
+            # so a title already in e.g. the anime Sonarr is not added to the regular one too
+            peers = [i for i in _arr_instances(service_name) if bool(i.get('4k')) == bool(instance.get('4k'))]
+            if arr_indexes is not None:
+                indexes = [arr_indexes.get(peer['name']) for peer in peers]
+            else:
+                indexes = _fan_out(lambda peer: _arr_index(peer['name']), peers)
+            holders = [_arr_label(peer) for peer, index in zip(peers, indexes) if index and media_info['tmdb_id'] in index['by_tmdb']]
+            if holders:
+                return True, get_text('service_add_exists', lang).format(title=media_info['title'], service_name=', '.join(holders))
+
+            item, error = _post_arr_item(instance, api_path, payload)
+            if item is not None:
+                added = True
+                _record_added_item(instance, media_info, item)
+                return True, get_text('service_add_success', lang).format(title=media_info['title'], service_name=label)
+        finally:
+            _finish_add(idempotency_key, added)
+
+    logger.error(f"Failed to add to {label}. Response: {error}")
+    return False, get_text('service_add_fail', lang).format(title=media_info['title'], service_name=label)
 
 
 # --- Command Handlers ---
@@ -799,6 +1339,12 @@ def _send_media_card(update: Update, context: CallbackContext, chat_id=None, mes
         sent_message = context.bot.send_photo(effective_chat_id, photo=image_url, caption=caption, reply_markup=keyboard, parse_mode=ParseMode.MARKDOWN)
         context.user_data['search_message_id'] = sent_message.message_id
 
+def _answer_repeated_tap(update: Update, context: CallbackContext):
+    update.callback_query.answer(get_text('callback_already_processing', CONFIG.get('language')))
+
+# Buttons that start lookups, adds or approvals are handled once per tap (see callback_dedup.py);
+# navigation and selection buttons are meant to be tapped repeatedly
+@callback_dedup.once_per_tap(('add_', 'check_'), on_duplicate=_answer_repeated_tap)
 def button_callback_handler(update: Update, context: CallbackContext):
     query = update.callback_query
     query.answer()
@@ -843,14 +1389,47 @@ def button_callback_handler(update: Update, context: CallbackContext):
     elif action == 'check':
         perform_simplified_check(context, media_info, query.message.chat_id)
 
+PENDING_HANDLED_SECONDS = 7 * 86400   # Handled requests are kept this long, so old cards still answer "already handled"
+PENDING_CLEANUP_INTERVAL = 3600
+
+def _prune_handled_requests():
+    """Deletes friend requests that were approved or declined more than PENDING_HANDLED_SECONDS ago."""
+    cutoff = time.time() - PENDING_HANDLED_SECONDS
+
+    def expired(request):
+        return request is not None and request.get('status') != 'pending' and request.get('handled_at', 0) < cutoff
+
+    backend = state.get_backend()
+    stale = [key for key, request in backend.items('pending_requests').items() if expired(request)]
+    for key in stale:
+        backend.update('pending_requests', key, lambda current: None if expired(current) else current)
+    return {'pruned': len(stale)}
+
+def _claim_pending_request(request_key, status):
+    """Marks a pending friend request as handled. Returns False if it was already handled (here or by another replica)."""
+    claimed = []
+
+    def claim(current):
+        claimed[:] = [current is None or current.get('status') == 'pending']
+        return dict(current or {}, status=status, handled_at=time.time()) if claimed[0] else current
+
+    state.get_backend().update('pending_requests', request_key, claim)
+    return claimed[0]
+
+@callback_dedup.once_per_tap(('approve_', 'decline_'), on_duplicate=_answer_repeated_tap)
 def handle_request_approval(update: Update, context: CallbackContext):
     """Handles the admin's response to a friend's request."""
     query = update.callback_query
-    query.answer()
     
     parts = query.data.split('_')
     action = parts[0]
     lang = CONFIG.get('language')
+
+    request_key = '_'.join(parts[2:] if action == 'approve' else parts[1:])
+    if not _claim_pending_request(request_key, 'approved' if action == 'approve' else 'declined'):
+        query.answer(get_text('request_already_handled', lang))
+        return
+    query.answer()
     
     if action == 'approve':
         quality, media_type, tmdb_id_str, friend_id_str = parts[1], parts[2], parts[3], parts[4]
@@ -858,11 +1437,11 @@ def handle_request_approval(update: Update, context: CallbackContext):
         tmdb_id = int(tmdb_id_str)
         friend_id = int(friend_id_str)
 
-        details_url = f"https://api.themoviedb.org/3/{'tv' if media_type == 'show' else 'movie'}/{tmdb_id}"
-        params = {'api_key': CONFIG['tmdb']['api_key'], 'language': lang}
-        item = _api_get_request(details_url, params)
+        item = _get_tmdb_details(tmdb_id, 'tv' if media_type == 'show' else 'movie')
         
         if not item:
+            # Put the request back so the admin can try again
+            state.get_backend().update('pending_requests', request_key, lambda current: dict(current or {}, status='pending'))
             context.bot.send_message(chat_id=CONFIG['admin_user_id'], text="Error fetching media details to approve request.")
             return
 
@@ -872,21 +1451,156 @@ def handle_request_approval(update: Update, context: CallbackContext):
         media_info = {'title': title, 'year': year, 'tmdb_id': tmdb_id, 'media_type': media_type}
         
         service_name = 'radarr' if media_type == 'movie' else 'sonarr'
-        add_result = add_to_arr_service(media_info, service_name, is_4k)
+        added, add_result = _add_to_arr(media_info, service_name, is_4k)
         
         query.edit_message_caption(caption=f"{query.message.caption}\n\n--- \n✅ Request Approved. Result: {add_result}", parse_mode=ParseMode.MARKDOWN)
         context.bot.send_message(chat_id=friend_id, text=get_text('request_approved_notification', lang).format(title=title))
+        if added:
+            availability.watch(media_type, tmdb_id, title, year, friend_id)
 
     elif action == 'decline':
         media_type, tmdb_id_str, friend_id_str = parts[1], parts[2], parts[3]
-        details_url = f"https://api.themoviedb.org/3/{'tv' if media_type == 'show' else 'movie'}/{tmdb_id_str}"
-        params = {'api_key': CONFIG['tmdb']['api_key'], 'language': lang}
-        item = _api_get_request(details_url, params)
+        item = _get_tmdb_details(int(tmdb_id_str), 'tv' if media_type == 'show' else 'movie')
         title = item.get('title') or item.get('name') if item else "your request"
 
         query.edit_message_caption(caption=f"{query.message.caption}\n\n--- \n❌ Request Declined.", parse_mode=ParseMode.MARKDOWN)
         context.bot.send_message(chat_id=int(friend_id_str), text=get_text('request_declined_notification', lang).format(title=title))
 
+# --- Pending Queue ---
+# /pending lists every friend request still waiting for the admin, with buttons to select
+# some, approve the selection, approve all or decline all. Each request is claimed like a
+# single approval, so cards answered elsewhere are skipped. A batch shares one snapshot of
+# the Arr libraries, adds with bounded concurrency, and ends with one summary for the admin
+# and one message per friend.
+
+PENDING_PAGE_SIZE = 20
+BATCH_APPROVAL_CONCURRENCY = 4
+
+def _pending_requests():
+    """Pending friend requests as (key, request) pairs, oldest first."""
+    pending = [(key, request) for key, request in state.get_backend().items('pending_requests').items()
+               if request.get('status') == 'pending']
+    return sorted(pending, key=lambda item: item[1].get('requested_at', 0))
+
+def _pending_view(selected, lang):
+    """Text and keyboard of the pending queue, with the keys in `selected` ticked."""
+    pending = _pending_requests()[:PENDING_PAGE_SIZE]
+    if not pending:
+        return get_text('pending_empty', lang), None
+
+    text = get_text('pending_header', lang).format(count=len(pending))
+    toggles = []
+    for number, (key, request) in enumerate(pending, start=1):
+        icon = '🎬' if request['media_type'] == 'movie' else '📺'
+        text += f"{number}. {icon} *{request['title']}* ({request['year'] or '?'}) - {request.get('friend_name') or request['friend_id']}\n"
+        toggles.append(InlineKeyboardButton(f"{'☑' if key in selected else '☐'} {number}", callback_data=f"pq_t_{key}"))
+
+    buttons = [toggles[i:i + 5] for i in range(0, len(toggles), 5)]
+    buttons.append([InlineKeyboardButton(get_text('pending_approve_selected', lang).format(count=len(selected)), callback_data="pq_as")])
+    buttons.append([InlineKeyboardButton(get_text('pending_approve_all', lang), callback_data="pq_aa"),
+                    InlineKeyboardButton(get_text('pending_decline_all', lang), callback_data="pq_da")])
+    return text, InlineKeyboardMarkup(buttons)
+
+@admin_required
+def pending_cmd(update: Update, context: CallbackContext):
+    """Shows the queue of pending friend requests."""
+    context.user_data['pending_selection'] = []
+    text, markup = _pending_view(set(), CONFIG.get('language'))
+    update.message.reply_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+
+def _approve_one(request, arr_indexes):
+    """Adds one claimed request. Returns (added, result text); never raises, so one failure cannot sink the batch."""
+    media_info = {'title': request['title'], 'year': request['year'], 'tmdb_id': request['tmdb_id'], 'media_type': request['media_type']}
+    service_name = 'radarr' if request['media_type'] == 'movie' else 'sonarr'
+    try:
+        added, result = _add_to_arr(media_info, service_name, arr_indexes=arr_indexes)
+    except Exception as e:
+        logger.error(f"Could not add '{request['title']}' from a batch approval: {e}")
+        return False, get_text('service_add_fail', CONFIG.get('language')).format(title=request['title'], service_name=service_name.capitalize())
+    if added:
+        availability.watch(request['media_type'], request['tmdb_id'], request['title'], request['year'], request['friend_id'])
+    return added, result
+
+def _notify_friends(bot, handled, text_key, lang):
+    """Sends each friend one message listing all of their requests in `handled`."""
+    titles_by_friend = {}
+    for request in handled:
+        titles_by_friend.setdefault(request['friend_id'], []).append(request['title'])
+    for friend_id, titles in titles_by_friend.items():
+        bot.send_message(chat_id=friend_id, text=get_text(text_key, lang).format(titles="\n".join(f"• {title}" for title in titles)))
+
+def _process_pending_batch(bot, keys, approve, lang):
+    """Approves or declines the given pending requests. Returns the summary text for the admin."""
+    claimed = []
+    for key in keys:
+        request = state.get_backend().get('pending_requests', key)[0]
+        if request and _claim_pending_request(key, 'approved' if approve else 'declined'):
+            claimed.append((key, request))
+    if not claimed:
+        return get_text('pending_nothing_to_do', lang)
+
+    if not approve:
+        _notify_friends(bot, [request for _, request in claimed], 'requests_declined_batch_notification', lang)
+        return get_text('pending_declined_summary', lang).format(count=len(claimed))
+
+    # One library snapshot for the whole batch instead of a duplicate scan per request
+    instances = _arr_instances()
+    arr_indexes = dict(zip((instance['name'] for instance in instances), _fan_out(lambda instance: _arr_index(instance['name']), instances)))
+    with ThreadPoolExecutor(max_workers=BATCH_APPROVAL_CONCURRENCY, thread_name_prefix='batch-approval') as pool:
+        outcomes = list(pool.map(lambda item: _approve_one(item[1], arr_indexes), claimed))
+
+    approved = [(request, result) for (_, request), (added, result) in zip(claimed, outcomes) if added]
+    failed = [(key, request, result) for (key, request), (added, result) in zip(claimed, outcomes) if not added]
+    for key, _, _ in failed:
+        # Back into the queue, so the admin can try again
+        state.get_backend().update('pending_requests', key, lambda current: dict(current or {}, status='pending'))
+
+    _notify_friends(bot, [request for request, _ in approved], 'requests_approved_batch_notification', lang)
+    summary = ""
+    if approved:
+        summary += get_text('pending_approved_summary', lang).format(count=len(approved))
+        summary += ''.join(f"• {request['title']}: {result}\n" for request, result in approved)
+    if failed:
+        summary += ("\n" if summary else "") + get_text('pending_failed_summary', lang).format(count=len(failed))
+        summary += ''.join(f"• {request['title']}: {result}\n" for _, request, result in failed)
+    return summary
+
+def pending_toggle_callback(update: Update, context: CallbackContext):
+    """Ticks or unticks a request in the /pending view. Runs in order with the admin's other taps, so none is lost."""
+    query = update.callback_query
+    lang = CONFIG.get('language')
+    if context.user_data.get('role') != 'admin':
+        query.answer(get_text('admin_required', lang))
+        return
+    selected = set(context.user_data.get('pending_selection', [])) ^ {query.data[len('pq_t_'):]}
+    context.user_data['pending_selection'] = sorted(selected)
+    query.answer()
+    text, markup = _pending_view(selected, lang)
+    query.edit_message_text(text, reply_markup=markup, parse_mode=ParseMode.MARKDOWN)
+
+@callback_dedup.once_per_tap(BULK_CALLBACKS, on_duplicate=_answer_repeated_tap)
+def pending_queue_callback(update: Update, context: CallbackContext):
+    """Handles the batch buttons of the /pending view: approve selected, approve all, decline all."""
+    query = update.callback_query
+    lang = CONFIG.get('language')
+    if context.user_data.get('role') != 'admin':
+        query.answer(get_text('admin_required', lang))
+        return
+    selected = set(context.user_data.get('pending_selection', []))
+
+    if query.data == 'pq_as':
+        keys, approve = sorted(selected), True
+    else:
+        keys, approve = [key for key, _ in _pending_requests()[:PENDING_PAGE_SIZE]], query.data == 'pq_aa'
+    if not keys:
+        query.answer(get_text('pending_nothing_selected', lang))
+        return
+    query.answer()
+    query.edit_message_text(get_text('pending_processing', lang).format(count=len(keys)))
+    context.user_data['pending_selection'] = []
+    summary = _process_pending_batch(context.bot, keys, approve, lang)
+    context.bot.send_message(chat_id=query.message.chat_id, text=summary)
+
 def perform_full_check_and_act(context: CallbackContext, media_info: dict, chat_id: int, user_id: int, is_4k: bool = False):
     title, year, tmdb_id = media_info['title'], media_info['year'], media_info['tmdb_id']
     media_type = 'tv' if media_info['media_type'] == 'show' else 'movie'
@@ -894,7 +1608,7 @@ def perform_full_check_and_act(context: CallbackContext, media_info: dict, chat_
     
     status_msg = context.bot.send_message(chat_id, get_text('checking_status', lang).format(title=title))
 
-    if (plex_result := check_plex_library(title, year)):
+    if (plex_result := check_plex_library(title, year, tmdb_id, media_info['media_type'])):
         status_msg.edit_text(plex_result)
         return
 
@@ -917,28 +1631,25 @@ def perform_full_check_and_act(context: CallbackContext, media_info: dict, chat_
     status_msg.delete()
 
 def check_arr_service(media_info, service_name):
-    """Checks if a media item exists in Radarr or Sonarr."""
-    config = CONFIG.get(service_name.lower())
-    if not all(config.get(k) for k in ['url', 'api_key']): return None
-    
-    api_path = 'movie' if service_name == 'radarr' else 'series'
-    url = f"{config['url'].rstrip('/')}/api/v3/{api_path}"
-    headers = {'X-Api-Key': config['api_key']}
+    """Checks if a media item exists in any Radarr or Sonarr instance, asking all of them at once."""
+    instances = _arr_instances(service_name)
+    if not instances: return None
     
-    all_items = _api_get_request(url, headers=headers)
-    if all_items and any(item.get('tmdbId') == media_info['tmdb_id'] for item in all_items):
-        return get_text('check_sonarr_radarr_found', CONFIG.get('language')).format(title=media_info['title'], service_name=service_name.capitalize())
+    indexes = _fan_out(lambda instance: _arr_index(instance['name']), instances)
+    found_in = [_arr_label(instance) for instance, index in zip(instances, indexes) if index and media_info['tmdb_id'] in index['by_tmdb']]
+    if found_in:
+        return get_text('check_sonarr_radarr_found', CONFIG.get('language')).format(title=media_info['title'], service_name=', '.join(found_in))
     return None
 
 def perform_simplified_check(context: CallbackContext, media_info: dict, chat_id: int):
     """Performs a simplified check on Plex and Radarr/Sonarr only."""
-    title, year = media_info['title'], media_info['year']
+    title, year, tmdb_id = media_info['title'], media_info['year'], media_info['tmdb_id']
     service_name = 'radarr' if media_info['media_type'] == 'movie' else 'sonarr'
     lang = CONFIG.get('language')
 
     status_msg = context.bot.send_message(chat_id, get_text('checking_status', lang).format(title=title))
 
-    if (plex_result := check_plex_library(title, year)):
+    if (plex_result := check_plex_library(title, year, tmdb_id, media_info['media_type'])):
         status_msg.edit_text(plex_result)
         return
     
@@ -984,6 +1695,17 @@ def check_cmd(update: Update, context: CallbackContext):
         update.message.reply_text(get_text('check_usage', lang))
         return
 
+    # A close, unambiguous match among library titles is answered without asking TMDB
+    words = context.args[1:]
+    year = int(words[-1]) if len(words) > 1 and words[-1].isdigit() and len(words[-1]) == 4 else None
+    match = title_index.confident_match(" ".join(words[:-1]) if year else query, year, media_type)
+    if match:
+        logger.info(f"/check '{query}' matched library title '{match['title']}' ({match['year']}) locally.")
+        metrics.increment("check.local_match")
+        media_info = {'title': match['title'], 'year': match['year'], 'tmdb_id': match['tmdb_id'], 'media_type': media_type}
+        perform_simplified_check(context, media_info, update.effective_chat.id)
+        return
+
     results, error = _search_tmdb(query, media_type)
     
     if error:
@@ -1033,7 +1755,7 @@ def debug_cmd(update: Update, context: CallbackContext):
     report('debug_tmdb_found', title=title, year=year, tmdb_id=tmdb_id)
     
     report('debug_plex_check')
-    if (plex_result := check_plex_library(title, year)): report('debug_plex_success', plex_result=plex_result)
+    if (plex_result := check_plex_library(title, year, tmdb_id, media_type)): report('debug_plex_success', plex_result=plex_result)
     else: report('debug_plex_fail')
 
     report('debug_streaming_check')
@@ -1047,6 +1769,307 @@ def debug_cmd(update: Update, context: CallbackContext):
 
     report('debug_end')
 
+@admin_required
+def breakers_cmd(update: Update, context: CallbackContext):
+    """Shows the circuit breaker state of every backend called so far."""
+    lang = CONFIG.get('language')
+    breakers = circuit_breaker.all_breakers()
+    if not breakers:
+        update.message.reply_text(get_text('breakers_none', lang))
+        return
+
+    icons = {circuit_breaker.CLOSED: '🟢', circuit_breaker.HALF_OPEN: '🟡', circuit_breaker.OPEN: '🔴'}
+    message = get_text('breakers_header', lang)
+    for status in sorted((b.status() for b in breakers), key=lambda st: st['name']):
+        message += f"{icons[status['state']]} `{status['name']}` - `{status['state']}` ({status['failure_rate']:.0%} of {status['calls_in_window']} calls failed)"
+        if status['state'] == circuit_breaker.OPEN:
+            message += f", next probe in {status['next_probe_in_seconds']:.0f}s"
+        message += "\n"
+    update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+@admin_required
+def sync_cmd(update: Update, context: CallbackContext):
+    """Shows the background library sync status; `/sync now` refreshes everything immediately."""
+    lang = CONFIG.get('language')
+    if not library_sync.all_status():
+        update.message.reply_text(get_text('sync_disabled', lang))
+        return
+    if context.args and context.args[0].lower() == 'now':
+        library_sync.refresh_now()
+        update.message.reply_text(get_text('sync_refresh_started', lang))
+        return
+
+    message = get_text('sync_header', lang)
+    for status in library_sync.all_status():
+        icon = '🟢' if status['fresh'] else ('🔴' if status['failures'] else '⚪')
+        synced_at = status['synced_at'].strftime('%H:%M:%S') if status['synced_at'] else get_text('sync_never', lang)
+        message += f"{icon} `{status['name']}` - {synced_at}"
+        if status['duration'] is not None:
+            message += f" ({status['duration']:.1f}s)"
+        if status['failures']:
+            message += f", {status['failures']} ❌"
+        if status['next_run_at']:
+            message += f", ⏭ {status['next_run_at'].strftime('%H:%M:%S')}"
+        message += "\n"
+    update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+@admin_required
+def health_cmd(update: Update, context: CallbackContext):
+    """Shows the latest backend health check; `/health now` probes every backend first."""
+    lang = CONFIG.get('language')
+    if context.args and context.args[0].lower() == 'now':
+        update.message.reply_text(get_text('health_checking', lang))
+        library_sync.run_now('health')
+    results = library_sync.get_data('health', allow_stale=True)
+    if not results:
+        update.message.reply_text(get_text('health_never', lang))
+        return
+
+    checked_at = max((result['checked_at'] for result in results.values()), default=datetime.now())
+    message = get_text('health_header', lang).format(time=checked_at.strftime('%H:%M:%S'))
+    for name, result in sorted(results.items()):
+        detail = str(result['detail']).replace('`', "'")
+        message += f"{'🟢' if result['ok'] else '🔴'} `{name}` - {result['latency'] * 1000:.0f} ms"
+        if name in _health_baseline:
+            message += f" ({get_text('health_baseline', lang)} {_health_baseline[name] * 1000:.0f} ms)"
+        message += f"\n    `{detail}`\n"
+    update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+def _memory_usage_mb():
+    """Resident memory of this process in MiB (peak usage where the current one is unavailable)."""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+def _collect_stats(dispatcher):
+    """Everything /stats reports, as plain data (also sent as stats.json)."""
+    snap = metrics.snapshot()
+    counters, windows = snap['counters'], snap['windows']
+
+    def latency(name):
+        window = windows.get(name)
+        return {'p50_ms': round(window['p50'] * 1000, 1), 'p95_ms': round(window['p95'] * 1000, 1)} if window else {}
+
+    commands = {name[len('command.'):]: dict(count=count, **latency(name))
+                for name, count in counters.items() if name.startswith('command.')}
+    backends = {}
+    for name in windows:
+        if name.startswith('backend.'):
+            backends[name[len('backend.'):]] = dict(calls=counters.get(f"{name}.calls", 0), errors=counters.get(f"{name}.errors", 0),
+                                                    timeouts=counters.get(f"{name}.timeouts", 0), **latency(name))
+    caches = {}
+    for c in cache.all_caches():
+        hits, misses = counters.get(f"cache.{c.name}.hit", 0), counters.get(f"cache.{c.name}.miss", 0)
+        caches[c.name] = {'size': len(c), 'hit_rate': round(hits / (hits + misses), 3) if hits + misses else None}
+    caches['title_index'] = {'size': title_index.size(), 'hit_rate': None}
+
+    roles = [data.get('role') for data in dispatcher.user_data.values()]
+    memory = _memory_usage_mb()
+    return {
+        'uptime_seconds': round(time.perf_counter() - _LAUNCHED_AT),
+        'commands': commands,
+        'backends': backends,
+        'caches': caches,
+        'queues': {'updates': dispatcher.update_queue.qsize() + snap['gauges'].get('scheduler.queue_depth', 0),
+                   'telegram_outbound': snap['gauges'].get('telegram.queue_depth', 0)},
+        'queue_waits': {name[len('scheduler.wait.'):]: latency(name) for name in windows if name.startswith('scheduler.wait.')},
+        'sessions': {'admins': roles.count('admin'), 'friends': roles.count('friend')},
+        'memory_mb': round(memory, 1) if memory is not None else None,
+    }
+
+@admin_required
+def stats_cmd(update: Update, context: CallbackContext):
+    """Shows live performance counters; `/stats json` sends them as a JSON file."""
+    lang = CONFIG.get('language')
+    stats = _collect_stats(context.dispatcher)
+    if context.args and context.args[0].lower() == 'json':
+        document = io.BytesIO(json.dumps(stats, indent=2, default=str).encode('utf-8'))
+        update.message.reply_document(document=document, filename='stats.json')
+        return
+
+    def latency(entry):
+        return f", p50 {entry['p50_ms']:.0f} / p95 {entry['p95_ms']:.0f} ms" if 'p50_ms' in entry else ""
+
+    uptime = timedelta(seconds=stats['uptime_seconds'])
+    message = get_text('stats_header', lang).format(uptime=uptime, memory=stats['memory_mb'] or '?',
+                                                    admins=stats['sessions']['admins'], friends=stats['sessions']['friends'],
+                                                    update_queue=stats['queues']['updates'], outbound_queue=stats['queues']['telegram_outbound'])
+    message += get_text('stats_commands', lang)
+    for name, entry in sorted(stats['commands'].items(), key=lambda item: -item[1]['count']):
+        message += f"`{name}` - {entry['count']}{latency(entry)}\n"
+    message += get_text('stats_backends', lang)
+    for name, entry in sorted(stats['backends'].items()):
+        message += f"`{name}` - {entry['calls']} calls, {entry['errors']} ❌, {entry['timeouts']} ⏱{latency(entry)}\n"
+    if stats['queue_waits']:
+        message += get_text('stats_queue_waits', lang)
+        for name, entry in sorted(stats['queue_waits'].items()):
+            message += f"`{name}`{latency(entry)}\n"
+    message += get_text('stats_caches', lang)
+    for name, entry in sorted(stats['caches'].items()):
+        hit_rate = f", {entry['hit_rate']:.0%} hits" if entry['hit_rate'] is not None else ""
+        message += f"`{name}` - {entry['size']} entries{hit_rate}\n"
+    update.message.reply_text(message, parse_mode=ParseMode.MARKDOWN)
+
+# --- Profiling ---
+# /profile samples every thread (or cProfiles every handled update) for a while and sends
+# back the hottest functions plus the raw profile; see profiler.py.
+
+PROFILE_REPORT_LINES = 10
+
+def _send_profile_report(bot, chat_id, report):
+    lang = CONFIG.get('language')
+    message = get_text('profile_report_header', lang).format(mode=report['mode'], duration=report['duration'], updates=report['updates'])
+    if report['mode'] == profiler.SAMPLE:
+        message += get_text('profile_samples', lang).format(samples=report['samples'], busy=report['busy_samples'])
+        def value(share): return f"{share:.0%}"
+    else:
+        def value(seconds): return f"{seconds * 1000:.0f} ms"
+    for title, key in (('profile_top_total', 'top'), ('profile_top_self', 'top_self')):
+        message += get_text(title, lang)
+        message += ''.join(f"`{label}` - {value(amount)}\n" for label, amount in report[key][:PROFILE_REPORT_LINES]) or "-\n"
+    bot.send_message(chat_id=chat_id, text=message, parse_mode=ParseMode.MARKDOWN)
+    if report['file']:
+        filename, data = report['file']
+        bot.send_document(chat_id=chat_id, document=io.BytesIO(data), filename=filename)
+
+@admin_required
+def profile_cmd(update: Update, context: CallbackContext):
+    """Profiles the bot: `/profile [cprofile] [<seconds>s] [<updates>]`; `/profile stop` ends the session early."""
+    lang = CONFIG.get('language')
+    args = [arg.lower() for arg in context.args or []]
+    if args[:1] == ['stop']:
+        update.message.reply_text(get_text('profile_stopping' if profiler.stop() else 'profile_not_running', lang))
+        return
+
+    mode = profiler.CPROFILE if 'cprofile' in args else profiler.SAMPLE
+    seconds = next((int(arg[:-1]) for arg in args if arg.endswith('s') and arg[:-1].isdigit()), None)
+    max_updates = next((int(arg) for arg in args if arg.isdigit()), None)
+    if max_updates and not seconds:
+        seconds = profiler.MAX_SECONDS
+    chat_id = update.effective_chat.id
+    try:
+        session = profiler.start(mode, seconds, max_updates,
+                                 on_done=lambda report: _send_profile_report(context.bot, chat_id, report))
+    except profiler.ProfilerBusy:
+        update.message.reply_text(get_text('profile_busy', lang))
+        return
+    limit = get_text('profile_limit_updates', lang).format(updates=session.max_updates) if session.max_updates else ""
+    update.message.reply_text(get_text('profile_started', lang).format(mode=mode, seconds=f"{session.seconds:.0f}", limit=limit))
+
+# --- Inline Mode ---
+# "@bot dune" in any chat lists matching titles as you type. Answers come from the local
+# title index first; TMDB is only asked when the index has too few matches and the user
+# has stopped typing for a moment. That lookup is a JobQueue job scheduled per keystroke,
+# so waiting for the pause never holds a handler thread. Availability badges use the sync
+# indexes only, so no backend is called while building the answer.
+
+INLINE_MIN_QUERY_LENGTH = 2
+INLINE_RESULTS = 10
+INLINE_ENOUGH_LOCAL = 5
+INLINE_DEBOUNCE_SECONDS = 0.4
+INLINE_DEADLINE_SECONDS = 4.0    # Telegram drops answers that take much longer
+INLINE_CACHE_SECONDS = 30
+
+_inline_latest = {}   # user_id -> id of that user's newest inline query, until it has been answered
+_inline_lock = threading.Lock()
+
+def _availability_badges(tmdb_id, media_type, lang):
+    """Badges for a title from the local sync indexes (stale ones included); never calls a backend."""
+    badges = []
+    for server in _plex_servers():
+        index = library_sync.get_data(server['name'], allow_stale=True)
+        if index and (media_type, tmdb_id) in index['by_tmdb']:
+            badges.append(get_text('inline_badge_plex', lang).format(server_name=index['server_name']))
+            break
+    for instance in _arr_instances('radarr' if media_type == 'movie' else 'sonarr'):
+        index = library_sync.get_data(instance['name'], allow_stale=True)
+        if index and tmdb_id in index['by_tmdb']:
+            badges.append(get_text('inline_badge_arr', lang).format(service_name=_arr_label(instance)))
+    index = library_sync.get_data('overseerr', allow_stale=True)
+    if index and (media_type, tmdb_id) in index['by_tmdb']:
+        badges.append(get_text('inline_badge_requested', lang))
+    return badges
+
+def _inline_result(entry, lang):
+    title = f"{entry['title']} ({entry['year']})" if entry['year'] else entry['title']
+    badges = _availability_badges(entry['tmdb_id'], entry['media_type'], lang)
+    status = ' · '.join(badges) or get_text('inline_badge_missing', lang)
+    icon = '🎬' if entry['media_type'] == 'movie' else '📺'
+    message = f"{icon} *{title}*\n{status}"
+    if entry['overview']:
+        message += f"\n\n{entry['overview'][:300]}"
+    return InlineQueryResultArticle(
+        id=f"{entry['media_type']}_{entry['tmdb_id']}",
+        title=f"{icon} {title}",
+        description=status,
+        thumb_url=f"https://image.tmdb.org/t/p/w92{entry['poster_path']}" if entry['poster_path'] else None,
+        input_message_content=InputTextMessageContent(message, parse_mode=ParseMode.MARKDOWN),
+    )
+
+def _is_latest_inline_query(user_id, query_id):
+    with _inline_lock:
+        return _inline_latest.get(user_id) == query_id
+
+def _forget_inline_query(user_id, query_id):
+    """Drops the user's entry once their newest query is answered, so the map only holds users mid-typing."""
+    with _inline_lock:
+        if _inline_latest.get(user_id) == query_id:
+            del _inline_latest[user_id]
+
+def _answer_inline_query(inline_query, entries, lang):
+    inline_query.answer([_inline_result(entry, lang) for entry in entries], cache_time=INLINE_CACHE_SECONDS, is_personal=True)
+
+def _inline_tmdb_lookup(context: CallbackContext):
+    """JobQueue job: tops up an inline answer from TMDB, unless a newer query of the same user superseded it."""
+    inline_query, started, lang = context.job.context
+    if not _is_latest_inline_query(inline_query.from_user.id, inline_query.id):
+        metrics.increment("inline.debounced")
+        return
+    text = inline_query.query.strip()
+    with profiler.profile_update(count=False):
+        future = _fanout_pool.submit(_search_tmdb_multi, text)
+        try:
+            future.result(timeout=max(0.1, INLINE_DEADLINE_SECONDS - (time.monotonic() - started)))
+        except FutureTimeoutError:
+            metrics.increment("inline.tmdb_timeout")
+        try:
+            _answer_inline_query(inline_query, title_index.search(text, limit=INLINE_RESULTS), lang)
+        finally:
+            _forget_inline_query(inline_query.from_user.id, inline_query.id)
+
+def inline_query_handler(update: Update, context: CallbackContext):
+    """Answers inline queries from the title index, topped up by a debounced TMDB search."""
+    inline_query = update.inline_query
+    started = time.monotonic()
+    lang = CONFIG.get('language')
+    if not context.user_data.get('role') or len(inline_query.query.strip()) < INLINE_MIN_QUERY_LENGTH:
+        inline_query.answer([], cache_time=0, is_personal=True)
+        return
+
+    user_id = inline_query.from_user.id
+    with _inline_lock:
+        _inline_latest[user_id] = inline_query.id
+
+    entries = title_index.search(inline_query.query.strip(), limit=INLINE_RESULTS)
+    if len(entries) < INLINE_ENOUGH_LOCAL and CONFIG.get('tmdb', {}).get('api_key') and context.job_queue is not None:
+        # Wait for a pause in typing; a newer query from the same user supersedes this one
+        context.job_queue.run_once(_inline_tmdb_lookup, INLINE_DEBOUNCE_SECONDS, context=(inline_query, started, lang),
+                                   name=f"inline:{user_id}")
+        return
+    metrics.increment("inline.local_only")
+    # Answered here; a lookup still scheduled for an older query of this user is skipped
+    _forget_inline_query(user_id, inline_query.id)
+    _answer_inline_query(inline_query, entries, lang)
+
 def language_cmd(update: Update, context: CallbackContext):
     """Displays buttons for the user to choose the language."""
     lang = CONFIG.get('language')
@@ -1411,23 +2434,91 @@ def unauthenticated_handler(update: Update, context: CallbackContext):
     if not context.user_data.get('role'):
         update.message.reply_text(get_text("unauthenticated_message", 'en')) # Always in English
 
-# --- Main Function ---
-def main() -> None:
-    bot_token = os.getenv("BOT_TOKEN")
-    if not bot_token:
-        logger.critical("BOT_TOKEN environment variable not set.")
-        return
+# --- Request Logging ---
+# Two TypeHandlers in groups of their own run before and after the regular handlers of
+# every update, so each log record written while handling it carries the update's id.
+# The second one also counts and times the update by command for /stats. Handlers that
+# run on the worker pool use the Async*Handler classes instead: their updates are tagged,
+# timed and logged on the worker thread, when the work is actually done.
+
+REQUEST_START_GROUP = -100
+REQUEST_END_GROUP = 100
+UPDATE_KINDS = ('message', 'edited_message', 'callback_query', 'inline_query', 'chosen_inline_result')
+
+def _begin_update_log(update: Update, context: CallbackContext):
+    structured_log.begin_request(f"update-{update.update_id}")
+
+def _update_label(update: Update, kind):
+    """'/check', 'callback:add', 'inline_query', ... for per-command statistics."""
+    if update.message and update.message.text and update.message.text.startswith('/'):
+        return update.message.text.split()[0].split('@')[0]
+    if update.callback_query and update.callback_query.data:
+        return f"callback:{update.callback_query.data.split('_')[0]}"
+    return kind
+
+def _end_update_log(update: Update, context: CallbackContext):
+    duration = structured_log.end_request()
+    if duration is None: return
+    _log_handled_update(update, duration)
+
+def _log_handled_update(update: Update, duration):
+    kind = next((kind for kind in UPDATE_KINDS if getattr(update, kind, None)), 'update')
+    label = _update_label(update, kind)
+    metrics.increment(f"command.{label}")
+    metrics.observe(f"command.{label}", duration)
+    user_id = update.effective_user.id if update.effective_user else None
+    logger.info(f"Handled {kind} {update.update_id} from user {user_id} in {duration * 1000:.0f} ms.",
+                extra={'request_id': f"update-{update.update_id}", 'duration_ms': round(duration * 1000, 1)})
+
+class _AsyncLoggedHandler:
+    """Handler mixin: the callback runs on the worker pool, and the update is logged and timed there when it is done."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, run_async=True, **kwargs)
+        callback = self.callback
+
+        @wraps(callback)
+        def logged_callback(update, context):
+            structured_log.begin_request(f"update-{update.update_id}")
+            try:
+                # Counted as handled when it was handed off; profiled here, where the work happens
+                with profiler.profile_update(count=False):
+                    return callback(update, context)
+            finally:
+                _log_handled_update(update, structured_log.end_request())
 
-    # Initialize the updater without persistence to ensure sessions are not saved.
-    updater = Updater(bot_token, persistence=None, use_context=True)
-    dispatcher = updater.dispatcher
-    
+        self.callback = logged_callback
+
+    def handle_update(self, update, dispatcher, check_result, context=None):
+        promise = super().handle_update(update, dispatcher, check_result, context)
+        # Only handed off so far; _end_update_log must not log it as done
+        structured_log.end_request()
+        return promise
+
+class AsyncCommandHandler(_AsyncLoggedHandler, CommandHandler):
+    """CommandHandler whose callback runs on the worker pool."""
+
+class AsyncCallbackQueryHandler(_AsyncLoggedHandler, CallbackQueryHandler):
+    """CallbackQueryHandler whose callback runs on the worker pool."""
+
+# --- Main Function ---
+def register_handlers(dispatcher) -> None:
+    """Wires every handler into the dispatcher. Also used by benchmarks/load_test.py."""
     # Initialize the friend request module with necessary functions from the main bot
     friend_requests.initialize_request_module(_search_tmdb, check_plex_library, get_text)
 
     # Pass the global CONFIG to the friend_requests module
     dispatcher.bot_data['config'] = CONFIG
+
+    # Optional tuning of the per-backend circuit breakers
+    circuit_breaker.configure(CONFIG.get('circuit_breakers', {}))
+
+    dispatcher.add_handler(TypeHandler(Update, _begin_update_log), group=REQUEST_START_GROUP)
+    dispatcher.add_handler(TypeHandler(Update, _end_update_log), group=REQUEST_END_GROUP)
     
+    # Conversations are stored in the shared state only when the dispatcher has persistence
+    persistent = dispatcher.persistence is not None
+
     login_conv = ConversationHandler(
         entry_points=[CommandHandler('login', login_cmd)],
         states={
@@ -1435,6 +2526,7 @@ def main() -> None:
             AWAIT_LOGIN_PASSWORD: [MessageHandler(Filters.text & ~Filters.command, check_login_credentials)],
         },
         fallbacks=[CommandHandler('cancel', cancel_setup)],
+        name='login', persistent=persistent,
     )
 
     auth_conv = ConversationHandler(
@@ -1442,7 +2534,8 @@ def main() -> None:
         states={
             AWAIT_FRIEND_CODE: [MessageHandler(Filters.text & ~Filters.command, auth_receive_code)]
         },
-        fallbacks=[CommandHandler('cancel', auth_cancel)]
+        fallbacks=[CommandHandler('cancel', auth_cancel)],
+        name='auth', persistent=persistent,
     )
     
     setup_conv = ConversationHandler(
@@ -1473,6 +2566,7 @@ def main() -> None:
             SETUP_OVERSEERR_API_KEY: [MessageHandler(Filters.text & ~Filters.command, setup_overseerr_api_key)],
         },
         fallbacks=[CommandHandler('cancel', cancel_setup)],
+        name='setup', persistent=persistent,
     )
     
     friends_conv = ConversationHandler(
@@ -1482,7 +2576,8 @@ def main() -> None:
             AWAIT_FRIEND_NAME_TO_ADD: [MessageHandler(Filters.text & ~Filters.command, add_friend_get_name)],
             AWAIT_FRIEND_TO_REMOVE: [CallbackQueryHandler(remove_friend_confirm, pattern='^del_friend_|^friend_back_to_menu$')],
         },
-        fallbacks=[CommandHandler('cancel', cancel_setup)]
+        fallbacks=[CommandHandler('cancel', cancel_setup)],
+        name='friends', persistent=persistent,
     )
 
     dispatcher.add_handler(CommandHandler("start", start_cmd))
@@ -1493,6 +2588,13 @@ def main() -> None:
     dispatcher.add_handler(friends_conv)
     dispatcher.add_handler(CommandHandler("help", help_cmd))
     dispatcher.add_handler(CommandHandler("debug", debug_cmd))
+    dispatcher.add_handler(CommandHandler("breakers", breakers_cmd))
+    dispatcher.add_handler(CommandHandler("sync", sync_cmd))
+    dispatcher.add_handler(CommandHandler("stats", stats_cmd))
+    # `/health now` waits for every probe, so it runs on the worker pool
+    dispatcher.add_handler(AsyncCommandHandler("health", health_cmd))
+    dispatcher.add_handler(CommandHandler("pending", pending_cmd))
+    dispatcher.add_handler(CommandHandler("profile", profile_cmd))
     dispatcher.add_handler(CommandHandler("language", language_cmd))
     dispatcher.add_handler(CommandHandler("streaming", streaming_cmd))
     dispatcher.add_handler(CommandHandler("check", check_cmd))
@@ -1503,17 +2605,97 @@ def main() -> None:
     dispatcher.add_handler(CommandHandler("show4k", lambda u, c: search_cmd(u, c, 'show', is_4k=True)))
     dispatcher.add_handler(CallbackQueryHandler(button_callback_handler, pattern="^(add|check|nav)_"))
     dispatcher.add_handler(CallbackQueryHandler(handle_request_approval, pattern="^(approve|decline)_"))
+    dispatcher.add_handler(CallbackQueryHandler(pending_toggle_callback, pattern="^pq_t_"))
+    # Batches can take a while; they run on the worker pool instead of holding up other updates
+    dispatcher.add_handler(AsyncCallbackQueryHandler(pending_queue_callback, pattern=f"^({'|'.join(BULK_CALLBACKS)})$"))
     dispatcher.add_handler(CallbackQueryHandler(set_language_callback, pattern="^lang_"))
+    # Answers right away; a TMDB top-up waits for a pause in typing on the JobQueue
+    dispatcher.add_handler(InlineQueryHandler(inline_query_handler))
 
 
     # This handler catches any message or command not handled above
     # It must be added last among the message/command handlers
     dispatcher.add_handler(MessageHandler(Filters.all, unauthenticated_handler))
 
+def main() -> None:
+    global CONFIG
+    # Logging is set up once, from the optional "logging" section; load_config's own warnings go to stderr
+    CONFIG = load_config()
+    setup_logging(CONFIG.get('logging'))
+    bot_token = os.getenv("BOT_TOKEN")
+    if not bot_token:
+        logger.critical("BOT_TOKEN environment variable not set.")
+        return
 
-    updater.start_polling()
-    logger.info("Bot started and listening for commands...")
+    # Optional recording or replay of all backend traffic (see cassette.py)
+    cassette.configure(_http, CONFIG.get('cassette'), secrets=_config_secrets(CONFIG), **HTTP_POOL)
+
+    # All message sends/edits/deletes go through a rate-limited scheduler to stay clear of Telegram flood control
+    scheduler = send_scheduler.OutboundScheduler(CONFIG.get('telegram_rate_limits'), priority_for_chat=_outbound_priority)
+    scheduler.start()
+    # Updates are handled on a few threads in priority and fair-share order rather than one by one as they arrive
+    inbound = update_scheduler.UpdateScheduler(CONFIG.get('update_scheduler'), priority_for_update=_update_priority)
+    # Updater's own default pool (workers + 4) plus one connection per sender and handler thread
+    request = Request(con_pool_size=8 + int(scheduler.limits['sender_threads']) + int(inbound.settings['handler_threads']))
+    bot = send_scheduler.ScheduledBot(bot_token, scheduler=scheduler, request=request)
+
+    # Sessions are only kept when a shared state backend is configured; with the default
+    # in-memory backend the updater runs without persistence, so sessions are not saved.
+    state.configure(CONFIG.get('state'))
+    persistence = state.StatePersistence(state.get_backend()) if state.is_shared() else None
+    job_queue = JobQueue()
+    dispatcher = update_scheduler.SchedulingDispatcher(bot, Queue(), job_queue=job_queue, persistence=persistence,
+                                                       use_context=True, scheduler=inbound.start())
+    job_queue.set_dispatcher(dispatcher)
+    updater = Updater(dispatcher=dispatcher, workers=None)
+    register_handlers(updater.dispatcher)
+
+    if CONFIG.get('sync', {}).get('enabled', True):
+        register_sync_sources()
+    availability_config = CONFIG.get('availability', {})
+    if availability_config.get('enabled', True):
+        library_sync.register_source('availability', lambda: _poll_availability(updater.bot),
+                                     interval=availability_config.get('interval', DEFAULT_AVAILABILITY_INTERVAL))
+    prefetch_config = CONFIG.get('prefetch', {})
+    if prefetch_config.get('enabled', True):
+        library_sync.register_source('prefetch', lambda: _prefetch_tmdb(prefetch_config.get('budget', DEFAULT_PREFETCH_BUDGET)),
+                                     interval=prefetch_config.get('interval', DEFAULT_PREFETCH_INTERVAL))
+    library_sync.register_source('pending_cleanup', _prune_handled_requests, interval=PENDING_CLEANUP_INTERVAL)
+    health_config = CONFIG.get('health', {})
+    health_source = None
+    if health_config.get('enabled', True):
+        health_source = library_sync.register_source('health', run_health_checks,
+                                                     interval=health_config.get('interval', DEFAULT_HEALTH_INTERVAL))
+    # Warm restart: caches, sync snapshots and the title index come back from the last snapshot
+    snapshot_config = CONFIG.get('snapshot', {})
+    snapshot_path = snapshot_config.get('path', snapshot.DEFAULT_PATH)
+    if snapshot_config.get('enabled', True):
+        snapshot.register('caches', cache.export_all, cache.restore_all)
+        snapshot.register('library_sync', library_sync.export_data, library_sync.restore_data)
+        snapshot.register('title_index', title_index.export_entries, title_index.restore_entries, background=True)
+        snapshot.restore(snapshot_path)
+        library_sync.register_source('snapshot', lambda: snapshot.save(snapshot_path),
+                                     interval=snapshot_config.get('interval', snapshot.DEFAULT_INTERVAL))
+    # Warm-up: probe every backend (and open the pooled connections) before the first update arrives
+    if health_source is not None:
+        health_source.run()
+    library_sync.start(updater.job_queue)
+
+    # Several replicas can only share the load behind a webhook; polling allows a single process
+    webhook = CONFIG.get('webhook', {})
+    if webhook.get('url'):
+        url_path = webhook.get('url_path', bot_token)
+        updater.start_webhook(listen=webhook.get('listen', '0.0.0.0'), port=int(webhook.get('port', 8443)),
+                              url_path=url_path, webhook_url=f"{webhook['url'].rstrip('/')}/{url_path}")
+    else:
+        updater.start_polling()
+    logger.info(f"Bot started and listening for commands ({time.perf_counter() - _LAUNCHED_AT:.2f}s after launch)...")
     updater.idle()
+    scheduler.stop()
+    if snapshot_config.get('enabled', True):
+        snapshot.save(snapshot_path)
+    cassette.stop(CONFIG.get('cassette'))
+    structured_log.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,107 @@
+# cache.py
+#
+# Small in-memory TTL caches shared by the bot. Each named cache is a bounded
+# LRU map whose entries expire after a fixed time, so data that rarely changes
+# (TMDB details, watch providers, external ids) is fetched once and reused by
+# every function that needs it.
+
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+DEFAULT_TTL = 3600          # Seconds an entry stays valid
+DEFAULT_MAX_ENTRIES = 2000  # Least recently used entries are evicted beyond this
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Thread-safe LRU map with a per-cache time to live."""
+
+    def __init__(self, name, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+        self.name = name
+        self.ttl = float(ttl)
+        self.max_entries = int(max_entries)
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is not _MISSING and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                metrics.increment(f"cache.{self.name}.hit")
+                return entry[1]
+            if entry is not _MISSING:
+                del self._entries[key]
+        metrics.increment(f"cache.{self.name}.miss")
+        return default
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def export_entries(self):
+        """Returns [(key, expires at as a wall-clock timestamp, value)] for the unexpired entries, oldest first."""
+        with self._lock:
+            now, wall_now = time.monotonic(), time.time()
+            return [(key, wall_now + expires_at - now, value) for key, (expires_at, value) in self._entries.items() if expires_at > now]
+
+    def restore_entries(self, entries):
+        """Adds entries from export_entries() that have not expired since, keeping this cache's TTL as the upper bound."""
+        with self._lock:
+            now, wall_now = time.monotonic(), time.time()
+            for key, expires_at, value in entries:
+                remaining = min(expires_at - wall_now, self.ttl)
+                if remaining > 0 and key not in self._entries:
+                    self._entries[key] = (now + remaining, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_caches = {}
+_registry_lock = threading.Lock()
+
+
+def get_cache(name, ttl=DEFAULT_TTL, max_entries=DEFAULT_MAX_ENTRIES):
+    """Returns the cache with this name, creating it with the given settings on first use."""
+    with _registry_lock:
+        if name not in _caches:
+            _caches[name] = TTLCache(name, ttl, max_entries)
+        return _caches[name]
+
+
+def all_caches():
+    with _registry_lock:
+        return list(_caches.values())
+
+
+def export_all():
+    """Contents of every cache, for snapshot.py."""
+    return {cache.name: cache.export_entries() for cache in all_caches()}
+
+
+def restore_all(data, saved_at=None):
+    """Refills the caches that exist in this process from export_all() output."""
+    with _registry_lock:
+        caches = dict(_caches)
+    for name, entries in data.items():
+        if name in caches:
+            caches[name].restore_entries(entries)
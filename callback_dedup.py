@@ -0,0 +1,80 @@
+# callback_dedup.py
+#
+# Double-tap protection for inline buttons. A tap is identified by its
+# (chat, message, callback data). While the first tap of a button is being
+# handled, and for a few seconds afterwards, identical taps are answered (so
+# the button stops spinning) and dropped instead of starting the same lookups
+# and Radarr/Sonarr adds again. Taps are only remembered in this process; adds
+# and approvals are additionally claimed in the shared state.
+
+import threading
+import time
+from functools import wraps
+
+import metrics
+
+DEFAULT_TTL = 10   # Seconds a handled tap is still remembered
+MAX_REMEMBERED = 5000
+
+_lock = threading.Lock()
+_taps = {}   # (chat_id, message_id, data) -> expiry (monotonic), or None while in flight
+
+
+def _prune(now):
+    for key in [key for key, expires_at in _taps.items() if expires_at is not None and expires_at <= now]:
+        del _taps[key]
+
+
+def claim(key):
+    """Returns True if this is the first tap of `key` (which is now in flight), False for a repeat."""
+    now = time.monotonic()
+    with _lock:
+        if key in _taps:
+            expires_at = _taps[key]
+            if expires_at is None or expires_at > now:
+                return False
+        if len(_taps) >= MAX_REMEMBERED:
+            _prune(now)
+        _taps[key] = None
+        return True
+
+
+def release(key, ttl=DEFAULT_TTL):
+    """Marks the tap as handled; repeats are still dropped for `ttl` seconds."""
+    with _lock:
+        if ttl > 0:
+            _taps[key] = time.monotonic() + ttl
+        else:
+            _taps.pop(key, None)
+
+
+def once_per_tap(prefixes, on_duplicate=None, ttl=DEFAULT_TTL):
+    """Decorator for callback query handlers: buttons whose data starts with one of `prefixes` are handled once per tap.
+
+    on_duplicate(update, context) answers a dropped repeat; by default it is answered without text.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapped(update, context, *args, **kwargs):
+            query = update.callback_query
+            if query is None or query.message is None or not (query.data or '').startswith(prefixes):
+                return func(update, context, *args, **kwargs)
+            key = (query.message.chat_id, query.message.message_id, query.data)
+            if not claim(key):
+                metrics.increment("callbacks.duplicate_dropped")
+                if on_duplicate is not None:
+                    on_duplicate(update, context)
+                else:
+                    query.answer()
+                return None
+            try:
+                return func(update, context, *args, **kwargs)
+            finally:
+                release(key, ttl)
+        return wrapped
+    return decorator
+
+
+def in_flight_count():
+    with _lock:
+        return sum(1 for expires_at in _taps.values() if expires_at is None)
@@ -0,0 +1,276 @@
+# cassette.py
+#
+# Record and replay of backend traffic. In record mode every request made
+# through the bot's pooled HTTP session (TMDB, Plex, Radarr, Sonarr, Overseerr)
+# is kept with its response, or the error it raised, and how long it took. API
+# keys and tokens are replaced by "***" before anything is stored, and the
+# interactions are written to one gzip-compressed JSON file every few hundred
+# interactions, when the limit is reached and when the bot stops, so a crash
+# or a kill loses little of the session.
+# In replay mode the same session is answered from such a file, with the
+# recorded latencies (optionally scaled) and without touching the network, so a
+# slow flow seen in production can be reproduced offline (see
+# benchmarks/replay.py). Telegram traffic is not part of it.
+
+import base64
+import gzip
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "mode": None,                       # "record", "replay" or None
+    "path": "config/cassette.json.gz",
+    "latency_scale": 1.0,               # Replay: recorded latency multiplier (0 answers right away)
+    "max_interactions": 20000,          # Record: later requests are not kept
+    "flush_every": 500,                 # Record: write the file every this many interactions (0: only at stop)
+}
+FORMAT_VERSION = 1
+MASK = "***"
+SECRET_PARAMS = ('api_key', 'apikey', 'x-plex-token', 'token')
+SECRET_HEADERS = ('x-api-key', 'x-plex-token', 'authorization', 'cookie', 'set-cookie')
+
+_recorder = None
+
+
+class CassetteError(Exception):
+    """The cassette file is missing, unreadable or from another format version."""
+
+
+class Scrubber:
+    """Masks secrets in URLs, headers and bodies: known secret values anywhere, and secret parameters and headers by name."""
+
+    def __init__(self, secrets=()):
+        self.secrets = sorted({str(secret) for secret in secrets if secret and len(str(secret)) >= 4}, key=len, reverse=True)
+
+    def text(self, text):
+        for secret in self.secrets:
+            text = text.replace(secret, MASK)
+        return text
+
+    def url(self, url):
+        """The URL with secret query parameters masked and the parameters sorted, so equal requests compare equal."""
+        parts = urlsplit(url)
+        query = sorted((name, MASK if name.lower() in SECRET_PARAMS else value)
+                       for name, value in parse_qsl(parts.query, keep_blank_values=True))
+        return self.text(urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), '')))
+
+    def headers(self, headers):
+        return {name: MASK if name.lower() in SECRET_HEADERS else self.text(str(value)) for name, value in headers.items()}
+
+    def body(self, body):
+        if body is None:
+            return b''
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if not self.secrets:
+            return body
+        try:
+            return self.text(body.decode('utf-8')).encode('utf-8')
+        except UnicodeDecodeError:
+            return body
+
+
+def _request_key(scrubber, method, url, body):
+    return method.upper(), scrubber.url(url), hashlib.sha256(scrubber.body(body)).hexdigest()
+
+
+def _encode_body(content):
+    try:
+        return {'text': content.decode('utf-8')}
+    except UnicodeDecodeError:
+        return {'base64': base64.b64encode(content).decode('ascii')}
+
+
+def _decode_body(entry):
+    return entry['text'].encode('utf-8') if 'text' in entry else base64.b64decode(entry.get('base64', ''))
+
+
+# --- Recording ---
+
+class Recorder:
+    """Collects scrubbed interactions in memory; with a path, also writes them there every flush_every interactions."""
+
+    def __init__(self, scrubber, max_interactions=DEFAULT_SETTINGS['max_interactions'], path=None,
+                 flush_every=DEFAULT_SETTINGS['flush_every']):
+        self.scrubber = scrubber
+        self.max_interactions = max_interactions
+        self.path = path
+        self.flush_every = flush_every
+        self._interactions = []
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def add(self, request, latency, response=None, error=None):
+        method, url, body_digest = _request_key(self.scrubber, request.method, request.url, request.body)
+        interaction = {'method': method, 'url': url, 'body_sha256': body_digest, 'latency': round(latency, 4),
+                       'recorded_at': time.time()}
+        if error is not None:
+            interaction['error'] = {'type': type(error).__name__, 'message': self.scrubber.text(str(error))}
+        else:
+            content = self.scrubber.body(response.content)
+            interaction['response'] = dict(status=response.status_code, reason=response.reason,
+                                           headers=self.scrubber.headers(response.headers), **_encode_body(content))
+        with self._lock:
+            if len(self._interactions) >= self.max_interactions:
+                metrics.increment("cassette.not_recorded")
+                return
+            self._interactions.append(interaction)
+            count = len(self._interactions)
+        if self.path and (count == self.max_interactions or self.flush_every and count % self.flush_every == 0):
+            # Written in the background so the request that filled the batch is not held up
+            threading.Thread(target=self._flush, name='cassette-flush', daemon=True).start()
+
+    def _flush(self):
+        try:
+            self.save(self.path)
+        except OSError as e:
+            logger.error(f"Could not write the cassette to {self.path}: {e}")
+
+    def __len__(self):
+        with self._lock:
+            return len(self._interactions)
+
+    def save(self, path):
+        """Writes the interactions to path (atomically). Returns how many were written."""
+        with self._save_lock:
+            with self._lock:
+                interactions = list(self._interactions)
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            temporary = f"{path}.tmp"
+            with gzip.open(temporary, 'wt', encoding='utf-8') as f:
+                json.dump({'version': FORMAT_VERSION, 'saved_at': time.time(), 'interactions': interactions}, f)
+            os.replace(temporary, path)
+        logger.info(f"Wrote {len(interactions)} recorded backend interactions to {path}.")
+        return len(interactions)
+
+
+class RecordingAdapter(HTTPAdapter):
+    """HTTPAdapter that sends for real and hands every request and outcome to a Recorder."""
+
+    def __init__(self, recorder, **kwargs):
+        super().__init__(**kwargs)
+        self.recorder = recorder
+
+    def send(self, request, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = super().send(request, **kwargs)
+            response.content  # The body is part of the latency, and of the recording
+        except requests.exceptions.RequestException as e:
+            self.recorder.add(request, time.perf_counter() - started, error=e)
+            raise
+        self.recorder.add(request, time.perf_counter() - started, response=response)
+        return response
+
+
+# --- Replay ---
+
+def load(path):
+    """Reads the interactions of a cassette file."""
+    try:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        raise CassetteError(f"Cannot read cassette {path}: {e}")
+    if data.get('version') != FORMAT_VERSION:
+        raise CassetteError(f"{path} has format version {data.get('version')}, expected {FORMAT_VERSION}.")
+    return data['interactions']
+
+
+class ReplayAdapter(BaseAdapter):
+    """Answers requests from recorded interactions, in recorded order; the last one repeats when a request is made more often."""
+
+    def __init__(self, interactions, scrubber, latency_scale=1.0):
+        super().__init__()
+        self.scrubber = scrubber
+        self.latency_scale = float(latency_scale)
+        self._queues = {}
+        self._last = {}
+        self._lock = threading.Lock()
+        for interaction in interactions:
+            key = (interaction['method'], interaction['url'], interaction['body_sha256'])
+            self._queues.setdefault(key, deque()).append(interaction)
+
+    def _next(self, key):
+        with self._lock:
+            recorded = self._queues.get(key)
+            if recorded:
+                self._last[key] = recorded.popleft()
+            return self._last.get(key)
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        interaction = self._next(_request_key(self.scrubber, request.method, request.url, request.body))
+        if interaction is None:
+            metrics.increment("cassette.miss")
+            raise requests.exceptions.ConnectionError(f"No recorded response for {request.method} {self.scrubber.url(request.url)}",
+                                                      request=request)
+        metrics.increment("cassette.hit")
+        if self.latency_scale > 0:
+            time.sleep(interaction['latency'] * self.latency_scale)
+        if 'error' in interaction:
+            error_class = getattr(requests.exceptions, interaction['error']['type'], requests.exceptions.ConnectionError)
+            raise error_class(interaction['error']['message'], request=request)
+
+        recorded = interaction['response']
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.reason = recorded.get('reason')
+        response.headers = CaseInsensitiveDict(recorded.get('headers') or {})
+        response.headers.pop('Content-Encoding', None)  # Stored decoded
+        response._content = _decode_body(recorded)
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+# --- Setup ---
+
+def configure(session, settings=None, secrets=(), **adapter_kwargs):
+    """Mounts a recording or replaying adapter on `session` per the optional CONFIG['cassette'] section.
+
+    secrets are values (API keys, tokens) masked wherever they appear; adapter_kwargs go to the recording HTTPAdapter.
+    """
+    global _recorder
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    scrubber = Scrubber(secrets)
+    if settings['mode'] == 'record':
+        _recorder = Recorder(scrubber, settings['max_interactions'], settings['path'], settings['flush_every'])
+        adapter = RecordingAdapter(_recorder, **adapter_kwargs)
+        logger.info(f"Recording backend traffic to {settings['path']}.")
+    elif settings['mode'] == 'replay':
+        interactions = load(settings['path'])
+        adapter = ReplayAdapter(interactions, scrubber, settings['latency_scale'])
+        logger.info(f"Replaying {len(interactions)} recorded backend interactions from {settings['path']}.")
+    else:
+        return None
+    for scheme in ('http://', 'https://'):
+        session.mount(scheme, adapter)
+    return adapter
+
+
+def stop(settings=None):
+    """Writes out the recording, if one is running."""
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.save(dict(DEFAULT_SETTINGS, **(settings or {}))['path'])
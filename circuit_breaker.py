@@ -0,0 +1,158 @@
+# circuit_breaker.py
+#
+# Per-backend circuit breakers. When a backend keeps failing, its breaker opens
+# and calls are skipped immediately instead of waiting for the request timeout.
+# After a cool-down a limited number of probe calls are let through (half-open);
+# a successful probe closes the breaker, a failed one re-opens it with a longer
+# cool-down.
+
+import threading
+import time
+from collections import deque
+
+import metrics
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+DEFAULT_SETTINGS = {
+    "failure_rate_threshold": 0.5,  # Open when at least this share of recent calls failed...
+    "minimum_calls": 4,             # ...and at least this many calls are in the window
+    "window_size": 20,              # Number of recent calls considered
+    "open_seconds": 30,             # First cool-down before a probe is allowed
+    "max_open_seconds": 300,        # Cool-down doubles after each failed probe, up to this
+    "half_open_max_calls": 1,       # Concurrent probe calls allowed while half-open
+}
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker driven by the failure rate of recent calls."""
+
+    def __init__(self, name, settings=None):
+        self.name = name
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self._lock = threading.Lock()
+        self._results = deque(maxlen=int(self.settings['window_size']))
+        self._state = CLOSED
+        self._open_seconds = float(self.settings['open_seconds'])
+        self._next_probe_at = 0.0
+        self._probes_in_flight = 0
+        self._opened_at = None
+        metrics.set_gauge(f"circuit.{name}.state", _STATE_GAUGE[CLOSED])
+
+    def _transition(self, new_state):
+        if new_state == self._state:
+            return
+        self._state = new_state
+        metrics.set_gauge(f"circuit.{self.name}.state", _STATE_GAUGE[new_state])
+        metrics.increment(f"circuit.{self.name}.{new_state}")
+
+    def _trip(self, now):
+        self._transition(OPEN)
+        self._opened_at = now
+        self._next_probe_at = now + self._open_seconds
+        self._probes_in_flight = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def is_open(self):
+        """True while calls would be skipped. Unlike allow_request() this never claims a probe slot."""
+        with self._lock:
+            if self._state == OPEN:
+                return time.monotonic() < self._next_probe_at
+            if self._state == HALF_OPEN:
+                return self._probes_in_flight >= self.settings['half_open_max_calls']
+            return False
+
+    def allow_request(self):
+        """Returns True if a call may go through, moving an expired open breaker to half-open."""
+        with self._lock:
+            now = time.monotonic()
+            if self._state == OPEN and now >= self._next_probe_at:
+                self._transition(HALF_OPEN)
+            if self._state == HALF_OPEN:
+                if self._probes_in_flight < self.settings['half_open_max_calls']:
+                    self._probes_in_flight += 1
+                    return True
+            elif self._state == CLOSED:
+                return True
+        metrics.increment(f"circuit.{self.name}.short_circuited")
+        return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._results.clear()
+                self._open_seconds = float(self.settings['open_seconds'])
+                self._probes_in_flight = 0
+                self._opened_at = None
+                self._transition(CLOSED)
+            self._results.append(True)
+
+    def record_failure(self):
+        metrics.increment(f"circuit.{self.name}.failures")
+        with self._lock:
+            now = time.monotonic()
+            if self._state == HALF_OPEN:
+                self._open_seconds = min(self._open_seconds * 2, float(self.settings['max_open_seconds']))
+                self._trip(now)
+                return
+            self._results.append(False)
+            failures = self._results.count(False)
+            if (self._state == CLOSED and len(self._results) >= self.settings['minimum_calls']
+                    and failures / len(self._results) >= self.settings['failure_rate_threshold']):
+                self._trip(now)
+
+    def reset(self):
+        with self._lock:
+            self._results.clear()
+            self._open_seconds = float(self.settings['open_seconds'])
+            self._probes_in_flight = 0
+            self._opened_at = None
+            self._transition(CLOSED)
+
+    def status(self):
+        """Returns a snapshot of the breaker's state for display."""
+        with self._lock:
+            now = time.monotonic()
+            total = len(self._results)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'failure_rate': (self._results.count(False) / total) if total else 0.0,
+                'calls_in_window': total,
+                'open_for_seconds': (now - self._opened_at) if self._opened_at else 0.0,
+                'next_probe_in_seconds': max(0.0, self._next_probe_at - now) if self._state == OPEN else 0.0,
+            }
+
+
+_breakers = {}
+_registry_lock = threading.Lock()
+_settings = {}
+
+
+def configure(settings):
+    """Applies settings from CONFIG['circuit_breakers']: shared keys plus optional per-backend overrides."""
+    global _settings
+    with _registry_lock:
+        _settings = dict(settings or {})
+        _breakers.clear()
+
+
+def get_breaker(name):
+    """Returns the breaker for a backend, creating it on first use."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            shared = {k: v for k, v in _settings.items() if k in DEFAULT_SETTINGS}
+            shared.update(_settings.get(name, {}))
+            breaker = _breakers[name] = CircuitBreaker(name, shared)
+        return breaker
+
+
+def all_breakers():
+    with _registry_lock:
+        return list(_breakers.values())
@@ -1,15 +1,21 @@
 # friend_requests.py
 
-from datetime import datetime, timedelta
+import logging
+import time
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ParseMode
 from telegram.ext import CallbackContext
 
+import state
+
+logger = logging.getLogger(__name__)
+
 # These will be initialized by the main bot
 _search_tmdb = None
 _check_plex_library = None
 _get_text = None
 
-REQUEST_LIMITS = {}
+# Request timestamps per user live in the shared state ('request_limits' namespace) so
+# every bot replica enforces the same daily limit
 MAX_REQUESTS_PER_DAY = 3
 
 def initialize_request_module(search_tmdb_func, check_plex_func, get_text_func):
@@ -19,22 +25,26 @@ def initialize_request_module(search_tmdb_func, check_plex_func, get_text_func):
     _check_plex_library = check_plex_func
     _get_text = get_text_func
 
+def _recent_requests(timestamps, now):
+    return [t for t in timestamps or [] if now - t < 24 * 3600]
+
 def _check_rate_limit(user_id):
     """Checks if a user has exceeded their daily request limit."""
-    now = datetime.now()
-    # Clean up old user entries
-    for uid in list(REQUEST_LIMITS.keys()):
-        valid_requests = [req_time for req_time in REQUEST_LIMITS[uid] if now - req_time < timedelta(days=1)]
-        if not valid_requests:
-            del REQUEST_LIMITS[uid]
-        else:
-            REQUEST_LIMITS[uid] = valid_requests
-            
-    user_requests = REQUEST_LIMITS.get(user_id, [])
-    
-    if len(user_requests) >= MAX_REQUESTS_PER_DAY:
-        return False
-    return True
+    timestamps, _ = state.get_backend().get('request_limits', user_id)
+    return len(_recent_requests(timestamps, time.time())) < MAX_REQUESTS_PER_DAY
+
+def _record_request(user_id):
+    """Counts a request against the daily limit. Returns False if the limit was reached in the meantime."""
+    now = time.time()
+    accepted = []
+
+    def add(timestamps):
+        recent = _recent_requests(timestamps, now)
+        accepted[:] = [len(recent) < MAX_REQUESTS_PER_DAY]
+        return recent + [now] if accepted[0] else (recent or None)
+
+    state.get_backend().update('request_limits', user_id, add)
+    return accepted[0]
 
 def handle_friend_request(update: Update, context: CallbackContext):
     """Handles the /friendrequest command initiated by a friend."""
@@ -75,7 +85,7 @@ def handle_friend_request(update: Update, context: CallbackContext):
     year = int(release_date.split('-')[0]) if release_date else 0
     tmdb_id = item['id']
     
-    if _check_plex_library(title, year):
+    if _check_plex_library(title, year, tmdb_id, media_type):
         update.message.reply_text(_get_text('request_already_in_library', lang).format(title=title))
         return
 
@@ -84,7 +94,16 @@ def handle_friend_request(update: Update, context: CallbackContext):
         update.message.reply_text("Admin not configured. Cannot process request.")
         return
 
-    REQUEST_LIMITS.setdefault(friend_user_id, []).append(datetime.now())
+    if not _record_request(friend_user_id):
+        update.message.reply_text(_get_text('request_limit_reached', lang))
+        return
+
+    # Recorded before the admin sees the buttons, so approve/decline can claim it exactly once
+    state.get_backend().update('pending_requests', f"{media_type}_{tmdb_id}_{friend_user_id}", lambda current: {
+        'media_type': media_type, 'tmdb_id': tmdb_id, 'friend_id': friend_user_id,
+        'friend_name': update.effective_user.first_name, 'title': title, 'year': year,
+        'requested_at': time.time(), 'status': 'pending',
+    })
 
     callback_data_approve_std = f"approve_std_{media_type}_{tmdb_id}_{friend_user_id}"
     callback_data_approve_4k = f"approve_4k_{media_type}_{tmdb_id}_{friend_user_id}"
@@ -0,0 +1,200 @@
+# library_sync.py
+#
+# Background library sync. Each registered source (Plex, Radarr, Sonarr,
+# Overseerr, ...) is refreshed periodically on the Updater's JobQueue with its
+# own interval, random jitter and exponential backoff on failure. Runs of the
+# same source never overlap. User-facing checks read the latest snapshot with
+# get_data() instead of fetching whole libraries inside a request.
+
+import logging
+import random
+import threading
+import time
+from datetime import datetime
+
+import metrics
+import profiler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL = 300      # Seconds between successful runs
+DEFAULT_JITTER = 0.1        # +/- share of the interval added at random
+MAX_BACKOFF = 3600          # Upper bound for the retry delay after failures
+STALE_AFTER_INTERVALS = 3   # Snapshots older than this many intervals are not trusted
+
+
+class SyncSource:
+    """One periodically refreshed piece of library state."""
+
+    def __init__(self, name, fetch, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, max_backoff=MAX_BACKOFF):
+        self.name = name
+        self.fetch = fetch
+        self.interval = float(interval)
+        self.jitter = float(jitter)
+        self.max_backoff = float(max_backoff)
+        self.data = None
+        self.synced_at = None          # datetime of the last successful run, for display
+        self._synced_monotonic = None  # monotonic time of the same, for staleness checks
+        self.last_duration = None
+        self.last_error = None
+        self.failures = 0
+        self.next_run_at = None
+        self.run_lock = threading.Lock()
+        self.data_lock = threading.Lock()
+
+    def next_delay(self):
+        base = self.interval if not self.failures else min(self.interval * 2 ** self.failures, self.max_backoff)
+        return max(1.0, base * (1 + random.uniform(-self.jitter, self.jitter)))
+
+    def age(self):
+        """Seconds since the last successful run, or None if there was none."""
+        return time.monotonic() - self._synced_monotonic if self._synced_monotonic is not None else None
+
+    def is_fresh(self):
+        if self._synced_monotonic is None:
+            return False
+        return self.age() < self.interval * STALE_AFTER_INTERVALS
+
+    def restore(self, data, synced_at):
+        """Takes over a snapshot saved by an earlier process (synced_at is a timestamp). Returns False if it is stale."""
+        age = time.time() - synced_at
+        if data is None or not 0 <= age < self.interval * STALE_AFTER_INTERVALS:
+            return False
+        with self.data_lock:
+            if self.data is not None:
+                return False
+            self.data = data
+            self.synced_at = datetime.fromtimestamp(synced_at)
+            self._synced_monotonic = time.monotonic() - age
+        return True
+
+    def run(self):
+        """Fetches a new snapshot unless a run is already in progress. Returns False if skipped."""
+        if not self.run_lock.acquire(blocking=False):
+            logger.info(f"Sync of '{self.name}' is still running; skipping this run.")
+            metrics.increment(f"sync.{self.name}.skipped_overlap")
+            return False
+        started = time.perf_counter()
+        try:
+            with profiler.profile_update(count=False):
+                data = self.fetch()
+            with self.data_lock:
+                self.data = data
+                if data is not None:
+                    self.synced_at = datetime.now()
+                    self._synced_monotonic = time.monotonic()
+            self.failures = 0
+            self.last_error = None
+            metrics.increment(f"sync.{self.name}.success")
+        except Exception as e:
+            self.failures += 1
+            self.last_error = str(e)
+            metrics.increment(f"sync.{self.name}.failure")
+            logger.error(f"Sync of '{self.name}' failed ({self.failures} in a row): {e}")
+        finally:
+            self.last_duration = time.perf_counter() - started
+            self.run_lock.release()
+        return True
+
+    def status(self):
+        return {
+            'name': self.name,
+            'synced_at': self.synced_at,
+            'duration': self.last_duration,
+            'fresh': self.is_fresh(),
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'next_run_at': self.next_run_at,
+        }
+
+
+_sources = {}
+_job_queue = None
+
+
+def register_source(name, fetch, interval=DEFAULT_INTERVAL, jitter=DEFAULT_JITTER, max_backoff=MAX_BACKOFF):
+    """Registers (or replaces) a source. fetch() returns the new snapshot, None when unconfigured, or raises."""
+    _sources[name] = SyncSource(name, fetch, interval, jitter, max_backoff)
+    return _sources[name]
+
+
+def _run_job(context):
+    source = context.job.context
+    source.run()
+    _schedule(source, source.next_delay())
+
+
+def _schedule(source, delay):
+    source.next_run_at = datetime.fromtimestamp(time.time() + delay)
+    _job_queue.run_once(_run_job, delay, context=source, name=f"sync:{source.name}")
+
+
+def start(job_queue, initial_delay=5):
+    """Schedules every registered source on the JobQueue, staggered so they don't all start at once.
+
+    Sources restored from a recent snapshot first run when their interval is up, not right away.
+    """
+    global _job_queue
+    _job_queue = job_queue
+    for source in _sources.values():
+        delay = initial_delay if not source.is_fresh() else max(initial_delay, source.interval - source.age())
+        _schedule(source, delay + random.uniform(0, source.interval * source.jitter))
+
+
+def refresh_now(name=None):
+    """Queues an immediate run of one source (or all of them) on the JobQueue."""
+    if _job_queue is None:
+        return
+    for source in ([_sources[name]] if name else _sources.values()):
+        _job_queue.run_once(lambda context, s=source: s.run(), 0, name=f"sync-now:{source.name}")
+
+
+def run_now(name):
+    """Runs one source in the calling thread. Returns False if it is unknown or a run is already in progress."""
+    source = _sources.get(name)
+    return source.run() if source is not None else False
+
+
+def get_data(name, allow_stale=False):
+    """Returns the latest snapshot of a source, or None if there is none (or it is stale)."""
+    source = _sources.get(name)
+    if source is None:
+        return None
+    with source.data_lock:
+        if source.data is None or not (allow_stale or source.is_fresh()):
+            metrics.increment(f"sync.{name}.miss")
+            return None
+        metrics.increment(f"sync.{name}.hit")
+        return source.data
+
+
+def update_data(name, mutate):
+    """Applies mutate(snapshot) in place, e.g. to record an item the bot just added."""
+    source = _sources.get(name)
+    if source is None:
+        return
+    with source.data_lock:
+        if source.data is not None:
+            mutate(source.data)
+
+
+def all_status():
+    return [source.status() for source in _sources.values()]
+
+
+def export_data():
+    """Latest snapshot of every source with its sync time, for snapshot.py."""
+    exported = {}
+    for name, source in list(_sources.items()):
+        with source.data_lock:
+            if source.data is not None and source.synced_at is not None:
+                exported[name] = (source.data, source.synced_at.timestamp())
+    return exported
+
+
+def restore_data(data, saved_at=None):
+    """Gives registered sources the snapshots from export_data() that are still fresh."""
+    restored = [name for name, (snapshot, synced_at) in data.items()
+                if name in _sources and _sources[name].restore(snapshot, synced_at)]
+    if restored:
+        logger.info(f"Restored sync snapshots of {', '.join(restored)}.")
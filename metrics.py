@@ -0,0 +1,74 @@
+# metrics.py
+#
+# Process-wide counters, gauges and latency windows. Cheap enough to call from
+# any handler or worker thread; read back with snapshot(). Latencies are kept in
+# fixed-size rolling windows (the last WINDOW_SIZE observations per name), so
+# recording one is a deque append and memory stays bounded.
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+WINDOW_SIZE = 1024
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_windows = {}   # name -> deque of the latest observations
+
+
+def increment(name, value=1):
+    """Adds value to the named counter, creating it at zero if needed."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name, value):
+    """Sets the named gauge to its current value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def get_counter(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def observe(name, value):
+    """Records one observation (e.g. a latency in seconds) in the named rolling window."""
+    with _lock:
+        window = _windows.get(name)
+        if window is None:
+            window = _windows[name] = deque(maxlen=WINDOW_SIZE)
+        window.append(value)
+
+
+@contextmanager
+def timer(name):
+    """Observes the time spent in the with-block, in seconds."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def _percentile(sorted_values, pct):
+    return sorted_values[min(len(sorted_values) - 1, int(pct / 100.0 * len(sorted_values)))]
+
+
+def summarize(name):
+    """Returns count, p50, p95 and max of the named window, or None if nothing was observed."""
+    with _lock:
+        values = sorted(_windows.get(name, ()))
+    if not values:
+        return None
+    return {'count': len(values), 'p50': _percentile(values, 50), 'p95': _percentile(values, 95), 'max': values[-1]}
+
+
+def snapshot():
+    """Returns a copy of all counters and gauges, and a summary of every latency window."""
+    with _lock:
+        counters, gauges, names = dict(_counters), dict(_gauges), list(_windows)
+    return {'counters': counters, 'gauges': gauges, 'windows': {name: summarize(name) for name in names}}
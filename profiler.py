@@ -0,0 +1,231 @@
+# profiler.py
+#
+# On-demand profiling of the running bot, started with /profile. Two modes:
+#   "sample"   - a background thread takes the stack of every thread every few
+#                milliseconds (sys._current_frames) and counts where busy threads
+#                are, including time spent waiting on backends. Output: the top
+#                functions and a collapsed-stacks file for flame graph tools.
+#   "cprofile" - every update handled while the session runs is profiled with
+#                cProfile on its handler thread, together with the work its
+#                handlers hand to the run_async pool and every JobQueue job
+#                (library syncs, availability polls, inline lookups); the
+#                results are merged. Output: the top functions and a .pstats file.
+# A session ends after a number of seconds or of handled updates, whichever
+# comes first. While no session runs, the only cost is one check per update.
+
+import cProfile
+import logging
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SAMPLE, CPROFILE = 'sample', 'cprofile'
+DEFAULT_SECONDS = 30
+MAX_SECONDS = 300
+MAX_UPDATES = 1000
+SAMPLE_INTERVAL = 0.005
+TOP_FUNCTIONS = 15
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+# Thread loops that only wait for work; a thread whose only code of ours is one of these is idle
+_IDLE_LOOPS = {('update_scheduler.py', '_worker'), ('send_scheduler.py', '_worker'), ('bot.py', 'main')}
+
+_session = None
+_local = threading.local()   # .active: this thread is already inside profile_update()
+_session_lock = threading.Lock()
+
+
+class ProfilerBusy(RuntimeError):
+    """A profiling session is already running."""
+
+
+class Session:
+    def __init__(self, mode, seconds, max_updates, on_done):
+        self.mode = mode
+        self.seconds = min(float(seconds or DEFAULT_SECONDS), MAX_SECONDS)
+        self.max_updates = min(int(max_updates), MAX_UPDATES) if max_updates else None
+        self.on_done = on_done
+        self.started = time.monotonic()
+        self.updates = 0
+        self.samples = 0
+        self.stacks = Counter()   # (collapsed stack, index of its outermost frame of ours) -> samples
+        self.stats = None         # merged pstats.Stats
+        self.lock = threading.Lock()
+        self.finished = threading.Event()
+
+    def count_update(self):
+        with self.lock:
+            self.updates += 1
+            if self.max_updates and self.updates >= self.max_updates:
+                self.finished.set()
+
+    def add_profile(self, profile):
+        with self.lock:
+            if self.stats is None:
+                self.stats = pstats.Stats(profile)
+            else:
+                self.stats.add(profile)
+
+
+def start(mode=SAMPLE, seconds=None, max_updates=None, on_done=None):
+    """Starts a session; on_done(report) is called from a background thread when it ends. Raises ProfilerBusy."""
+    global _session
+    if mode not in (SAMPLE, CPROFILE):
+        raise ValueError(f"Unknown profiling mode '{mode}'.")
+    session = Session(mode, seconds, max_updates, on_done)
+    with _session_lock:
+        if _session is not None:
+            raise ProfilerBusy("A profiling session is already running.")
+        _session = session
+    metrics.increment(f"profiler.{mode}.sessions")
+    threading.Thread(target=_run_session, args=(session,), name='profiler', daemon=True).start()
+    logger.info(f"Started {mode} profiling for up to {session.seconds:.0f}s"
+                f"{f' or {session.max_updates} updates' if session.max_updates else ''}.")
+    return session
+
+
+def stop():
+    """Ends the running session early. Returns False if none is running."""
+    session = _session
+    if session is None:
+        return False
+    session.finished.set()
+    return True
+
+
+def is_running():
+    return _session is not None
+
+
+@contextmanager
+def profile_update(count=True):
+    """Wraps the handling of one update (or, with count=False, other work such as a job) and profiles it in cprofile mode."""
+    session = _session
+    if session is None or getattr(_local, 'active', False):
+        yield
+        return
+    if session.mode != CPROFILE:
+        try:
+            yield
+        finally:
+            if count:
+                session.count_update()
+        return
+    profile = cProfile.Profile()
+    _local.active = True
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _local.active = False
+        session.add_profile(profile)
+        if count:
+            session.count_update()
+
+
+# --- Sampling ---
+
+def _label(filename, line, name):
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return _label(code.co_filename, code.co_firstlineno, code.co_name)
+
+
+def _sample_once(session, own_ident, thread_names):
+    for ident, frame in sys._current_frames().items():
+        if ident == own_ident:
+            continue
+        stack, busy, outermost = [], False, 0
+        while frame is not None:
+            code = frame.f_code
+            if code.co_filename.startswith(_REPO_DIR):
+                outermost = len(stack)
+                busy = busy or (os.path.basename(code.co_filename), code.co_name) not in _IDLE_LOOPS
+            stack.append(_frame_label(frame))
+            frame = frame.f_back
+        if busy:
+            stack.append(thread_names.get(ident, str(ident)).rstrip('0123456789-_'))
+            session.stacks[(';'.join(reversed(stack)), len(stack) - 1 - outermost)] += 1
+    session.samples += 1
+
+
+def _sample(session):
+    own_ident = threading.get_ident()
+    thread_names, names_refreshed = {}, 0.0
+    deadline = session.started + session.seconds
+    while not session.finished.is_set() and time.monotonic() < deadline:
+        if time.monotonic() - names_refreshed > 1.0:
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            names_refreshed = time.monotonic()
+        _sample_once(session, own_ident, thread_names)
+        session.finished.wait(SAMPLE_INTERVAL)
+
+
+# --- Reports ---
+
+def _sample_report(session):
+    inclusive, leaves = Counter(), Counter()
+    collapsed = Counter()
+    for (stack, outermost), count in session.stacks.items():
+        frames = stack.split(';')
+        # Thread start-up frames above the outermost code of ours would top every list
+        for label in set(frames[outermost:]):
+            inclusive[label] += count
+        leaves[frames[-1]] += count
+        collapsed[stack] += count
+    busy = sum(session.stacks.values())
+    collapsed = ''.join(f"{stack} {count}\n" for stack, count in collapsed.most_common())
+    return {
+        'top': [(label, count / busy if busy else 0.0) for label, count in inclusive.most_common(TOP_FUNCTIONS)],
+        'top_self': [(label, count / busy if busy else 0.0) for label, count in leaves.most_common(TOP_FUNCTIONS)],
+        'busy_samples': busy,
+        'file': ('profile.collapsed', collapsed.encode('utf-8')),
+    }
+
+
+def _cprofile_report(session):
+    if session.stats is None:
+        return {'top': [], 'top_self': [], 'file': None}
+    entries = session.stats.stats  # (file, line, function) -> (primitive calls, calls, self time, total time, callers)
+    by_total = sorted(entries.items(), key=lambda item: -item[1][3])[:TOP_FUNCTIONS]
+    by_self = sorted(entries.items(), key=lambda item: -item[1][2])[:TOP_FUNCTIONS]
+    return {
+        'top': [(_label(*key), value[3]) for key, value in by_total],
+        'top_self': [(_label(*key), value[2]) for key, value in by_self],
+        'file': ('profile.pstats', marshal.dumps(entries)),
+    }
+
+
+def _run_session(session):
+    global _session
+    try:
+        if session.mode == SAMPLE:
+            _sample(session)
+        else:
+            session.finished.wait(session.seconds)
+    finally:
+        with _session_lock:
+            _session = None
+    report = _sample_report(session) if session.mode == SAMPLE else _cprofile_report(session)
+    report.update(mode=session.mode, duration=time.monotonic() - session.started, updates=session.updates,
+                  samples=session.samples)
+    logger.info(f"Finished {session.mode} profiling after {report['duration']:.1f}s and {session.updates} updates.")
+    if session.on_done is not None:
+        try:
+            session.on_done(report)
+        except Exception as e:
+            logger.error(f"Could not deliver the profiling report: {e}")
+
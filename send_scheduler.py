@@ -0,0 +1,311 @@
+# send_scheduler.py
+#
+# Outbound Telegram send scheduler. Every message send/edit/delete goes through
+# a queue drained by a few sender threads that respect a global token bucket
+# and one bucket per chat, back off on RetryAfter (HTTP 429), merge consecutive
+# edits of the same message into the latest one, and serve the admin's chat
+# first. Callers still block until their call is done and get its result, so
+# handler code keeps its straight-line send -> edit -> delete flow. On shutdown
+# the queue is sent for a few more seconds; calls still left after that fail
+# with SchedulerStopped instead of leaving their callers blocked.
+
+import inspect
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+from telegram.error import RetryAfter
+from telegram.ext import ExtBot
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LIMITS = {
+    "global_per_second": 25,    # Telegram allows ~30 messages/s per bot
+    "chat_per_second": 1,       # ...and ~1 message/s per private chat
+    "chat_burst": 3,            # Short bursts are tolerated
+    "group_per_minute": 20,     # Groups are limited to ~20 messages/min
+    "sender_threads": 4,
+    "max_retries": 3,
+}
+
+ADMIN_PRIORITY, DEFAULT_PRIORITY = 0, 1
+EDIT_METHODS = ('edit_message_text', 'edit_message_caption', 'edit_message_media', 'edit_message_reply_markup')
+DELETE_METHODS = ('delete_message',)
+
+
+class SchedulerStopped(RuntimeError):
+    """The scheduler stopped before this call could be sent."""
+
+
+class TokenBucket:
+    """Classic token bucket; paused_until lets RetryAfter block it for a while."""
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """Seconds until one token is available (0 if it is available now)."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now):
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+class _Job:
+    __slots__ = ('seq', 'priority', 'chat_id', 'method', 'call', 'futures', 'edit_key', 'attempts')
+
+    def __init__(self, seq, priority, chat_id, method, call, edit_key):
+        self.seq = seq
+        self.priority = priority
+        self.chat_id = chat_id
+        self.method = method
+        self.call = call
+        self.futures = [Future()]
+        self.edit_key = edit_key
+        self.attempts = 0
+
+
+class OutboundScheduler:
+    """Rate-limited, priority-aware queue of outbound Bot API calls."""
+
+    def __init__(self, limits=None, priority_for_chat=None):
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        self.priority_for_chat = priority_for_chat or (lambda chat_id: DEFAULT_PRIORITY)
+        self._cond = threading.Condition()
+        self._jobs = []
+        self._pending_edits = {}
+        self._busy_chats = set()
+        self._chat_buckets = {}
+        self._global_bucket = TokenBucket(self.limits['global_per_second'], self.limits['global_per_second'])
+        self._seq = itertools.count()
+        self._threads = []
+        self._stopped = False   # No new calls are queued; the sender threads finish what is queued
+        self._closed = False    # Nothing is sent anymore; what was left in the queue has failed
+
+    def start(self):
+        for i in range(int(self.limits['sender_threads'])):
+            thread = threading.Thread(target=self._worker, name=f"tg-sender-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=5):
+        """Sends what is queued for up to `timeout` seconds, then fails whatever is left so no caller waits forever."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        with self._cond:
+            self._closed = True
+            for job in self._jobs:
+                self._fail(job, SchedulerStopped(f"Telegram call {job.method} to chat {job.chat_id} was not sent before shutdown."))
+            self._jobs.clear()
+            self._pending_edits.clear()
+            metrics.set_gauge("telegram.queue_depth", 0)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _fail(job, error):
+        for future in job.futures:
+            future.set_exception(error)
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._jobs)
+
+    def _bucket_for(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if isinstance(chat_id, int) and chat_id < 0:
+                bucket = TokenBucket(self.limits['group_per_minute'] / 60.0, self.limits['chat_burst'])
+            else:
+                bucket = TokenBucket(self.limits['chat_per_second'], self.limits['chat_burst'])
+            self._chat_buckets[chat_id] = bucket
+        return bucket
+
+    def submit(self, method, chat_id, message_id, call):
+        """Queues call() and blocks until it has run. Returns its result or raises its exception."""
+        with self._cond:
+            # Checked under the lock: once stop() has begun, nothing new may be queued behind the sender threads
+            run_inline = self._stopped or not self._threads
+            if not run_inline:
+                future = self._enqueue(method, chat_id, message_id, call)
+        if run_inline:
+            return call()
+        return future.result()
+
+    def _enqueue(self, method, chat_id, message_id, call):
+        """Queues a call (with the lock held) and returns the future of its result."""
+        if method in DELETE_METHODS:
+            # The message is going away; pending edits of it are pointless
+            for key in [k for k in self._pending_edits if k[0] == chat_id and k[1] == message_id]:
+                dropped = self._pending_edits.pop(key)
+                self._jobs.remove(dropped)
+                for future in dropped.futures:
+                    future.set_result(None)
+                metrics.increment("telegram.dropped_edits")
+
+        edit_key = (chat_id, message_id, method) if method in EDIT_METHODS and message_id else None
+        queued_edit = self._pending_edits.get(edit_key) if edit_key else None
+        if queued_edit is not None:
+            # Merge into the queued edit: only the latest content is sent, every caller gets its result
+            queued_edit.call = call
+            future = Future()
+            queued_edit.futures.append(future)
+            metrics.increment("telegram.coalesced_edits")
+            return future
+        job = _Job(next(self._seq), self.priority_for_chat(chat_id), chat_id, method, call, edit_key)
+        self._jobs.append(job)
+        if edit_key:
+            self._pending_edits[edit_key] = job
+        metrics.set_gauge("telegram.queue_depth", len(self._jobs))
+        self._cond.notify()
+        return job.futures[0]
+
+    def _pick(self, now):
+        """Returns (job, None) for the next runnable job, or (None, seconds_to_wait)."""
+        global_wait = self._global_bucket.wait_time(now)
+        if global_wait > 0:
+            return None, global_wait
+        best, wait = None, None
+        for job in self._jobs:
+            if job.chat_id in self._busy_chats:
+                continue
+            chat_wait = self._bucket_for(job.chat_id).wait_time(now)
+            if chat_wait > 0:
+                wait = chat_wait if wait is None else min(wait, chat_wait)
+                continue
+            if best is None or (job.priority, job.seq) < (best.priority, best.seq):
+                best = job
+        if best is None:
+            return None, wait
+        self._jobs.remove(best)
+        if best.edit_key:
+            self._pending_edits.pop(best.edit_key, None)
+        self._busy_chats.add(best.chat_id)
+        self._global_bucket.consume(now)
+        self._bucket_for(best.chat_id).consume(now)
+        if len(self._chat_buckets) > 1000:
+            for chat_id in [c for c, b in self._chat_buckets.items() if c not in self._busy_chats and b.is_idle(now)]:
+                del self._chat_buckets[chat_id]
+        return best, None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    if self._closed or self._stopped and not self._jobs:
+                        return
+                    job, wait = self._pick(time.monotonic())
+                    if job:
+                        break
+                    self._cond.wait(timeout=wait)
+                metrics.set_gauge("telegram.queue_depth", len(self._jobs))
+            self._run(job)
+
+    def _run(self, job):
+        requeue = False
+        try:
+            result = job.call()
+            metrics.increment("telegram.sent")
+            for future in job.futures:
+                future.set_result(result)
+        except RetryAfter as e:
+            job.attempts += 1
+            metrics.increment("telegram.retry_after")
+            logger.warning(f"Telegram flood control: retry after {e.retry_after}s (chat {job.chat_id}, {job.method}).")
+            if job.attempts <= self.limits['max_retries']:
+                requeue = True
+                with self._cond:
+                    pause_until = time.monotonic() + float(e.retry_after)
+                    self._bucket_for(job.chat_id).paused_until = pause_until
+                    self._global_bucket.paused_until = max(self._global_bucket.paused_until, pause_until)
+            else:
+                self._fail(job, e)
+        except Exception as e:
+            self._fail(job, e)
+        finally:
+            with self._cond:
+                self._busy_chats.discard(job.chat_id)
+                if requeue and self._closed:
+                    self._fail(job, SchedulerStopped(f"Telegram call {job.method} to chat {job.chat_id} was not sent before shutdown."))
+                elif requeue:
+                    newer_edit = self._pending_edits.get(job.edit_key) if job.edit_key else None
+                    if newer_edit is not None:
+                        # A newer edit of the same message was queued meanwhile; it supersedes this one
+                        newer_edit.futures.extend(job.futures)
+                    else:
+                        self._jobs.append(job)
+                        if job.edit_key:
+                            self._pending_edits[job.edit_key] = job
+                self._cond.notify_all()
+
+
+def _bind_target(method, args, kwargs):
+    """Extracts (chat_id, message_id) from a Bot API call's arguments."""
+    bound = inspect.signature(getattr(ExtBot, method)).bind_partial(None, *args, **kwargs)
+    return bound.arguments.get('chat_id'), bound.arguments.get('message_id')
+
+
+class ScheduledBot(ExtBot):
+    """ExtBot whose message sends, edits and deletes go through an OutboundScheduler."""
+
+    def __init__(self, *args, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def _scheduled(self, method, args, kwargs):
+        call = getattr(super(), method)
+        if self.scheduler is None:
+            return call(*args, **kwargs)
+        chat_id, message_id = _bind_target(method, args, kwargs)
+        if chat_id is None:
+            # Inline messages have no chat to rate-limit against
+            return call(*args, **kwargs)
+        return self.scheduler.submit(method, chat_id, message_id, lambda: call(*args, **kwargs))
+
+    def send_message(self, *args, **kwargs):
+        return self._scheduled('send_message', args, kwargs)
+
+    def send_photo(self, *args, **kwargs):
+        return self._scheduled('send_photo', args, kwargs)
+
+    def send_document(self, *args, **kwargs):
+        return self._scheduled('send_document', args, kwargs)
+
+    def edit_message_text(self, *args, **kwargs):
+        return self._scheduled('edit_message_text', args, kwargs)
+
+    def edit_message_caption(self, *args, **kwargs):
+        return self._scheduled('edit_message_caption', args, kwargs)
+
+    def edit_message_media(self, *args, **kwargs):
+        return self._scheduled('edit_message_media', args, kwargs)
+
+    def edit_message_reply_markup(self, *args, **kwargs):
+        return self._scheduled('edit_message_reply_markup', args, kwargs)
+
+    def delete_message(self, *args, **kwargs):
+        return self._scheduled('delete_message', args, kwargs)
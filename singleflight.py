@@ -0,0 +1,67 @@
+# singleflight.py
+#
+# Request coalescing for backend lookups. While a call for a given
+# (operation, arguments) key is in flight, identical calls from other threads
+# wait for it and share its result instead of hitting the backend again.
+
+import threading
+from functools import wraps
+
+import metrics
+
+_lock = threading.Lock()
+_in_flight = {}
+
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def do(operation, key, func, *args, **kwargs):
+    """Runs func(*args, **kwargs) once per in-flight (operation, key); concurrent callers share the outcome."""
+    flight_key = (operation, key)
+    with _lock:
+        call = _in_flight.get(flight_key)
+        is_leader = call is None
+        if is_leader:
+            call = _in_flight[flight_key] = _Call()
+
+    if not is_leader:
+        metrics.increment(f"singleflight.{operation}.collapsed")
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    metrics.increment(f"singleflight.{operation}.executed")
+    try:
+        call.result = func(*args, **kwargs)
+        return call.result
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            _in_flight.pop(flight_key, None)
+        call.event.set()
+
+
+def coalesce(operation):
+    """Decorator form of do(), keyed by the call's positional and keyword arguments."""
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            return do(operation, key, func, *args, **kwargs)
+        return wrapped
+    return decorator
+
+
+def in_flight_count():
+    with _lock:
+        return len(_in_flight)
@@ -0,0 +1,175 @@
+# snapshot.py
+#
+# Warm restarts. The contents of the caches, the library sync snapshots and the
+# title index are written periodically to a single binary file in config/, and
+# read back on startup so the bot does not have to refetch everything from TMDB,
+# Plex and the Arrs the moment users return.
+#
+# File layout (all integers big-endian):
+#   magic b"SRPS", format version (u16), section count (u16)
+#   per section: name length (u8), name, offset (u64), length (u64), SHA-256 (32 bytes)
+#   section bodies: zlib-compressed pickles
+# The file is memory-mapped on load and each section is only decompressed and
+# checked against its checksum when it is restored. Sections that are slow to
+# rebuild (the title index) can be restored on a background thread, so startup
+# doesn't wait for them. The file is only ever written by the bot itself
+# (pickle must not be fed untrusted data).
+
+import hashlib
+import logging
+import mmap
+import os
+import pickle
+import struct
+import threading
+import time
+import zlib
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SRPS"
+FORMAT_VERSION = 1
+DEFAULT_PATH = "config/snapshot.bin"
+DEFAULT_INTERVAL = 600   # Seconds between snapshots
+
+_HEADER = struct.Struct(">4sHH")
+_ENTRY = struct.Struct(">QQ32s")
+
+_sections = {}   # name -> (dump, load, background)
+_write_lock = threading.Lock()
+
+
+class SnapshotError(Exception):
+    """The snapshot file is missing, from another format version, or damaged."""
+
+
+def register(name, dump, load, background=False):
+    """Adds a section: dump() returns picklable data to save, load(data, saved_at) restores it.
+
+    Background sections are restored on a separate thread after restore() has returned.
+    """
+    _sections[name] = (dump, load, background)
+
+
+def save(path=DEFAULT_PATH):
+    """Writes every registered section to path (atomically). Returns the number of bytes written."""
+    started = time.perf_counter()
+    bodies = []
+    for name, (dump, _, _) in list(_sections.items()):
+        try:
+            data = {'saved_at': time.time(), 'data': dump()}
+            bodies.append((name.encode('utf-8'), zlib.compress(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL), 6)))
+        except Exception as e:
+            logger.error(f"Could not snapshot section '{name}': {e}")
+
+    offset = _HEADER.size + sum(1 + len(name) + _ENTRY.size for name, _ in bodies)
+    table = []
+    for name, body in bodies:
+        table.append(bytes([len(name)]) + name + _ENTRY.pack(offset, len(body), hashlib.sha256(body).digest()))
+        offset += len(body)
+
+    with _write_lock:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, len(bodies)))
+            f.writelines(table)
+            f.writelines(body for _, body in bodies)
+        os.replace(temporary, path)
+
+    metrics.set_gauge("snapshot.bytes", offset)
+    logger.info(f"Wrote snapshot of {len(bodies)} sections ({offset / 1024:.0f} KiB) in {time.perf_counter() - started:.2f}s.")
+    return offset
+
+
+class SnapshotReader:
+    """Memory-mapped view of a snapshot file; sections are decoded on first access."""
+
+    def __init__(self, path):
+        try:
+            with open(path, 'rb') as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SnapshotError(f"Cannot open {path}: {e}")
+        try:
+            magic, version, count = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a snapshot file.")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"{path} has format version {version}, expected {FORMAT_VERSION}.")
+            self._table = {}
+            position = _HEADER.size
+            for _ in range(count):
+                name_length = self._map[position]
+                name = self._map[position + 1:position + 1 + name_length].decode('utf-8')
+                position += 1 + name_length
+                self._table[name] = _ENTRY.unpack_from(self._map, position)
+                position += _ENTRY.size
+        except (struct.error, IndexError, UnicodeDecodeError) as e:
+            self.close()
+            raise SnapshotError(f"{path} has a damaged header: {e}")
+
+    def names(self):
+        return list(self._table)
+
+    def read(self, name):
+        """Returns (data, saved_at) of a section. Raises SnapshotError if it is missing or fails its checksum."""
+        if name not in self._table:
+            raise SnapshotError(f"No section '{name}' in snapshot.")
+        offset, length, checksum = self._table[name]
+        body = self._map[offset:offset + length]
+        if len(body) != length or hashlib.sha256(body).digest() != checksum:
+            raise SnapshotError(f"Section '{name}' failed its checksum.")
+        section = pickle.loads(zlib.decompress(body))
+        return section['data'], section['saved_at']
+
+    def close(self):
+        self._map.close()
+
+
+def _restore_sections(reader, names):
+    started = time.perf_counter()
+    restored = []
+    for name in names:
+        try:
+            data, saved_at = reader.read(name)
+            _sections[name][1](data, saved_at)
+            restored.append(name)
+        except Exception as e:
+            metrics.increment("snapshot.section_rejected")
+            logger.warning(f"Skipping snapshot section '{name}': {e}")
+    if restored:
+        logger.info(f"Restored snapshot sections {', '.join(restored)} in {time.perf_counter() - started:.3f}s.")
+    return restored
+
+
+def restore(path=DEFAULT_PATH):
+    """Restores the registered sections found in the snapshot. Returns the names of those restored right away.
+
+    Background sections are still being restored when this returns.
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        reader = SnapshotReader(path)
+    except SnapshotError as e:
+        logger.warning(f"Ignoring snapshot: {e}")
+        return []
+    names = [name for name in reader.names() if name in _sections]
+    background = [name for name in names if _sections[name][2]]
+    restored = _restore_sections(reader, [name for name in names if name not in background])
+    if not background:
+        reader.close()
+        return restored
+
+    def restore_in_background():
+        try:
+            _restore_sections(reader, background)
+        finally:
+            reader.close()
+
+    threading.Thread(target=restore_in_background, name='snapshot-restore', daemon=True).start()
+    return restored
@@ -0,0 +1,306 @@
+# state.py
+#
+# Pluggable shared state. Everything that has to be seen by every copy of the
+# bot (sessions, rate limits, pending requests, titles waiting to reach Plex)
+# goes through a StateBackend: a namespaced key/value store of JSON values
+# where every key carries a version number, and writes are compare-and-set on
+# that version. Several bot processes (e.g. webhook replicas behind a load
+# balancer) can then share one SQLite file without overwriting each other's
+# changes.
+#
+# The default MemoryBackend keeps everything in this process, as before.
+
+import copy
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+
+from telegram.ext import BasePersistence
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "backend": "memory",            # "memory" or "sqlite"
+    "path": "config/state.db",      # SQLite file, shared by every bot process
+    "busy_timeout_seconds": 5,
+}
+MAX_CAS_RETRIES = 10
+
+
+class StateConflictError(RuntimeError):
+    """A compare-and-set update kept losing to concurrent writers."""
+
+
+class StateBackend(ABC):
+    """Namespaced, versioned key/value store. Values are JSON-serializable; missing keys have version 0."""
+
+    @abstractmethod
+    def get(self, namespace, key):
+        """Returns (value, version); (None, 0) if the key does not exist."""
+
+    @abstractmethod
+    def compare_and_set(self, namespace, key, value, expected_version):
+        """Writes value (None deletes) only if the key is still at expected_version. Returns True on success."""
+
+    @abstractmethod
+    def items(self, namespace):
+        """Returns {key: value} for every key in the namespace."""
+
+    def update(self, namespace, key, mutate, retries=MAX_CAS_RETRIES):
+        """Read-modify-write: new = mutate(current or None), retried until no one else wrote in between.
+
+        Returning None from mutate deletes the key. Returns the value that was written.
+        """
+        for _ in range(retries):
+            current, version = self.get(namespace, key)
+            new_value = mutate(copy.deepcopy(current))
+            if self.compare_and_set(namespace, key, new_value, version):
+                return new_value
+            metrics.increment(f"state.{namespace}.cas_conflict")
+        raise StateConflictError(f"Could not update {namespace}/{key} after {retries} attempts.")
+
+    def delete(self, namespace, key):
+        self.update(namespace, key, lambda current: None)
+
+    def close(self):
+        pass
+
+
+class MemoryBackend(StateBackend):
+    """Process-local backend; nothing survives a restart."""
+
+    def __init__(self):
+        self._data = {}  # (namespace, key) -> (json text, version)
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        with self._lock:
+            text, version = self._data.get((namespace, str(key)), (None, 0))
+        return (json.loads(text) if text is not None else None), version
+
+    def compare_and_set(self, namespace, key, value, expected_version):
+        with self._lock:
+            _, version = self._data.get((namespace, str(key)), (None, 0))
+            if version != expected_version:
+                return False
+            if value is None:
+                self._data.pop((namespace, str(key)), None)
+            else:
+                self._data[(namespace, str(key))] = (json.dumps(value), version + 1)
+            return True
+
+    def items(self, namespace):
+        with self._lock:
+            return {key: json.loads(text) for (ns, key), (text, _) in self._data.items() if ns == namespace}
+
+
+class SQLiteBackend(StateBackend):
+    """Backend on a SQLite file in WAL mode, safe to share between processes on the same filesystem."""
+
+    def __init__(self, path, busy_timeout_seconds=5):
+        self.path = path
+        self.busy_timeout_seconds = busy_timeout_seconds
+        self._local = threading.local()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " version INTEGER NOT NULL, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout_seconds, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        row = self._connection().execute(
+            "SELECT value, version FROM state WHERE namespace = ? AND key = ?", (namespace, str(key))
+        ).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def compare_and_set(self, namespace, key, value, expected_version):
+        conn = self._connection()
+        key = str(key)
+        if value is None:
+            cursor = conn.execute("DELETE FROM state WHERE namespace = ? AND key = ? AND version = ?",
+                                  (namespace, key, expected_version))
+            return cursor.rowcount == 1 or (expected_version == 0 and self.get(namespace, key)[1] == 0)
+        text = json.dumps(value)
+        if expected_version == 0:
+            cursor = conn.execute("INSERT OR IGNORE INTO state (namespace, key, value, version, updated_at) VALUES (?, ?, ?, 1, ?)",
+                                  (namespace, key, text, time.time()))
+        else:
+            cursor = conn.execute("UPDATE state SET value = ?, version = version + 1, updated_at = ? "
+                                  "WHERE namespace = ? AND key = ? AND version = ?",
+                                  (text, time.time(), namespace, key, expected_version))
+        return cursor.rowcount == 1
+
+    def items(self, namespace):
+        rows = self._connection().execute("SELECT key, value FROM state WHERE namespace = ?", (namespace,)).fetchall()
+        return {key: json.loads(text) for key, text in rows}
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# --- Telegram persistence ---
+
+def _merge(base, ours, theirs):
+    """Applies the top-level keys we changed since `base` on top of the stored `theirs`."""
+    merged = dict(theirs or {})
+    for key in set(base) | set(ours):
+        if key not in ours:
+            merged.pop(key, None)
+        elif base.get(key) != ours[key] or key not in base:
+            merged[key] = ours[key]
+    return merged
+
+
+class _ConversationView(dict):
+    """ConversationHandler state that is read from and written to the backend on every access."""
+
+    def __init__(self, backend, namespace):
+        super().__init__()
+        self.backend = backend
+        self.namespace = namespace
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(list(key))
+
+    def get(self, key, default=None):
+        value = self.backend.get(self.namespace, self._key(key))[0]
+        return default if value is None else value
+
+    def __contains__(self, key):
+        return self.backend.get(self.namespace, self._key(key))[0] is not None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self.backend.update(self.namespace, self._key(key), lambda current: value)
+
+    def __delitem__(self, key):
+        self.backend.delete(self.namespace, self._key(key))
+
+
+class StatePersistence(BasePersistence):
+    """python-telegram-bot persistence on a StateBackend.
+
+    user_data and chat_data are re-read before every update and written back after it. When another
+    process changed the same entry meanwhile, only the keys this process changed are applied on top.
+    """
+
+    def __init__(self, backend, store_user_data=True, store_chat_data=True, store_bot_data=False):
+        super().__init__(store_user_data=store_user_data, store_chat_data=store_chat_data,
+                         store_bot_data=store_bot_data, store_callback_data=False)
+        self.backend = backend
+        self._bases = {}  # (namespace, key) -> data as last read, for merging
+        self._bases_lock = threading.Lock()
+
+    def _load_all(self, namespace):
+        data = defaultdict(dict)
+        for key, value in self.backend.items(namespace).items():
+            data[int(key)] = value
+            with self._bases_lock:
+                self._bases[(namespace, str(key))] = copy.deepcopy(value)
+        return data
+
+    def _refresh(self, namespace, key, target):
+        value = self.backend.get(namespace, key)[0] or {}
+        with self._bases_lock:
+            self._bases[(namespace, str(key))] = copy.deepcopy(value)
+        target.clear()
+        target.update(value)
+
+    def _write(self, namespace, key, data):
+        with self._bases_lock:
+            base = self._bases.get((namespace, str(key)), {})
+        if data == base:
+            return
+        written = self.backend.update(namespace, key, lambda current: _merge(base, data, current) or None)
+        with self._bases_lock:
+            self._bases[(namespace, str(key))] = copy.deepcopy(written or {})
+
+    def get_user_data(self):
+        return self._load_all('user_data')
+
+    def get_chat_data(self):
+        return self._load_all('chat_data')
+
+    def get_bot_data(self):
+        return self.backend.get('bot_data', 'bot')[0] or {}
+
+    def get_conversations(self, name):
+        return _ConversationView(self.backend, f"conversation.{name}")
+
+    def update_conversation(self, name, key, new_state):
+        # _ConversationView already wrote the change when the handler assigned it
+        pass
+
+    def refresh_user_data(self, user_id, user_data):
+        self._refresh('user_data', user_id, user_data)
+
+    def refresh_chat_data(self, chat_id, chat_data):
+        self._refresh('chat_data', chat_id, chat_data)
+
+    def refresh_bot_data(self, bot_data):
+        self._refresh('bot_data', 'bot', bot_data)
+
+    def update_user_data(self, user_id, data):
+        self._write('user_data', user_id, data)
+
+    def update_chat_data(self, chat_id, data):
+        self._write('chat_data', chat_id, data)
+
+    def update_bot_data(self, data):
+        self._write('bot_data', 'bot', data)
+
+
+# --- Module-level backend ---
+
+_backend = MemoryBackend()
+
+
+def configure(settings=None):
+    """Selects the backend from the optional CONFIG['state'] section. Returns it."""
+    global _backend
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+    _backend.close()
+    if settings['backend'] == 'sqlite':
+        _backend = SQLiteBackend(settings['path'], settings['busy_timeout_seconds'])
+        logger.info(f"Using shared SQLite state at {settings['path']}.")
+    else:
+        _backend = MemoryBackend()
+    return _backend
+
+
+def get_backend():
+    return _backend
+
+
+def is_shared():
+    """True when state lives outside this process and sessions should be persisted."""
+    return not isinstance(_backend, MemoryBackend)
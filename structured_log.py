@@ -0,0 +1,183 @@
+# structured_log.py
+#
+# Logging off the request path. Handlers only put records on an in-memory
+# queue; one background thread (a QueueListener) formats them and writes the
+# rotating log file and stdout. Records can be written as JSON lines carrying
+# the id and duration of the Telegram update being handled, and long messages
+# (API response bodies, tracebacks) are cut to a configurable length.
+
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from datetime import datetime, timezone
+
+import metrics
+
+DEFAULT_SETTINGS = {
+    "path": "logs/searchrr_plus.log",
+    "format": "json",           # "json" (one object per line) or "text"
+    "level": "INFO",
+    "max_bytes": 10 * 1024 * 1024,  # Size rotation; ignored when "rotate_when" is set
+    "rotate_when": None,        # Time rotation instead, e.g. "midnight" (see TimedRotatingFileHandler)
+    "backup_count": 5,
+    "max_message_length": 2000,
+    "queue_size": 10000,        # Records beyond this are dropped rather than blocking a handler
+}
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+_request_started = contextvars.ContextVar('request_started', default=None)
+_listener = None
+
+
+def truncate(text, limit=DEFAULT_SETTINGS['max_message_length']):
+    """Cuts text to `limit` characters, saying how much was left out."""
+    text = str(text)
+    if len(text) <= limit:
+        return text
+    return f"{text[:limit]}... [{len(text) - limit} more characters]"
+
+
+# --- Request context ---
+
+def begin_request(request_id):
+    """Tags the records logged from now on (in this thread) with request_id."""
+    _request_id.set(request_id)
+    _request_started.set(time.perf_counter())
+
+
+def end_request():
+    """Clears the request context. Returns the request's duration in seconds (None if none was started)."""
+    started = _request_started.get()
+    _request_id.set(None)
+    _request_started.set(None)
+    return time.perf_counter() - started if started is not None else None
+
+
+class RequestContextFilter(logging.Filter):
+    """Copies the current request id and elapsed time onto each record, in the thread that logged it."""
+
+    def filter(self, record):
+        if getattr(record, 'request_id', None) is None:
+            record.request_id = _request_id.get()
+        started = _request_started.get()
+        record.elapsed_ms = round((time.perf_counter() - started) * 1000, 1) if started is not None else None
+        return True
+
+
+# --- Formatters ---
+
+class JsonFormatter(logging.Formatter):
+    def __init__(self, max_message_length):
+        super().__init__()
+        self.max_message_length = max_message_length
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': truncate(record.getMessage(), self.max_message_length),
+        }
+        for field in ('request_id', 'elapsed_ms', 'duration_ms'):
+            if getattr(record, field, None) is not None:
+                entry[field] = getattr(record, field)
+        if record.exc_text:
+            entry['exception'] = truncate(record.exc_text, self.max_message_length)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TruncatingFormatter(logging.Formatter):
+    def __init__(self, max_message_length):
+        super().__init__(TEXT_FORMAT)
+        self.max_message_length = max_message_length
+
+    def format(self, record):
+        text = super().format(record)
+        if getattr(record, 'request_id', None):
+            text = f"{text} [{record.request_id}]"
+        return truncate(text, self.max_message_length)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that counts and drops records when the queue is full instead of waiting."""
+
+    def prepare(self, record):
+        # Resolve the message and traceback now (their arguments may change later) but leave
+        # formatting to the writer thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.increment("log.dropped")
+
+
+# --- Setup ---
+
+def _file_handler(settings):
+    if os.path.dirname(settings['path']):
+        os.makedirs(os.path.dirname(settings['path']), exist_ok=True)
+    if settings['rotate_when']:
+        return logging.handlers.TimedRotatingFileHandler(settings['path'], when=settings['rotate_when'],
+                                                         backupCount=settings['backup_count'], encoding='utf-8')
+    return logging.handlers.RotatingFileHandler(settings['path'], maxBytes=settings['max_bytes'],
+                                                backupCount=settings['backup_count'], encoding='utf-8')
+
+
+def configure(settings=None):
+    """(Re)configures the root logger from the optional CONFIG['logging'] section and starts the writer thread."""
+    global _listener
+    settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+
+    if settings['format'] == 'json':
+        formatter = JsonFormatter(settings['max_message_length'])
+    else:
+        formatter = TruncatingFormatter(settings['max_message_length'])
+    file_handler = _file_handler(settings)
+    console_handler = logging.StreamHandler()
+    for handler in (file_handler, console_handler):
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(maxsize=settings['queue_size'])
+    queue_handler = _DroppingQueueHandler(records)
+    queue_handler.addFilter(RequestContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(settings['level'])
+
+    # The previous writer (on reconfiguration) still writes out what was queued before the switch
+    previous, _listener = _listener, logging.handlers.QueueListener(records, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+    _stop_listener(previous)
+    return _listener
+
+
+def _stop_listener(listener):
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
+
+
+def stop():
+    """Writes out whatever is still queued and stops the writer thread."""
+    global _listener
+    listener, _listener = _listener, None
+    _stop_listener(listener)
@@ -0,0 +1,247 @@
+# title_index.py
+#
+# In-memory title index for autocomplete. It holds titles the bot has seen
+# recently (TMDB search results) and the titles in the synced libraries
+# (Plex, Radarr, Sonarr), and answers "titles whose words start with what
+# was typed" without any network call. Matching ignores case, accents,
+# punctuation and word order, so "wars st" finds "Star Wars".
+#
+# A trigram index over the same names (titles plus original and alternate
+# titles) gives typo-tolerant matches: "interstelar" still finds
+# "Interstellar", which lets /check answer library titles without TMDB.
+
+import bisect
+import math
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+
+MAX_ENTRIES = 20000   # Least recently added entries are dropped beyond this (library titles are re-added on every sync)
+LIBRARY_SOURCES = ('plex', 'arr')
+MIN_FUZZY_SCORE = 0.3    # Matches below this similarity are not returned at all
+CONFIDENT_SCORE = 0.8    # A match this close, ...
+CONFIDENT_MARGIN = 0.15  # ... and this much closer than any other title, is taken as the answer
+YEAR_TOLERANCE = 1       # Release years differ by one between sources often enough
+
+
+def normalize(title):
+    """Lowercases, strips accents and punctuation so titles can be compared loosely."""
+    text = unicodedata.normalize('NFKD', title or '').encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', ' ', text.lower()).strip()
+
+
+def trigrams(normalized):
+    """Set of 3-character slices of a normalized name, padded so short words still have some."""
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """Word-prefix and trigram index over (media_type, tmdb_id) entries."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()   # (media_type, tmdb_id) -> entry dict, least recently added first
+        self._tokens = {}               # word -> set of keys
+        self._names = {}                # normalized name -> set of keys
+        self._grams = {}                # trigram -> set of normalized names
+        self._name_grams = {}           # normalized name -> its trigrams
+        self._sorted_tokens = []
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def add(self, media_type, tmdb_id, title, year=0, popularity=0.0, poster_path=None, overview=None, source='tmdb', aliases=()):
+        """Adds or refreshes an entry. aliases are other names of the title (original, localized, alternate)."""
+        if not title or not tmdb_id:
+            return
+        key = (media_type, tmdb_id)
+        names = [normalize(title)] + [normalize(alias) for alias in aliases if alias]
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._unlink(key, previous)
+                # Keep what only the other source knew (e.g. posters from TMDB for a library title)
+                poster_path = poster_path or previous['poster_path']
+                overview = overview or previous['overview']
+                popularity = popularity or previous['popularity']
+                names += previous['names']
+                if previous['source'] in LIBRARY_SOURCES:
+                    source = previous['source']
+            entry = {'media_type': media_type, 'tmdb_id': tmdb_id, 'title': title, 'year': year or 0,
+                     'popularity': popularity or 0.0, 'poster_path': poster_path, 'overview': overview,
+                     'source': source, 'normalized': names[0], 'names': list(dict.fromkeys(name for name in names if name))}
+            self._entries[key] = entry
+            self._link(key, entry)
+            self._evict()
+
+    def _link(self, key, entry):
+        for word in {word for name in entry['names'] for word in name.split()}:
+            if word not in self._tokens:
+                self._tokens[word] = set()
+                self._dirty = True
+            self._tokens[word].add(key)
+        for name in entry['names']:
+            if name not in self._names:
+                self._names[name] = set()
+                grams = self._name_grams[name] = frozenset(trigrams(name))
+                for gram in grams:
+                    self._grams.setdefault(gram, set()).add(name)
+            self._names[name].add(key)
+
+    def _unlink(self, key, entry):
+        for word in {word for name in entry['names'] for word in name.split()}:
+            keys = self._tokens.get(word)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tokens[word]
+                    self._dirty = True
+        for name in entry['names']:
+            keys = self._names.get(name)
+            if keys is None:
+                continue
+            keys.discard(key)
+            if not keys:
+                del self._names[name]
+                for gram in self._name_grams.pop(name):
+                    holders = self._grams.get(gram)
+                    if holders is not None:
+                        holders.discard(name)
+                        if not holders:
+                            del self._grams[gram]
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, entry = self._entries.popitem(last=False)
+            self._unlink(key, entry)
+
+    def _keys_with_prefix(self, prefix):
+        start = bisect.bisect_left(self._sorted_tokens, prefix)
+        keys = set()
+        for word in self._sorted_tokens[start:]:
+            if not word.startswith(prefix):
+                break
+            keys |= self._tokens[word]
+        return keys
+
+    def search(self, query, limit=10, media_type=None):
+        """Returns up to `limit` entries whose words start with every word of the query, best first."""
+        words = normalize(query).split()
+        if not words:
+            return []
+        with self._lock:
+            if self._dirty:
+                self._sorted_tokens = sorted(self._tokens)
+                self._dirty = False
+            keys = None
+            for word in sorted(words, key=len, reverse=True):
+                matches = self._keys_with_prefix(word)
+                keys = matches if keys is None else keys & matches
+                if not keys:
+                    return []
+            entries = [dict(self._entries[key]) for key in keys if media_type is None or key[0] == media_type]
+
+        phrase = ' '.join(words)
+        def rank(entry):
+            return (
+                entry['normalized'] != phrase,
+                not entry['normalized'].startswith(phrase),
+                entry['source'] not in LIBRARY_SOURCES,
+                -entry['popularity'],
+                len(entry['normalized']),
+            )
+        return sorted(entries, key=rank)[:limit]
+
+    def fuzzy(self, query, year=None, media_type=None, limit=5, library_only=False,
+              min_score=MIN_FUZZY_SCORE, year_tolerance=YEAR_TOLERANCE):
+        """Returns up to `limit` (score, entry) pairs, most similar first; score is the trigram Dice coefficient (0..1).
+
+        Each entry is scored by its closest name. Entries whose year is known and further than
+        year_tolerance from `year` are left out.
+        """
+        normalized = normalize(query)
+        if not normalized:
+            return []
+        query_grams = trigrams(normalized)
+        # A name scoring min_score must share at least `needed` trigrams with the query, so it
+        # contains one of the query's (len - needed + 1) rarest trigrams: only those are scanned.
+        needed = max(1, math.ceil(min_score * len(query_grams) / (2 - min_score)))
+        with self._lock:
+            rarest = sorted(query_grams, key=lambda gram: len(self._grams.get(gram, ())))
+            candidates = set()
+            for gram in rarest[:len(query_grams) - needed + 1]:
+                candidates |= self._grams.get(gram, set())
+            best = {}
+            for name in candidates:
+                grams = self._name_grams[name]
+                score = 2.0 * len(query_grams & grams) / (len(query_grams) + len(grams))
+                if score < min_score:
+                    continue
+                for key in self._names[name]:
+                    if score > best.get(key, 0.0):
+                        best[key] = score
+            matches = []
+            for key, score in best.items():
+                entry = self._entries[key]
+                if media_type is not None and key[0] != media_type:
+                    continue
+                if library_only and entry['source'] not in LIBRARY_SOURCES:
+                    continue
+                if year and entry['year'] and abs(entry['year'] - year) > year_tolerance:
+                    continue
+                matches.append((score, dict(entry)))
+        matches.sort(key=lambda match: (-match[0], match[1]['source'] not in LIBRARY_SOURCES, -match[1]['popularity']))
+        return matches[:limit]
+
+    def export_entries(self):
+        """Every entry, least recently added first."""
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+_index = TitleIndex()
+
+
+def add(media_type, tmdb_id, title, **kwargs):
+    _index.add(media_type, tmdb_id, title, **kwargs)
+
+
+def search(query, limit=10, media_type=None):
+    return _index.search(query, limit, media_type)
+
+
+def fuzzy(query, year=None, media_type=None, limit=5, library_only=False):
+    return _index.fuzzy(query, year, media_type, limit, library_only)
+
+
+def confident_match(query, year=None, media_type=None):
+    """Returns the library entry the query almost certainly means, or None if no match is close and unambiguous enough."""
+    # Anything within the margin of a confident match scores at least this much
+    matches = _index.fuzzy(query, year, media_type, limit=2, library_only=True, min_score=CONFIDENT_SCORE - CONFIDENT_MARGIN)
+    if not matches or matches[0][0] < CONFIDENT_SCORE:
+        return None
+    runner_up = matches[1][0] if len(matches) > 1 else 0.0
+    # The only exact match wins even over near-identical names ("Rocky" vs "Rocky II")
+    if matches[0][0] - runner_up < CONFIDENT_MARGIN and not (matches[0][0] == 1.0 and runner_up < 1.0):
+        return None
+    return matches[0][1]
+
+
+def size():
+    return len(_index)
+
+
+def export_entries():
+    return _index.export_entries()
+
+
+def restore_entries(entries, saved_at=None):
+    """Adds entries saved by export_entries() (by an earlier process, see snapshot.py)."""
+    for entry in entries:
+        _index.add(entry['media_type'], entry['tmdb_id'], entry['title'], year=entry['year'], popularity=entry['popularity'],
+                   poster_path=entry['poster_path'], overview=entry['overview'], source=entry['source'], aliases=entry['names'][1:])
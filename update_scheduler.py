@@ -0,0 +1,180 @@
+# update_scheduler.py
+#
+# Inbound update scheduler. python-telegram-bot's Dispatcher handles updates
+# one at a time in arrival order, so a friend paging through results or a bulk
+# approval holds up the admin's /setup. The SchedulingDispatcher hands every
+# update to an UpdateScheduler instead: updates wait in one queue per user and a
+# few handler threads take the next one by priority class (approvals, other
+# admin interactions, interactive searches, background and bulk work), and
+# between users of the same class, whoever was served least recently goes
+# first. A user's own updates still run in arrival order, at most
+# `per_user_concurrency` at a time, so conversations are not reordered. The
+# time each update spent waiting is recorded per class for /stats.
+
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+
+from telegram.ext import Dispatcher
+
+import metrics
+import profiler
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SETTINGS = {
+    "handler_threads": 4,
+    "per_user_concurrency": 1,   # Updates of one user that may be handled at the same time
+}
+
+APPROVAL, ADMIN, INTERACTIVE, BULK = range(4)
+PRIORITY_NAMES = {APPROVAL: 'approval', ADMIN: 'admin', INTERACTIVE: 'interactive', BULK: 'bulk'}
+
+
+class _Job:
+    __slots__ = ('seq', 'priority', 'user_key', 'run', 'enqueued')
+
+    def __init__(self, seq, priority, user_key, run):
+        self.seq = seq
+        self.priority = priority
+        self.user_key = user_key
+        self.run = run
+        self.enqueued = time.monotonic()
+
+
+def _user_key(update):
+    """Whose queue an update goes to: its user, else its chat (channel posts), else a shared queue."""
+    user = getattr(update, 'effective_user', None)
+    if user is not None:
+        return user.id
+    chat = getattr(update, 'effective_chat', None)
+    return chat.id if chat is not None else None
+
+
+class UpdateScheduler:
+    """Priority classes first, then fair turns between users; per-user FIFO with a concurrency cap."""
+
+    def __init__(self, settings=None, priority_for_update=None):
+        self.settings = dict(DEFAULT_SETTINGS, **(settings or {}))
+        self.priority_for_update = priority_for_update or (lambda update: INTERACTIVE)
+        self._cond = threading.Condition()
+        self._queues = {}        # user key -> deque of _Job, oldest first
+        self._in_flight = {}     # user key -> number of its updates being handled
+        self._last_served = {}   # user key -> turn of its latest dispatch, while it has work
+        self._turns = itertools.count(1)
+        self._seq = itertools.count()
+        self._depth = 0
+        self._threads = []
+        self._stopped = False
+
+    def start(self):
+        for i in range(int(self.settings['handler_threads'])):
+            thread = threading.Thread(target=self._worker, name=f"update-handler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=10):
+        """Lets the handler threads finish what is queued, then stops them."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+
+    def queue_depth(self):
+        with self._cond:
+            return self._depth
+
+    def submit(self, update, run):
+        """Queues run() (which handles `update`) and returns right away."""
+        job = _Job(next(self._seq), self.priority_for_update(update), _user_key(update), run)
+        with self._cond:
+            queued = not self._stopped and bool(self._threads)
+            if queued:
+                self._queues.setdefault(job.user_key, deque()).append(job)
+                self._depth += 1
+                metrics.set_gauge("scheduler.queue_depth", self._depth)
+                self._cond.notify()
+        if not queued:
+            run()
+
+    def _pick(self):
+        """Takes the next job that may run now, or returns None."""
+        cap = int(self.settings['per_user_concurrency'])
+        best, best_rank = None, None
+        for user_key, jobs in self._queues.items():
+            if self._in_flight.get(user_key, 0) >= cap:
+                continue
+            head = jobs[0]
+            rank = (head.priority, self._last_served.get(user_key, 0), head.seq)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = head, rank
+        if best is None:
+            return None
+        jobs = self._queues[best.user_key]
+        jobs.popleft()
+        if not jobs:
+            del self._queues[best.user_key]
+        self._in_flight[best.user_key] = self._in_flight.get(best.user_key, 0) + 1
+        self._last_served[best.user_key] = next(self._turns)
+        self._depth -= 1
+        metrics.set_gauge("scheduler.queue_depth", self._depth)
+        return best
+
+    def _finish(self, job):
+        with self._cond:
+            self._in_flight[job.user_key] -= 1
+            if not self._in_flight[job.user_key]:
+                del self._in_flight[job.user_key]
+                if job.user_key not in self._queues:
+                    # An idle user starts over instead of carrying an old turn around
+                    self._last_served.pop(job.user_key, None)
+            self._cond.notify_all()
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while True:
+                    job = self._pick()
+                    if job is not None:
+                        break
+                    if self._stopped and not self._queues:
+                        return
+                    self._cond.wait()
+            metrics.observe(f"scheduler.wait.{PRIORITY_NAMES.get(job.priority, job.priority)}", time.monotonic() - job.enqueued)
+            try:
+                job.run()
+            except Exception:
+                logger.exception("Unhandled error while handling an update.")
+            finally:
+                self._finish(job)
+
+
+class SchedulingDispatcher(Dispatcher):
+    """Dispatcher whose updates are handled on an UpdateScheduler's threads instead of its own."""
+
+    def __init__(self, *args, scheduler=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler
+
+    def process_update(self, update):
+        if self.scheduler is None:
+            self.handle_update(update)
+            return
+        self.scheduler.submit(update, lambda: self.handle_update(update))
+
+    def handle_update(self, update):
+        """Runs the handlers for one update in the calling thread (Dispatcher.process_update)."""
+        with profiler.profile_update():
+            super().process_update(update)
+
+    def stop(self):
+        # Queued updates are handled before the run_async workers go away; anything arriving
+        # meanwhile is handled right in the dispatcher thread
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        super().stop()